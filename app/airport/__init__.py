@@ -0,0 +1 @@
+default_app_config = 'airport.apps.AirportConfig'
@@ -1,37 +1,34 @@
-from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin import sites
 from django.views.decorators.cache import never_cache
 
-from airport.models import Aircraft, StateChangeLog
+from airport.admission import invalidate_airport_state
+from airport.models import Aircraft, Airport, AirportResources, RunwaySlot, SeparationAlert, StateChangeLog
 
 from weather.models import WeatherData
-from weather.tasks import load_weather_data
+from weather.tasks import is_stale, request_refresh
 
 
 class AirportAdminSite(sites.AdminSite):
 
     @never_cache
     def index(self, request, extra_context=None):
-        parked_large_count = Aircraft.objects.filter(
-            type='AIRLINER',
-            state='PARKED'
-        ).count()
-        parked_small_count = Aircraft.objects.filter(
-            type='PRIVATE',
-            state='PARKED'
-        ).count()
-
-        taken_small_percent = round((parked_small_count / settings.AIRPORT_SMALL_PARKING_SPOTS) * 100)
-        taken_large_percent = round((parked_large_count / settings.AIRPORT_LARGE_PARKING_SPOTS) * 100)
+        resources = AirportResources.current()
+        parked_large_count = resources.parked_airliners
+        parked_small_count = resources.parked_private
+        large_parking_spots = resources.capacity('large_parking_spots')
+        small_parking_spots = resources.capacity('small_parking_spots')
+
+        taken_small_percent = round((parked_small_count / small_parking_spots) * 100) if small_parking_spots else 100
+        taken_large_percent = round((parked_large_count / large_parking_spots) * 100) if large_parking_spots else 100
 
         weather_data = WeatherData.objects.first()
-        if not weather_data:
-            load_weather_data.delay()
+        if not weather_data or is_stale(weather_data.last_update):
+            request_refresh()
 
         extra_context = {
-            'LARGE_PARKING_SPOTS': settings.AIRPORT_LARGE_PARKING_SPOTS,
-            'SMALL_PARKING_SPOTS': settings.AIRPORT_SMALL_PARKING_SPOTS,
+            'LARGE_PARKING_SPOTS': large_parking_spots,
+            'SMALL_PARKING_SPOTS': small_parking_spots,
             'parked_large_count': parked_large_count,
             'parked_small_count': parked_small_count,
             'taken_small_percent': taken_small_percent,
@@ -57,10 +54,36 @@ class ReadOnlyModelAdmin(admin.ModelAdmin):
 
 class StateChangeLogAdmin(ReadOnlyModelAdmin):
     list_display = ('aircraft', 'from_state', 'to_state', 'outcome', 'description', 'time')
+    list_select_related = ('aircraft',)
 
 
 class AircraftAdmin(ReadOnlyModelAdmin):
-    list_display = ('call_sign', 'type', 'state', 'longitude', 'latitude', 'altitude', 'heading')
+    list_display = ('call_sign', 'airport', 'type', 'state', 'longitude', 'latitude', 'altitude', 'heading')
+
+
+class RunwaySlotAdmin(ReadOnlyModelAdmin):
+    list_display = ('aircraft', 'airport', 'to_state', 'requested')
+    list_select_related = ('aircraft',)
+    ordering = ('id',)
+
+
+class AirportAdmin(admin.ModelAdmin):
+    list_display = ('location', 'runways', 'large_parking_spots', 'small_parking_spots')
+
+    # Intent backends keep capacities until they reload airport state
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_airport_state(obj.location)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_airport_state(obj.location)
+
+
+class SeparationAlertAdmin(ReadOnlyModelAdmin):
+    list_display = ('aircraft', 'other', 'horizontal_distance', 'vertical_distance',
+                    'started', 'last_seen', 'resolved')
+    list_select_related = ('aircraft', 'other')
 
 
 admin_site = AirportAdminSite()
@@ -68,7 +91,10 @@ admin_site.site_header = "Airport Administration"
 admin_site.index_title = "Dashboard"
 
 admin_site.register(Aircraft, AircraftAdmin)
+admin_site.register(Airport, AirportAdmin)
 admin_site.register(StateChangeLog, StateChangeLogAdmin)
+admin_site.register(SeparationAlert, SeparationAlertAdmin)
+admin_site.register(RunwaySlot, RunwaySlotAdmin)
 
 admin.site = admin_site
 sites.site = admin_site
@@ -0,0 +1,446 @@
+"""
+Redis admission of intents.
+
+With `AIRPORT_INTENT_BACKEND = 'redis'` all processes share airport state
+in Redis: a hash `call_sign -> id|type|state|airport` and a hash of
+occupancy counters and capacities per airport. Intent is validated and
+admitted by a single Lua script, which runs atomically in Redis, so
+processes and nodes don't wait for each other on the airport resources row
+lock while validating.
+
+Admitted changes are written to the database afterwards with the same
+guarded write as the in-memory engine (`airport.engine.write_change`).
+The write still moves counters on the resources row of the airport, which
+guards capacity against writers outside of admission (ground crew, runway
+queue, admin), so state changes of an airport serialize on that row for
+the duration of the write. Batching the writes is not done yet.
+When the database doesn't match Redis, state of the airport in Redis is
+refreshed from the database and the intent is admitted again. Changes made
+outside of admission (ground crew, runway queue, admin) mark their airport
+stale, which is refreshed the same way by the next intent at that airport.
+Redis state also expires after `AIRPORT_ENGINE_RECONCILE_INTERVAL` seconds
+to pick up new airports, and is then reloaded as a whole.
+
+Only one process reloads or refreshes the same state at a time, others
+wait for it under a short `SET NX PX` lock and admit on the state it
+loaded, so expired state doesn't make every process read all aircraft.
+"""
+import json
+import threading
+import time
+import uuid
+
+import redis
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.exceptions import ValidationError
+
+from airport.engine import (
+    MAX_ATTEMPTS, Change, StaleState, call_signs_by_airport, get_state_engine, load_airport_state, write_change
+)
+from airport.exceptions import RunwayOccupied, StateConflict
+from airport.models import CAPACITY_SETTINGS, Aircraft, Airport, AirportStateEpoch, default_airport
+from airport.serializers import POSITION_FIELDS, STATE_FLOW, get_setting
+
+ADMIT_SCRIPT = """
+local aircraft_key, loaded_key, counters_key = KEYS[1], KEYS[2], KEYS[3]
+local stale_key, members_key = KEYS[4], KEYS[5]
+local call_sign, to_state, new_type, airport = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local flow = cjson.decode(ARGV[5])
+
+if redis.call('EXISTS', loaded_key) == 0 then
+    return {'RELOAD'}
+end
+
+local id, aircraft_type, state, aircraft_airport = '', new_type, '', airport
+local entry = redis.call('HGET', aircraft_key, call_sign)
+if entry then
+    id, aircraft_type, state, aircraft_airport = string.match(entry, '^([^|]*)|([^|]*)|([^|]*)|(.*)$')
+    if aircraft_airport ~= airport then
+        return {'AIRPORT', aircraft_airport}
+    end
+elseif new_type == '' then
+    return {'INVALID'}
+end
+
+if redis.call('SISMEMBER', stale_key, airport) == 1 then
+    return {'REFRESH'}
+end
+
+if redis.call('EXISTS', counters_key) == 0 then
+    return {'UNKNOWN_AIRPORT'}
+end
+
+local function count(counter)
+    return tonumber(redis.call('HGET', counters_key, counter) or '0')
+end
+
+local runways = count('runways')
+local large_spots, small_spots = count('large_parking_spots'), count('small_parking_spots')
+
+local function resource(resource_state)
+    if resource_state == 'TAKE_OFF' or resource_state == 'LANDED' then
+        return 'runways_in_use'
+    elseif resource_state == 'APPROACH' then
+        return 'on_approach'
+    elseif resource_state == 'PARKED' then
+        if aircraft_type == 'AIRLINER' then
+            return 'parked_airliners'
+        end
+        return 'parked_private'
+    end
+    return nil
+end
+
+if entry then
+    local allowed = flow[state] or {}
+    local valid = false
+    for _, next_state in ipairs(allowed) do
+        if next_state == to_state then
+            valid = true
+        end
+    end
+    if not valid then
+        return {'CONFLICT', id, aircraft_type, state, 'Not a valid state change'}
+    end
+end
+
+if (to_state == 'TAKE_OFF' or to_state == 'LANDED') and count('runways_in_use') > runways - 1 then
+    return {'CONFLICT', id, aircraft_type, state, 'The runway is occupied'}
+end
+
+if to_state == 'APPROACH' and count('on_approach') > 0 then
+    return {'CONFLICT', id, aircraft_type, state, 'Other aircraft is on approach'}
+end
+
+local parking, spots = 'parked_private', small_spots
+if aircraft_type == 'AIRLINER' then
+    parking, spots = 'parked_airliners', large_spots
+end
+if count(parking) >= spots then
+    return {'CONFLICT', id, aircraft_type, state, 'No free parking spot'}
+end
+
+local released = entry and resource(state)
+local occupied = resource(to_state)
+if released then
+    redis.call('HINCRBY', counters_key, released, -1)
+end
+if occupied then
+    redis.call('HINCRBY', counters_key, occupied, 1)
+end
+redis.call('HSET', aircraft_key, call_sign, id .. '|' .. aircraft_type .. '|' .. to_state .. '|' .. airport)
+if not entry then
+    redis.call('SADD', members_key, call_sign)
+end
+
+return {'OK', id, aircraft_type, state}
+"""
+
+# Sets id of admitted new aircraft once it is written to the database
+SET_ID_SCRIPT = """
+local entry = redis.call('HGET', KEYS[1], ARGV[1])
+if entry and string.sub(entry, 1, 1) == '|' then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2] .. entry)
+end
+"""
+
+# Releases reload lock only if it is still held by the caller
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Seconds between checks of a reload lock held by another process
+RELOAD_POLL_INTERVAL = 0.02
+
+
+def aircraft_entry(pk, aircraft_type, state, location):
+    return f'{pk}|{aircraft_type}|{state}|{location}'
+
+
+class RedisAdmission:
+
+    def __init__(self, url, prefix=None, reconcile_interval=None):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix or get_setting('AIRPORT_ADMISSION_KEY_PREFIX', 'airport')
+        self.aircraft_key = f'{self.prefix}:aircraft'
+        self.loaded_key = f'{self.prefix}:loaded'
+        self.stale_key = f'{self.prefix}:stale'
+        self.reconcile_interval = get_setting('AIRPORT_ENGINE_RECONCILE_INTERVAL', 60) \
+            if reconcile_interval is None else reconcile_interval
+        self.reload_timeout = get_setting('AIRPORT_ADMISSION_RELOAD_TIMEOUT', 10)
+        self.admit_script = self.client.register_script(ADMIT_SCRIPT)
+        self.set_id_script = self.client.register_script(SET_ID_SCRIPT)
+        self.release_script = self.client.register_script(RELEASE_SCRIPT)
+        self.state_flow = json.dumps(STATE_FLOW)
+
+    def counters_key(self, location):
+        return f'{self.prefix}:counters:{location}'
+
+    def members_key(self, location):
+        """ Set of call signs of aircraft of the airport."""
+
+        return f'{self.prefix}:members:{location}'
+
+    def reload_key(self, location=None):
+        if location is None:
+            return f'{self.prefix}:reloading'
+        return f'{self.prefix}:reloading:{location}'
+
+    def counters_mapping(self, location, counters, capacities):
+        mapping = dict.fromkeys(CAPACITY_SETTINGS, 0)
+        mapping.update(capacities.get(location, {}))
+        mapping.update(counters.get(location, {}))
+        return mapping
+
+    def reconcile(self):
+        """ Replaces airport state in Redis with the one in the database."""
+
+        # airports invalidated during the load stay stale
+        stale = self.client.smembers(self.stale_key)
+        aircraft, counters = load_airport_state()
+        capacities = Airport.capacities()
+
+        stale_keys = list(self.client.scan_iter(match=self.counters_key('*')))
+        stale_keys += list(self.client.scan_iter(match=self.members_key('*')))
+
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.delete(self.aircraft_key, *stale_keys)
+        if stale:
+            pipeline.srem(self.stale_key, *stale)
+        if aircraft:
+            pipeline.hset(self.aircraft_key, mapping={
+                call_sign: aircraft_entry(*entry) for call_sign, entry in aircraft.items()
+            })
+        for location, call_signs in call_signs_by_airport(aircraft).items():
+            pipeline.sadd(self.members_key(location), *call_signs)
+        for location in set(counters) | set(capacities):
+            pipeline.hset(self.counters_key(location), mapping=self.counters_mapping(location, counters, capacities))
+        if self.reconcile_interval:
+            pipeline.set(self.loaded_key, 1, ex=self.reconcile_interval)
+        else:
+            pipeline.set(self.loaded_key, 1)
+        pipeline.execute()
+
+    def reconcile_airport(self, location):
+        """ Replaces state of the airport at `location` in Redis with the one
+        in the database, state of other airports is kept."""
+
+        self.client.srem(self.stale_key, location)
+        try:
+            aircraft, counters = load_airport_state([location])
+            capacities = Airport.capacities()
+        except Exception:
+            self.client.sadd(self.stale_key, location)
+            raise
+
+        members_key = self.members_key(location)
+
+        def replace(pipeline):
+            # retried when an aircraft is admitted to the airport meanwhile
+            removed = {call_sign.decode() for call_sign in pipeline.smembers(members_key)} - set(aircraft)
+
+            pipeline.multi()
+            pipeline.delete(members_key)
+            if removed:
+                pipeline.hdel(self.aircraft_key, *removed)
+            if aircraft:
+                pipeline.hset(self.aircraft_key, mapping={
+                    call_sign: aircraft_entry(*entry) for call_sign, entry in aircraft.items()
+                })
+                pipeline.sadd(members_key, *aircraft)
+            if aircraft or location in capacities:
+                pipeline.hset(self.counters_key(location),
+                              mapping=self.counters_mapping(location, counters, capacities))
+            else:
+                pipeline.delete(self.counters_key(location))
+
+        self.client.transaction(replace, members_key)
+
+    def reload(self, location=None):
+        """
+        Reloads state of the airport at `location`, or all state, in a
+        single process. Other processes wait until it is loaded, or until
+        the lock expires when the loading process died, and then admit on
+        the state in Redis.
+        """
+
+        key = self.reload_key(location)
+        token = uuid.uuid4().hex
+
+        if self.client.set(key, token, nx=True, px=int(self.reload_timeout * 1000)):
+            try:
+                if location is None:
+                    self.reconcile()
+                else:
+                    self.reconcile_airport(location)
+            finally:
+                self.release_script(keys=[key], args=[token])
+            return
+
+        deadline = time.monotonic() + self.reload_timeout
+        while self.client.exists(key) and time.monotonic() < deadline:
+            time.sleep(RELOAD_POLL_INTERVAL)
+
+    def invalidate(self, location=None):
+        """ Makes the next admission at the airport at `location`, or at any
+        airport, reload state from the database."""
+
+        if location is None:
+            self.client.delete(self.loaded_key)
+        else:
+            self.client.sadd(self.stale_key, location)
+
+    def admit(self, call_sign, to_state, new_type, location):
+        return [
+            value.decode() if isinstance(value, bytes) else value
+            for value in self.admit_script(
+                keys=[self.aircraft_key, self.loaded_key, self.counters_key(location),
+                      self.stale_key, self.members_key(location)],
+                args=[
+                    call_sign,
+                    to_state,
+                    new_type or '',
+                    location,
+                    self.state_flow,
+                ]
+            )
+        ]
+
+    def submit_intent(self, data, log_from_state='', airport=None):
+        """
+        Admits intent validated by AircraftSerializer fields and writes it
+        to the database. `airport` is the airport sent with the intent, new
+        aircraft without it join the default airport. Raises
+        `StateConflict` or `ValidationError` when intent is rejected.
+        Returns written `Aircraft`.
+        """
+
+        location = airport or default_airport()
+        reloaded = False
+
+        for _ in range(MAX_ATTEMPTS):
+            result = self.admit(data['call_sign'], data['state'], data.get('type', None), location)
+
+            if result[0] == 'AIRPORT':
+                # existing aircraft is admitted at its own airport
+                if airport:
+                    raise ValidationError({'airport': 'Aircraft belongs to another airport'})
+                location = result[1]
+                result = self.admit(data['call_sign'], data['state'], data.get('type', None), location)
+
+            if result[0] == 'UNKNOWN_AIRPORT':
+                # airport might have been added since the last reload
+                if reloaded or not Airport.exists(location):
+                    raise ValidationError({'airport': 'Unknown airport'})
+                result = ['RELOAD']
+
+            if result[0] == 'RELOAD':
+                self.reload()
+                reloaded = True
+                continue
+
+            if result[0] == 'REFRESH':
+                self.reload(location)
+                continue
+
+            if result[0] == 'INVALID':
+                raise ValidationError()
+
+            outcome, pk, aircraft_type, from_state = result[:4]
+            aircraft = Aircraft(pk=int(pk), call_sign=data['call_sign'], type=aircraft_type,
+                                state=from_state, airport=location) if pk else None
+
+            if outcome == 'CONFLICT':
+                conflict = RunwayOccupied if result[4] == RunwayOccupied.DESCRIPTION else StateConflict
+                raise conflict(
+                    aircraft=aircraft,
+                    from_state=from_state,
+                    to_state=data['state'],
+                    description=result[4]
+                )
+
+            change = Change(
+                aircraft_id=aircraft.pk if aircraft else None,
+                call_sign=data['call_sign'],
+                type=aircraft_type,
+                airport=location,
+                from_state=from_state if aircraft else None,
+                to_state=data['state'],
+                log_from_state=None if aircraft else log_from_state,
+                position={} if aircraft else {field: data[field] for field in POSITION_FIELDS if field in data}
+            )
+
+            # new aircraft might have been created at another airport
+            stale = location if aircraft else None
+            try:
+                written = write_change(change)
+            except StaleState:
+                self.invalidate(stale)
+                self.reload(stale)
+                continue
+            except Exception:
+                self.invalidate(stale)
+                raise
+
+            if aircraft is None:
+                self.set_id_script(keys=[self.aircraft_key], args=[data['call_sign'], written.pk])
+
+            return written
+
+        raise StateConflict(
+            aircraft=None,
+            from_state='',
+            to_state=data['state'],
+            description='Airport state changed concurrently'
+        )
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_redis_admission():
+    """ Returns process-wide Redis admission when `AIRPORT_INTENT_BACKEND`
+    is 'redis', otherwise None."""
+
+    global _admission
+
+    if get_setting('AIRPORT_INTENT_BACKEND', 'database') != 'redis':
+        return None
+
+    with _admission_lock:
+        if _admission is None:
+            url = get_setting('AIRPORT_ADMISSION_REDIS_URL', None) or getattr(settings, 'CELERY_BROKER_URL', None)
+            if not url:
+                raise ImproperlyConfigured('AIRPORT_ADMISSION_REDIS_URL is required for redis intent backend')
+            _admission = RedisAdmission(url)
+
+    return _admission
+
+
+def reset_redis_admission():
+    global _admission
+
+    with _admission_lock:
+        _admission = None
+
+
+def invalidate_airport_state(location=None):
+    """ Makes active intent backend reload state of the airport at
+    `location`, or of all airports, from the database, to be called after
+    aircraft were changed outside of it. Engines of other processes reload
+    once the change is committed."""
+
+    engine = get_state_engine()
+    if engine is not None:
+        engine.invalidate(location)
+        AirportStateEpoch.bump_on_commit(location)
+
+    admission = get_redis_admission()
+    if admission is not None:
+        admission.invalidate(location)
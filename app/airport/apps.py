@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AirportConfig(AppConfig):
     name = 'airport'
+
+    def ready(self):
+        import airport.signals  # noqa: F401
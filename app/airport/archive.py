@@ -0,0 +1,415 @@
+"""
+Archive of state change logs in compressed, append-only files.
+
+Logs are written as gzip compressed JSON lines, one file per UTC day:
+
+    <AIRPORT_LOG_ARCHIVE_DIR>/2026/10/state_logs-2026-10-18.jsonl.gz
+
+Every export appends a new gzip member to the file, which gzip readers
+treat as one continuous stream. Records carry aircraft call sign next to
+its id, so archived logs stay readable after aircraft are removed.
+
+Next to every file an index (`.idx`) lists for each member the size of
+the file with it and ids of the logs in it. A member is listed only once
+it was fsynced, so a crash in the middle of an export leaves a tail which
+isn't listed: readers stop before it and the next export cuts it off.
+Logs whose ids the index already holds are skipped, so exporting a range
+again doesn't duplicate them. Exported logs are deleted only after the
+index lists them.
+
+Both export and read are streamed: rows are fetched with a server-side
+cursor and files are read line by line, so memory use doesn't depend on
+size of the archive, only ids of logs of the day being written are kept.
+"""
+import glob
+import gzip
+import io
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from airport.models import Aircraft, StateChangeLog
+from airport.serializers import get_setting
+
+FIELDS = ('id', 'aircraft_id', 'call_sign', 'from_state', 'to_state', 'outcome', 'description', 'time')
+FILE_PATTERN = 'state_logs-%Y-%m-%d.jsonl.gz'
+INDEX_SUFFIX = '.idx'
+
+
+def get_archive_dir():
+    return get_setting('AIRPORT_LOG_ARCHIVE_DIR', '/var/lib/airport/archive')
+
+
+def parse_time(value):
+    """ Parses date or datetime given on command line, naive values are UTC."""
+
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date {value!r}')
+        moment = datetime.combine(day, datetime.min.time())
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.utc)
+
+    return moment
+
+
+def archive_path(directory, day):
+    return os.path.join(directory, day.strftime('%Y'), day.strftime('%m'), day.strftime(FILE_PATTERN))
+
+
+def archive_day(path):
+    try:
+        return datetime.strptime(os.path.basename(path), FILE_PATTERN).date()
+    except ValueError:
+        return None
+
+
+def read_ids(path):
+    """ Returns ids of records in the archive file."""
+
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            return {json.loads(line)['id'] for line in archive if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def read_index(path):
+    """ Returns size of the archive file holding all its listed members, ids
+    of their records and length of the complete part of the index, or None
+    when the file has no index."""
+
+    size, ids, length = 0, set(), 0
+
+    try:
+        with open(path + INDEX_SUFFIX, 'rb') as index:
+            for line in index:
+                if not line.endswith(b'\n'):
+                    # written only partly before a crash
+                    break
+                entry = json.loads(line)
+                size = entry['size']
+                ids.update(entry['ids'])
+                length += len(line)
+    except FileNotFoundError:
+        return None
+
+    return size, ids, length
+
+
+class CommittedPart(io.RawIOBase):
+    """ Reads the file only up to the given size."""
+
+    def __init__(self, file, size):
+        self.file = file
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@contextmanager
+def open_archive(path):
+    """ Opens the archive file for reading its listed members as text."""
+
+    with open(path, 'rb') as raw:
+        index = read_index(path)
+        if index is not None:
+            raw = io.BufferedReader(CommittedPart(raw, index[0]))
+
+        with gzip.open(raw, 'rt', encoding='utf-8') as archive:
+            yield archive
+
+
+def fsync_dir(directory):
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class ArchiveWriter:
+    """ Appends records to daily files. Records should come ordered by time,
+    so only one file is written at a time. Ids of records which are safely
+    on disk, including ones which were archived before, are collected in
+    `archived` until taken by `take_archived()`."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.day = None
+        self.path = None
+        self.raw = None
+        self.file = None
+        self.index = None
+        self.size = 0
+        self.existing = set()
+        self.written = []
+        self.pending = []
+        self.archived = []
+        self.counts = {}
+
+    def write(self, record):
+        day = record['time'].astimezone(timezone.utc).date()
+
+        if day != self.day:
+            self.close()
+            self.open(day)
+
+        self.pending.append(record['id'])
+        if record['id'] in self.existing:
+            return
+
+        if self.file is None:
+            self.start_member()
+
+        self.file.write(json.dumps(dict(record, time=record['time'].isoformat())) + '\n')
+        self.written.append(record['id'])
+        self.counts[self.day] = self.counts.get(self.day, 0) + 1
+
+    def open(self, day):
+        self.day = day
+        self.path = archive_path(self.directory, day)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self.index = read_index(self.path)
+        if self.index is None:
+            # new file, or one written before files were indexed
+            self.existing = read_ids(self.path)
+            self.size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        else:
+            self.size, self.existing, _ = self.index
+
+        self.raw = open(self.path, 'ab')
+        # cuts off a member which isn't listed in the index
+        self.raw.truncate(self.size)
+
+    def start_member(self):
+        with open(self.path + INDEX_SUFFIX, 'ab') as index:
+            if self.index is None:
+                index.write(self.index_entry(sorted(self.existing)))
+            else:
+                # cuts off an entry which was written only partly
+                index.truncate(self.index[2])
+            index.flush()
+            os.fsync(index.fileno())
+
+        # closing the gzip member leaves the day file open
+        self.file = gzip.open(self.raw, 'at', encoding='utf-8')
+
+    def index_entry(self, ids):
+        return json.dumps({'size': self.size, 'ids': ids}).encode() + b'\n'
+
+    def take_archived(self):
+        archived, self.archived = self.archived, []
+        return archived
+
+    def close(self):
+        """ Lists the member written to the current day file in its index."""
+
+        if self.raw is None:
+            return
+
+        if self.file is not None:
+            self.file.close()
+            self.raw.flush()
+            os.fsync(self.raw.fileno())
+            self.size = os.fstat(self.raw.fileno()).st_size
+
+            with open(self.path + INDEX_SUFFIX, 'ab') as index:
+                index.write(self.index_entry(self.written))
+                index.flush()
+                os.fsync(index.fileno())
+            fsync_dir(os.path.dirname(self.path))
+        self.raw.close()
+
+        self.archived.extend(self.pending)
+        self.reset()
+
+    def discard(self):
+        """ Cuts off the member of the current day file which wasn't written
+        completely."""
+
+        if self.raw is None:
+            return
+
+        self.raw.truncate(self.size)
+        self.raw.close()
+        self.reset()
+
+    def reset(self):
+        self.pending = []
+        self.written = []
+        self.existing = set()
+        self.file = self.raw = self.index = None
+        self.day = self.path = None
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def iter_chunks(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_logs(directory, start=None, end=None, chunk_size=2000, delete=False):
+    """ Exports logs with `start <= time < end` ordered by time. With
+    `delete` exported logs are removed from the table after every written
+    chunk. Returns number of exported logs per day."""
+
+    logs = StateChangeLog.objects.order_by('time', 'id')
+    if start is not None:
+        logs = logs.filter(time__gte=start)
+    if end is not None:
+        logs = logs.filter(time__lt=end)
+
+    rows = logs.values(
+        'id', 'aircraft_id', 'from_state', 'to_state', 'outcome', 'description', 'time',
+        call_sign=F('aircraft__call_sign')
+    ).iterator(chunk_size=chunk_size)
+
+    # Only PostgreSQL reads rows through a server-side cursor which isn't
+    # affected by deletes, elsewhere rows are deleted after export.
+    delete_per_chunk = connection.vendor == 'postgresql'
+
+    with ArchiveWriter(directory) as writer:
+        for chunk in iter_chunks(rows, chunk_size):
+            for row in chunk:
+                writer.write({field: row[field] for field in FIELDS})
+
+            # logs listed in indexes of closed files are safe to delete
+            if delete and delete_per_chunk:
+                for ids in iter_chunks(writer.take_archived(), chunk_size):
+                    StateChangeLog.objects.filter(pk__in=ids).delete()
+
+    exported_ids = writer.take_archived()
+    if delete:
+        for ids in iter_chunks(exported_ids, chunk_size):
+            StateChangeLog.objects.filter(pk__in=ids).delete()
+
+    return writer.counts
+
+
+def export_table(directory, table, chunk_size=2000):
+    """ Exports logs from a detached log partition, see `airport.partitions`.
+    Returns number of exported logs per day."""
+
+    qn = connection.ops.quote_name
+    columns = ', '.join(f'l.{qn(field)}' for field in FIELDS if field != 'call_sign')
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT {columns}, a.call_sign FROM {qn(table)} l
+            LEFT JOIN airport_aircraft a ON a.id = l.aircraft_id
+            ORDER BY l.time, l.id
+            """
+        )
+        names = [field for field in FIELDS if field != 'call_sign'] + ['call_sign']
+
+        with ArchiveWriter(directory) as writer:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    record = dict(zip(names, row))
+                    writer.write({field: record[field] for field in FIELDS})
+
+    return writer.counts
+
+
+def archive_files(directory, start=None, end=None):
+    """ Returns archive files which may hold logs with `start <= time < end`
+    ordered by day."""
+
+    paths = glob.glob(os.path.join(directory, '*', '*', '*.jsonl.gz'))
+    files = []
+
+    for path in paths:
+        day = archive_day(path)
+        if day is None:
+            continue
+        if start is not None and day < start.astimezone(timezone.utc).date():
+            continue
+        if end is not None and day > (end - timedelta(microseconds=1)).astimezone(timezone.utc).date():
+            continue
+        files.append((day, path))
+
+    return [path for _, path in sorted(files)]
+
+
+def read_archive(directory, start=None, end=None, call_sign=None):
+    """ Yields archived records with `start <= time < end` one by one."""
+
+    for path in archive_files(directory, start, end):
+        with open_archive(path) as archive:
+            for line in archive:
+                if not line.strip():
+                    continue
+
+                record = json.loads(line)
+                record['time'] = parse_datetime(record['time'])
+
+                if start is not None and record['time'] < start:
+                    continue
+                if end is not None and record['time'] >= end:
+                    continue
+                if call_sign is not None and record['call_sign'] != call_sign:
+                    continue
+
+                yield record
+
+
+def import_records(records, chunk_size=2000):
+    """ Inserts archived records back into the log table. Records keep their
+    ids and inserting a record which is already in the table does nothing.
+    Records of aircraft which don't exist anymore can't be imported.
+    Returns numbers of inserted and skipped records."""
+
+    imported = skipped = 0
+
+    for chunk in iter_chunks(records, chunk_size):
+        existing = set(Aircraft.objects.filter(
+            pk__in={record['aircraft_id'] for record in chunk}
+        ).values_list('pk', flat=True))
+
+        logs = [
+            StateChangeLog(**{field: record[field] for field in FIELDS if field != 'call_sign'})
+            for record in chunk if record['aircraft_id'] in existing
+        ]
+        StateChangeLog.objects.bulk_create(logs, ignore_conflicts=True)
+
+        imported += len(logs)
+        skipped += len(chunk) - len(logs)
+
+    return imported, skipped
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+TOKEN_SALT = 'airport.authentication.AircraftToken'
+
+
+class AircraftToken:
+    """Short-lived session token issued to an aircraft after the public key
+    handshake."""
+
+    def __init__(self, call_sign):
+        self.call_sign = call_sign
+
+    def __str__(self):
+        return self.call_sign
+
+
+def get_token_max_age():
+    return getattr(settings, 'AIRPORT_TOKEN_MAX_AGE', 300)
+
+
+def issue_token(call_sign):
+    """ Returns HMAC signed, timestamped token bound to given call sign."""
+
+    return signing.dumps({'call_sign': call_sign}, salt=TOKEN_SALT, compress=False)
+
+
+def verify_token(token):
+    """ Returns AircraftToken if token signature is valid and not expired,
+    otherwise None. Signature is compared in constant time."""
+
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT, max_age=get_token_max_age())
+    except signing.BadSignature:
+        return None
+
+    call_sign = payload.get('call_sign') if isinstance(payload, dict) else None
+
+    if not call_sign:
+        return None
+
+    return AircraftToken(call_sign)
+
+
+class AircraftTokenAuthentication(BaseAuthentication):
+    """Authenticates requests carrying `Authorization: Token <token>` header
+    issued by the handshake endpoint. No RSA work is done per request."""
+
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+
+        if len(auth) != 2:
+            raise AuthenticationFailed()
+
+        try:
+            token = auth[1].decode()
+        except UnicodeError:
+            raise AuthenticationFailed()
+
+        aircraft_token = verify_token(token)
+
+        if aircraft_token is None:
+            raise AuthenticationFailed()
+
+        return (AnonymousUser(), aircraft_token)
+
+    def authenticate_header(self, request):
+        return self.keyword
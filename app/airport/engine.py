@@ -0,0 +1,438 @@
+"""
+In-memory airport state engine.
+
+With `AIRPORT_INTENT_BACKEND = 'memory'` intents are validated against
+state of all aircraft and occupancy counters kept in process memory,
+instead of reading aircraft and locking airport resources row in the
+database. Accepted changes are written through to `Aircraft`,
+`AirportResources` and `StateChangeLog`.
+
+Occupancy counters are kept per airport, the airport of an aircraft
+never changes.
+
+The database stays the final authority, so several processes can run
+their own engines: aircraft state is changed only if it is still the one
+the engine validated against and claimed resource counter must stay within
+capacity after the change. When a write finds the database differs, the
+engine reloads its state from the database and validates the intent again.
+Changes made outside of intent backends (ground crew, runway queue, admin)
+bump `AirportStateEpoch` of their airport. Engines read epochs of all
+airports at most every `AIRPORT_ENGINE_EPOCH_INTERVAL` seconds and reload
+only the airports whose epoch grew, so engines of all processes catch up
+shortly after such changes instead of rejecting intents against stale
+state. The engine also reloads all airports every
+`AIRPORT_ENGINE_RECONCILE_INTERVAL` seconds to pick up intents accepted by
+other processes.
+
+Reloads read the database outside of the engine lock and only swap the
+new state in under it, so intents of other threads keep being validated
+meanwhile. One thread reloads at a time.
+"""
+import threading
+import time
+
+from django.db import IntegrityError, transaction
+
+from airport.exceptions import StateConflict
+from airport.logwriter import write_state_log
+from airport.models import (
+    CAPACITY_SETTINGS, Aircraft, Airport, AirportResources, AirportStateEpoch, default_airport, occupied_resource
+)
+from airport.serializers import POSITION_FIELDS, get_setting
+
+MAX_ATTEMPTS = 3
+
+
+class StaleState(Exception):
+    """ Database doesn't match state the change was validated against."""
+
+
+def capacity(resources, counter):
+    """ Returns capacity of the airport for given occupancy counter."""
+
+    if counter == 'runways_in_use':
+        return resources.capacity('runways')
+    if counter == 'on_approach':
+        return 1
+    if counter == 'parked_airliners':
+        return resources.capacity('large_parking_spots')
+    return resources.capacity('small_parking_spots')
+
+
+def load_airport_state(locations=None):
+    """ Returns `call_sign -> (id, type, state, airport)` of all aircraft
+    and `location -> counters` of all airports, or only of the airports at
+    `locations`. Counters stored in `AirportResources` are rebuilt when
+    they don't match aircraft."""
+
+    rows = Aircraft.objects.values_list('call_sign', 'id', 'type', 'state', 'airport')
+    stored = AirportResources.objects.all()
+    if locations is not None:
+        rows = rows.filter(airport__in=locations)
+        stored = stored.filter(location__in=locations)
+
+    aircraft = {call_sign: entry for call_sign, *entry in rows}
+    stored = {resources.location: resources for resources in stored}
+
+    counters = {location: dict.fromkeys(AirportResources.COUNTERS, 0) for location in stored}
+    for location in locations or ():
+        counters.setdefault(location, dict.fromkeys(AirportResources.COUNTERS, 0))
+    for _, aircraft_type, state, location in aircraft.values():
+        counters.setdefault(location, dict.fromkeys(AirportResources.COUNTERS, 0))
+        counter = occupied_resource(state, aircraft_type)
+        if counter:
+            counters[location][counter] += 1
+
+    for location, airport_counters in counters.items():
+        resources = stored.get(location, None)
+        if resources is None or any(getattr(resources, counter) != value
+                                    for counter, value in airport_counters.items()):
+            with transaction.atomic():
+                AirportResources.lock(location)
+                AirportResources.recalculate(location)
+
+    return aircraft, counters
+
+
+def call_signs_by_airport(aircraft):
+    call_signs = {}
+    for call_sign, (_, _, _, location) in aircraft.items():
+        call_signs.setdefault(location, set()).add(call_sign)
+    return call_signs
+
+
+class Change:
+    """ Accepted change of an aircraft state, reserved in engine memory and
+    waiting to be written to the database."""
+
+    __slots__ = ('aircraft_id', 'call_sign', 'type', 'airport', 'from_state', 'to_state',
+                 'log_from_state', 'position', 'description', 'check_capacity')
+
+    def __init__(self, aircraft_id, call_sign, type, airport, from_state, to_state, log_from_state=None,
+                 position=None, description='', check_capacity=True):
+        self.aircraft_id = aircraft_id
+        self.call_sign = call_sign
+        self.type = type
+        self.airport = airport
+        self.from_state = from_state
+        self.to_state = to_state
+        self.log_from_state = from_state if log_from_state is None else log_from_state
+        self.position = position or {}
+        self.description = description
+        self.check_capacity = check_capacity
+
+
+class AirportStateEngine:
+    """
+    Keeps `call_sign -> (id, type, state, airport)` of all aircraft,
+    occupancy counters and capacities of every airport. Validation and
+    reservation of a change happen under the engine lock in memory, the
+    database write happens outside of it.
+    """
+
+    def __init__(self, reconcile_interval=None, epoch_interval=None):
+        self.reconcile_interval = get_setting('AIRPORT_ENGINE_RECONCILE_INTERVAL', 60) \
+            if reconcile_interval is None else reconcile_interval
+        self.epoch_interval = get_setting('AIRPORT_ENGINE_EPOCH_INTERVAL', 1) \
+            if epoch_interval is None else epoch_interval
+        self.lock = threading.RLock()
+        self.reload_lock = threading.Lock()
+        self.aircraft = {}
+        self.call_signs = {}
+        self.counters = {}
+        self.capacities = {}
+        self.loaded_at = None
+        self.checked_at = None
+        self.epochs = {}
+        self.stale = set()
+
+    def reconcile(self):
+        """ Reloads aircraft, counters and capacities of all airports from
+        the database."""
+
+        with self.reload_lock:
+            self.load()
+
+    def read_epochs(self):
+        self.checked_at = time.monotonic()
+        return AirportStateEpoch.current()
+
+    def load(self, locations=None, epochs=None):
+        """ Reads state of the airports at `locations`, or of all airports,
+        and swaps it in. Called with the reload lock held."""
+
+        if locations is None:
+            self.stale = set()
+
+        # read before the state, a bump during the load reloads again
+        if epochs is None:
+            epochs = self.read_epochs()
+        aircraft, counters = load_airport_state(locations)
+        call_signs = call_signs_by_airport(aircraft)
+        capacities = Airport.capacities()
+
+        with self.lock:
+            if locations is None:
+                self.aircraft = aircraft
+                self.call_signs = call_signs
+                self.counters = counters
+                self.epochs = epochs
+                self.loaded_at = time.monotonic()
+            else:
+                for location in locations:
+                    for call_sign in self.call_signs.pop(location, ()):
+                        self.aircraft.pop(call_sign, None)
+                    self.counters[location] = counters[location]
+                    self.epochs[location] = epochs.get(location, 0)
+                self.aircraft.update(aircraft)
+                self.call_signs.update(call_signs)
+            self.capacities = capacities
+
+    def invalidate(self, location=None):
+        """ Makes the next intent reload state of the airport at `location`,
+        or of all airports."""
+
+        with self.lock:
+            if location is None:
+                self.loaded_at = None
+            else:
+                self.stale.add(location)
+
+    def refresh(self):
+        """
+        Reloads state when it was invalidated or is older than the reconcile
+        interval, and airports whose `AirportStateEpoch` grew.
+
+        Called outside of the engine lock. Only invalidated state waits for
+        a reload in progress, otherwise the current state is used meanwhile.
+        """
+
+        now = time.monotonic()
+        invalid = self.loaded_at is None or bool(self.stale)
+        expired = self.loaded_at is not None and now - self.loaded_at > self.reconcile_interval
+        poll = self.checked_at is None or now - self.checked_at >= self.epoch_interval
+
+        if not (invalid or expired or poll):
+            return
+
+        if not self.reload_lock.acquire(blocking=invalid):
+            return
+
+        try:
+            # state might have been reloaded while waiting for the lock
+            if self.loaded_at is None or time.monotonic() - self.loaded_at > self.reconcile_interval:
+                self.load()
+                return
+
+            stale, self.stale = self.stale, set()
+            epochs = None
+            if self.checked_at is None or time.monotonic() - self.checked_at >= self.epoch_interval:
+                epochs = self.read_epochs()
+                stale |= {location for location, epoch in epochs.items() if epoch > self.epochs.get(location, 0)}
+
+            if stale:
+                self.load(stale, epochs)
+        finally:
+            self.reload_lock.release()
+
+    def get_aircraft(self, call_sign):
+        """ Returns unsaved `Aircraft` built from engine state or None."""
+
+        entry = self.aircraft.get(call_sign, None)
+        if entry is None:
+            return None
+
+        pk, aircraft_type, state, airport = entry
+        return Aircraft(pk=pk, call_sign=call_sign, type=aircraft_type, state=state, airport=airport)
+
+    def airport_counters(self, location):
+        if location not in self.counters:
+            self.counters[location] = dict.fromkeys(AirportResources.COUNTERS, 0)
+        return self.counters[location]
+
+    def occupancy(self, location=None):
+        """ Returns unsaved `AirportResources` of the airport with engine
+        counters and capacities, it can be used by validation in place of
+        the locked database row."""
+
+        location = location or default_airport()
+        resources = AirportResources(location=location, **self.airport_counters(location))
+
+        capacities = self.capacities.get(location, None)
+        if capacities is not None:
+            for name in CAPACITY_SETTINGS:
+                setattr(resources, name, capacities[name])
+
+        return resources
+
+    def reserve(self, change):
+        counters = self.airport_counters(change.airport)
+
+        previous = self.aircraft.get(change.call_sign, None)
+        if previous is not None:
+            released = occupied_resource(previous[2], previous[1])
+            if released:
+                counters[released] -= 1
+
+        occupied = occupied_resource(change.to_state, change.type)
+        if occupied:
+            counters[occupied] += 1
+
+        self.aircraft[change.call_sign] = (change.aircraft_id, change.type, change.to_state, change.airport)
+        if previous is None:
+            self.call_signs.setdefault(change.airport, set()).add(change.call_sign)
+
+    def submit(self, validate):
+        """
+        Validates a change with `validate` and writes it to the database.
+
+        `validate` is called with the engine lock held and returns `Change`,
+        or None when there is nothing to do. It raises `StateConflict` or
+        `ValidationError` to reject the change. Returns written `Aircraft`.
+        """
+
+        for _ in range(MAX_ATTEMPTS):
+            self.refresh()
+            with self.lock:
+                change = validate()
+                if change is None:
+                    return None
+                self.reserve(change)
+
+            # new aircraft might have been created at another airport
+            location = change.airport if change.aircraft_id is not None else None
+            try:
+                aircraft = write_change(change)
+            except StaleState:
+                self.invalidate(location)
+                continue
+            except Exception:
+                self.invalidate(location)
+                raise
+
+            if change.aircraft_id is None:
+                with self.lock:
+                    entry = self.aircraft.get(change.call_sign, None)
+                    if entry is not None and entry[0] is None:
+                        self.aircraft[change.call_sign] = (aircraft.pk,) + entry[1:]
+
+            return aircraft
+
+        raise StateConflict(
+            aircraft=None,
+            from_state=change.from_state,
+            to_state=change.to_state,
+            description='Airport state changed concurrently'
+        )
+
+
+def write_change(change):
+    """ Writes accepted change to the database. Raises `StaleState` when the
+    database doesn't match state the change was validated against."""
+
+    try:
+        with transaction.atomic():
+            if change.aircraft_id is None:
+                aircraft = Aircraft(
+                    call_sign=change.call_sign,
+                    type=change.type,
+                    state=change.to_state,
+                    airport=change.airport,
+                    **change.position
+                )
+                # counters are moved by save()
+                aircraft.save()
+            else:
+                # resources row is written before the aircraft row, the
+                # order in which intents lock them
+                AirportResources.move(
+                    released=occupied_resource(change.from_state, change.type),
+                    occupied=occupied_resource(change.to_state, change.type),
+                    location=change.airport
+                )
+
+                updated = Aircraft.objects.filter(
+                    pk=change.aircraft_id,
+                    state=change.from_state
+                ).update(state=change.to_state)
+                if not updated:
+                    raise StaleState()
+                aircraft = Aircraft(pk=change.aircraft_id, call_sign=change.call_sign,
+                                    type=change.type, state=change.to_state, airport=change.airport)
+
+            occupied = occupied_resource(change.to_state, change.type)
+            if change.check_capacity and occupied:
+                # resources row is locked by the counter update above
+                resources = AirportResources.with_capacities(
+                    AirportResources.objects.filter(location=change.airport)
+                ).get()
+                if getattr(resources, occupied) > capacity(resources, occupied):
+                    raise StaleState()
+
+            write_state_log(
+                aircraft=aircraft,
+                from_state=change.log_from_state,
+                to_state=change.to_state,
+                outcome='ACCEPTED',
+                description=change.description
+            )
+    except IntegrityError:
+        # aircraft with the call sign was created by another process
+        raise StaleState()
+
+    return aircraft
+
+
+def intent_change(serializer, log_from_state=''):
+    """ Builds `Change` from validated AircraftSerializer."""
+
+    aircraft = serializer.db_object
+    data = serializer.validated_data
+
+    if aircraft is None:
+        return Change(
+            aircraft_id=None,
+            call_sign=data['call_sign'],
+            type=data['type'],
+            airport=serializer.get_airport(),
+            from_state=None,
+            to_state=data['state'],
+            log_from_state=log_from_state,
+            position={field: data[field] for field in POSITION_FIELDS if field in data}
+        )
+
+    return Change(
+        aircraft_id=aircraft.pk,
+        call_sign=aircraft.call_sign,
+        type=aircraft.type,
+        airport=aircraft.airport,
+        from_state=aircraft.state,
+        to_state=data['state']
+    )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_state_engine():
+    """ Returns process-wide engine when `AIRPORT_INTENT_BACKEND` is
+    'memory', otherwise None."""
+
+    global _engine
+
+    if get_setting('AIRPORT_INTENT_BACKEND', 'database') != 'memory':
+        return None
+
+    with _engine_lock:
+        if _engine is None:
+            _engine = AirportStateEngine()
+
+    return _engine
+
+
+def reset_state_engine():
+    global _engine
+
+    with _engine_lock:
+        _engine = None
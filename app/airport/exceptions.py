@@ -16,3 +16,10 @@ class StateConflict(APIException):
         self.from_state = from_state
         self.to_state = to_state
         self.description = description
+
+
+class RunwayOccupied(StateConflict):
+    DESCRIPTION = 'The runway is occupied'
+
+    def __init__(self, aircraft, from_state, to_state, description=DESCRIPTION):
+        super().__init__(aircraft, from_state, to_state, description)
@@ -0,0 +1,109 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from Crypto.PublicKey import RSA
+
+from django.conf import settings
+
+
+class KeyStore:
+    """
+    Process-wide holder of the airport private key.
+
+    The private key is parsed once and re-read only when the key file's
+    mtime changes (key rotation). Public keys which were already verified
+    against it are remembered by their SHA-256 fingerprint in a bounded
+    LRU, so a repeat caller is verified without parsing any RSA key. The
+    LRU is emptied whenever the key is reloaded and only keys verified
+    against the current key are added to it.
+    """
+
+    def __init__(self, path=None, max_verified=None):
+        self._path = path
+        self._max_verified = max_verified
+        self._lock = threading.Lock()
+        self._private_key = None
+        self._mtime = None
+        self._verified = OrderedDict()
+
+    @property
+    def path(self):
+        if self._path:
+            return self._path
+        return getattr(settings, 'AIRPORT_PRIVATE_KEY_PATH', '/keys/airport_ops_rsa')
+
+    @property
+    def max_verified(self):
+        if self._max_verified is not None:
+            return self._max_verified
+        return getattr(settings, 'AIRPORT_VERIFIED_KEYS_CACHE_SIZE', 1024)
+
+    def get_private_key(self):
+        """ Returns parsed private key, reloading it if the file has changed
+        since it was last read."""
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+        with self._lock:
+            if self._private_key is None or mtime != self._mtime:
+                with open(self.path) as private_key_file:
+                    self._private_key = RSA.importKey(private_key_file.read())
+                self._mtime = mtime
+                self._verified.clear()
+
+            return self._private_key
+
+    def is_valid_public_key(self, public_key_content):
+        """ This method will answer if given public key matches
+        the private key or not"""
+
+        if not public_key_content or not isinstance(public_key_content, (str, bytes)):
+            return False
+
+        private_key = self.get_private_key()
+
+        if not private_key:
+            return False
+
+        if isinstance(public_key_content, str):
+            public_key_content = public_key_content.encode()
+
+        fingerprint = hashlib.sha256(public_key_content).digest()
+
+        with self._lock:
+            if fingerprint in self._verified:
+                self._verified.move_to_end(fingerprint)
+                return True
+
+        try:
+            public_key = RSA.importKey(public_key_content)
+        except (ValueError, IndexError, TypeError):
+            return False
+
+        if not private_key.publickey() == public_key:
+            return False
+
+        with self._lock:
+            # key rotated during verification, don't trust the fingerprint
+            # for the new key
+            if self._private_key is not private_key:
+                return True
+            self._verified[fingerprint] = True
+            while len(self._verified) > self.max_verified:
+                self._verified.popitem(last=False)
+
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._private_key = None
+            self._mtime = None
+            self._verified.clear()
+
+
+key_store = KeyStore()
@@ -0,0 +1,344 @@
+"""
+Writer of state change logs.
+
+`write_state_log` is called from the intent endpoint and Celery tasks.
+With `AIRPORT_LOG_WRITER = 'sync'` every log is inserted immediately,
+like any other model. With `'buffered'` logs are queued in memory once
+the surrounding transaction commits and a background thread inserts them
+with `bulk_create` when `AIRPORT_LOG_BATCH_SIZE` logs are queued or
+`AIRPORT_LOG_FLUSH_INTERVAL` seconds passed, so requests don't wait for
+the audit write. Buffered logs get their `time` when they are inserted,
+not when they were queued, so a log is never committed with an older
+`(time, id)` position than logs already read by `since` pollers and
+stream subscribers.
+
+Logs which can't be inserted are written to a spool file of the process
+in `AIRPORT_LOG_SPOOL_DIR` and inserted with its next successful flush.
+Queued logs are flushed when the process exits.
+
+The spool directory can be shared by containers, so spool files are named
+by host, pid and a random token, and the process holds a lock on its own
+`.lock` file next to the spool for as long as the spool exists. Lock is
+released by the kernel when the process dies, so spool files left by
+stopped processes are recognised by a free lock and only those are
+inserted by `flush_state_logs` command.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from airport.models import Aircraft, StateChangeLog
+from airport.serializers import get_setting
+from airport.streaming import publish_state_logs
+
+logger = logging.getLogger(__name__)
+
+LOG_FIELDS = ('aircraft_id', 'from_state', 'to_state', 'outcome', 'description', 'time')
+
+
+def get_spool_dir():
+    return get_setting('AIRPORT_LOG_SPOOL_DIR', tempfile.gettempdir())
+
+
+_process_token = None
+
+
+def get_spool_path():
+    """ Returns path of the spool file of this process."""
+
+    global _process_token
+
+    pid = os.getpid()
+    if _process_token is None or _process_token[0] != pid:
+        # forked processes get a token of their own
+        _process_token = (pid, uuid.uuid4().hex)
+
+    return os.path.join(get_spool_dir(), f'airport_state_logs.{socket.gethostname()}.{pid}.{_process_token[1]}.jsonl')
+
+
+def get_spool_lock_path(spool_path):
+    return os.path.splitext(spool_path)[0] + '.lock'
+
+
+def log_to_record(log):
+    record = {field: getattr(log, field) for field in LOG_FIELDS}
+    record['time'] = log.time.isoformat()
+    return record
+
+
+def record_to_log(record):
+    return StateChangeLog(**dict(record, time=parse_datetime(record['time'])))
+
+
+class BufferedLogWriter:
+    """ Queues logs and inserts them in batches from a background thread."""
+
+    def __init__(self, batch_size=None, flush_interval=None, spool_path=None):
+        self.batch_size = batch_size or get_setting('AIRPORT_LOG_BATCH_SIZE', 100)
+        self.flush_interval = flush_interval or get_setting('AIRPORT_LOG_FLUSH_INTERVAL', 1.0)
+        self.spool_path = spool_path or get_spool_path()
+        self.pid = os.getpid()
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._spool_lock = None
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def write(self, log):
+        with self._lock:
+            self._buffer.append(log)
+            full = len(self._buffer) >= self.batch_size
+
+        self.start()
+        if full:
+            self._wakeup.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='state-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                # don't keep a connection open between flushes
+                connection.close()
+
+    def flush(self):
+        """ Inserts queued and spooled logs. Returns number of inserted logs."""
+
+        with self._flush_lock:
+            with self._lock:
+                logs, self._buffer = self._buffer, []
+
+            logs = self.read_spool() + logs
+            if not logs:
+                return 0
+
+            try:
+                created = self.insert(logs)
+            except DatabaseError:
+                logger.exception('Writing %s state change logs failed, spooling them', len(logs))
+                self.spool(logs)
+                return 0
+
+            self.clear_spool()
+
+        # bulk_create doesn't send post_save, stream new logs explicitly.
+        # Backends which don't return ids of inserted rows can't be streamed.
+        publish_state_logs([log for log in created if log.pk is not None])
+
+        return len(created)
+
+    def insert(self, logs):
+        now = timezone.now()
+        for log in logs:
+            log.time = now
+
+        try:
+            with transaction.atomic():
+                return StateChangeLog.objects.bulk_create(logs, batch_size=self.batch_size)
+        except IntegrityError:
+            # aircraft was removed in the meantime, its logs are dropped
+            existing = set(Aircraft.objects.filter(
+                pk__in={log.aircraft_id for log in logs}
+            ).values_list('pk', flat=True))
+            dropped = [log for log in logs if log.aircraft_id not in existing]
+            logger.warning('Dropping %s state change logs of removed aircraft', len(dropped))
+
+            with transaction.atomic():
+                return StateChangeLog.objects.bulk_create(
+                    [log for log in logs if log.aircraft_id in existing],
+                    batch_size=self.batch_size
+                )
+
+    def spool(self, logs):
+        # logs already contain previously spooled ones. Spool is replaced
+        # atomically, so a crash while writing keeps the previous one
+        try:
+            self.hold_spool()
+            temp_path = self.spool_path + '.tmp'
+            with open(temp_path, 'w') as spool:
+                for log in logs:
+                    spool.write(json.dumps(log_to_record(log)) + '\n')
+                spool.flush()
+                os.fsync(spool.fileno())
+            os.replace(temp_path, self.spool_path)
+        except OSError:
+            logger.exception('Spooling %s state change logs failed, they are lost', len(logs))
+
+    def hold_spool(self):
+        """ Locks spool of the writer, so it isn't recovered by other
+        processes while this one runs."""
+
+        if self._spool_lock is None:
+            lock = open(get_spool_lock_path(self.spool_path), 'a')
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._spool_lock = lock
+
+    def close(self):
+        """ Releases lock of the spool, which can be recovered by
+        `recover_spool_file()` from then on."""
+
+        if self._spool_lock is not None:
+            self._spool_lock.close()
+            self._spool_lock = None
+
+    def read_spool(self):
+        return read_spool_file(self.spool_path)
+
+    def clear_spool(self):
+        try:
+            os.remove(self.spool_path)
+        except FileNotFoundError:
+            pass
+
+        if self._spool_lock is not None:
+            os.remove(get_spool_lock_path(self.spool_path))
+            self.close()
+
+
+def read_spool_file(path):
+    try:
+        with open(path) as spool:
+            return [record_to_log(json.loads(line)) for line in spool if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            # writer inherited from the parent process is left to it
+            _writer = BufferedLogWriter()
+            atexit.register(_writer.flush)
+
+    return _writer
+
+
+def flush_state_logs():
+    """ Flushes logs queued and spooled by this process. Returns number of
+    inserted logs."""
+
+    return get_writer().flush()
+
+
+def recover_spool_file(path):
+    """
+    Inserts logs from spool file of another process, when the process is
+    known to be stopped because its spool lock is free. Returns number of
+    inserted logs, or None when the owner still runs or another process
+    recovers the file.
+    """
+
+    lock_path = get_spool_lock_path(path)
+
+    with open(lock_path, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+
+        try:
+            if os.stat(lock_path).st_ino != os.fstat(lock.fileno()).st_ino:
+                # lock file was removed meanwhile, spool belongs to a new one
+                return None
+        except FileNotFoundError:
+            return None
+
+        logs = read_spool_file(path)
+        try:
+            created = BufferedLogWriter(spool_path=path).insert(logs) if logs else []
+        except DatabaseError:
+            logger.exception('Recovering %s spooled state change logs from %s failed', len(logs), path)
+            return 0
+
+        for stale_path in (path, lock_path):
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                pass
+
+    publish_state_logs([log for log in created if log.pk is not None])
+
+    return len(created)
+
+
+def recover_spooled_logs():
+    """ Inserts logs from spool files of stopped processes. Returns number
+    of inserted logs."""
+
+    own_path = get_spool_path()
+    inserted = 0
+
+    for path in glob.glob(os.path.join(get_spool_dir(), 'airport_state_logs.*.jsonl')):
+        if path != own_path:
+            inserted += recover_spool_file(path) or 0
+
+    return inserted
+
+
+def write_state_log(aircraft, from_state, to_state, outcome, description=''):
+    log = StateChangeLog(
+        aircraft=aircraft,
+        from_state=from_state,
+        to_state=to_state,
+        outcome=outcome,
+        description=description
+    )
+
+    if get_setting('AIRPORT_LOG_WRITER', 'sync') == 'buffered':
+        # rolled back changes are not logged, same as with synchronous insert
+        transaction.on_commit(lambda: get_writer().write(log))
+    else:
+        log.save()
+
+    return log
+
+
+def write_state_logs(logs):
+    """ Writes many unsaved `StateChangeLog`s, with the synchronous writer
+    in a single INSERT."""
+
+    if get_setting('AIRPORT_LOG_WRITER', 'sync') == 'buffered':
+        def queue():
+            writer = get_writer()
+            for log in logs:
+                writer.write(log)
+
+        transaction.on_commit(queue)
+        return logs
+
+    created = StateChangeLog.objects.bulk_create(logs)
+
+    # bulk_create doesn't send post_save, stream new logs explicitly
+    transaction.on_commit(lambda: publish_state_logs([log for log in created if log.pk is not None]))
+
+    return created
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from airport import archive, partitions
+
+
+class Command(BaseCommand):
+    """ Django command to export state change logs to daily gzip compressed
+    JSON lines files.
+
+    Export logs older than a date and remove them from the table:
+
+        python manage.py archive_state_logs --before 2026-01-01 --delete
+
+    Export a partition detached by `manage_log_partitions` and drop it:
+
+        python manage.py archive_state_logs --partition airport_statechangelog_archived_202601 --delete
+    """
+
+    help = 'Export state change logs to compressed archive files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=archive.parse_time,
+                            help='Export logs written at or after this date')
+        parser.add_argument('--before', type=archive.parse_time,
+                            help='Export logs written before this date')
+        parser.add_argument('--partition',
+                            help='Export detached log partition instead of log table')
+        parser.add_argument('--output-dir', default=None)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--delete', action='store_true',
+                            help='Remove exported logs, or drop exported partition')
+
+    def handle(self, *args, **options):
+        directory = options['output_dir'] or archive.get_archive_dir()
+
+        if options['partition']:
+            counts = self.export_partition(directory, options)
+        elif options['before'] is None:
+            raise CommandError('--before is required, exporting logs which are still written is not supported')
+        else:
+            counts = archive.export_logs(
+                directory,
+                start=options['after'],
+                end=options['before'],
+                chunk_size=options['chunk_size'],
+                delete=options['delete']
+            )
+
+        for day, count in sorted(counts.items()):
+            self.stdout.write(f'{archive.archive_path(directory, day)}: {count} logs')
+        self.stdout.write(self.style.SUCCESS(f'Exported {sum(counts.values())} state change logs'))
+
+    def export_partition(self, directory, options):
+        name = options['partition']
+
+        if connection.vendor != 'postgresql' or name not in partitions.archived_partitions(connection):
+            raise CommandError(f'{name} is not a detached log partition')
+
+        counts = archive.export_table(directory, name, chunk_size=options['chunk_size'])
+
+        if options['delete']:
+            partitions.drop_archived_partition(connection, name)
+            self.stdout.write(f'Dropped {name}')
+
+        return counts
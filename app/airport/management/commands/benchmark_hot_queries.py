@@ -0,0 +1,201 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from airport.models import Aircraft, AirportResources, StateChangeLog, default_airport
+from airport.spatial import reindex, within_bounding_box
+
+SEED_BATCH_SIZE = 10000
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """ Django command to measure hot Aircraft and StateChangeLog queries.
+
+    Prints query plan and latency of every query, first with all indexes
+    and then, with `--compare-without-indexes`, inside a transaction where
+    indexes from `Meta.indexes` are dropped and afterwards rolled back.
+
+    Use only against a benchmark database. Seeded aircraft are spread over
+    10x10 degrees around the airport. Seeding 100k aircraft and 10M logs on
+    PostgreSQL:
+
+        python manage.py benchmark_hot_queries --seed --aircraft 100000 --logs 10000000
+    """
+
+    help = 'Benchmark hot queries on Aircraft and StateChangeLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='Insert benchmark aircraft and logs before measuring')
+        parser.add_argument('--aircraft', type=int, default=100000)
+        parser.add_argument('--logs', type=int, default=10000000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--compare-without-indexes', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['aircraft'], options['logs'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+        self.measure(options['repeat'])
+
+        if options['compare_without_indexes']:
+            if not connection.features.can_rollback_ddl:
+                raise CommandError('Database can not roll back dropped indexes')
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+            try:
+                with transaction.atomic():
+                    self.drop_indexes()
+                    self.measure(options['repeat'])
+                    raise Rollback()
+            except Rollback:
+                pass
+
+    def hot_queries(self):
+        aircraft = Aircraft.objects.order_by('pk').first()
+        aircraft_id = aircraft.pk if aircraft else 0
+
+        return [
+            ('landed aircraft', Aircraft.objects.filter(state=Aircraft.LANDED).order_by('pk')[:1]),
+            ('parked airliners count', Aircraft.objects.filter(type='AIRLINER', state=Aircraft.PARKED)),
+            ('latest logs', StateChangeLog.objects.order_by('-time', '-id')[:10]),
+            ('deep logs page', StateChangeLog.objects.order_by('-time', '-id')[10000:10010]),
+            ('deep logs keyset page', self.keyset_page_queryset(offset=10000)),
+            ('aircraft logs', StateChangeLog.objects.filter(aircraft_id=aircraft_id).order_by('-time')[:10]),
+            ('aircraft in box', within_bounding_box(Aircraft.objects.all(), 44.5, 20.0, 45.5, 21.0)),
+        ]
+
+    def keyset_page_queryset(self, offset):
+        logs = StateChangeLog.objects.order_by('-time', '-id')
+        position = logs.values_list('time', 'id')[offset:offset + 1].first()
+
+        if position is None:
+            return logs[:10]
+
+        time, pk = position
+        return logs.filter(Q(time__lt=time) | Q(time=time, id__lt=pk))[:10]
+
+    def measure(self, repeat):
+        for name, queryset in self.hot_queries():
+            timings = []
+            for _ in range(max(repeat, 1)):
+                # evaluate a fresh clone, querysets cache their results
+                start = time.perf_counter()
+                if name.endswith('count'):
+                    queryset.all().count()
+                else:
+                    list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms'
+            ))
+            self.stdout.write(self.explain(queryset))
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            return queryset.explain(analyze=True)
+        return queryset.explain()
+
+    def drop_indexes(self):
+        with connection.schema_editor(atomic=False) as editor:
+            for model in (Aircraft, StateChangeLog):
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+
+    def seed(self, aircraft_count, logs_count):
+        self.stdout.write(f'Seeding {aircraft_count} aircraft and {logs_count} logs...')
+
+        states = [state for state, _ in Aircraft.STATUSES]
+        types = [aircraft_type for aircraft_type, _ in Aircraft.AIRCRAFT_TYPES]
+
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                self.seed_postgresql(aircraft_count, logs_count, states, types)
+            else:
+                self.seed_generic(aircraft_count, logs_count, states, types)
+
+            # counters and grid index are bypassed by bulk inserts
+            AirportResources.recalculate()
+            reindex(Aircraft.objects.filter(call_sign__startswith='BENCH_'))
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE airport_aircraft')
+                cursor.execute('ANALYZE airport_statechangelog')
+
+        self.stdout.write(self.style.SUCCESS('Seeding done'))
+
+    def seed_postgresql(self, aircraft_count, logs_count, states, types):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO airport_aircraft
+                    (call_sign, type, state, longitude, latitude, altitude, heading, grid_cell, airport)
+                SELECT 'BENCH_' || n,
+                       (%s::text[])[1 + n %% array_length(%s::text[], 1)],
+                       (%s::text[])[1 + n %% array_length(%s::text[], 1)],
+                       15 + (n * 7919 %% 10000) / 1000.0,
+                       40 + (n * 104729 %% 10000) / 1000.0,
+                       0, 0, 0, %s
+                FROM generate_series(1, %s) AS n
+                ON CONFLICT (call_sign) DO NOTHING
+                """,
+                [types, types, states, states, default_airport(), aircraft_count]
+            )
+            cursor.execute(
+                """
+                INSERT INTO airport_statechangelog
+                    (aircraft_id, from_state, to_state, outcome, description, time)
+                SELECT ids.ids[1 + n %% array_length(ids.ids, 1)],
+                       'PARKED', 'TAKE_OFF', 'ACCEPTED', '',
+                       now() - (n || ' seconds')::interval
+                FROM generate_series(1, %s) AS n,
+                     (SELECT array_agg(id) AS ids FROM airport_aircraft
+                      WHERE call_sign LIKE 'BENCH\\_%%') AS ids
+                """,
+                [logs_count]
+            )
+
+    def seed_generic(self, aircraft_count, logs_count, states, types):
+        existing = Aircraft.objects.filter(call_sign__startswith='BENCH_').count()
+
+        for start in range(existing, aircraft_count, SEED_BATCH_SIZE):
+            Aircraft.objects.bulk_create(
+                Aircraft(
+                    call_sign=f'BENCH_{n}',
+                    type=types[n % len(types)],
+                    state=states[n % len(states)],
+                    longitude=15 + (n * 7919 % 10000) / 1000,
+                    latitude=40 + (n * 104729 % 10000) / 1000
+                )
+                for n in range(start, min(start + SEED_BATCH_SIZE, aircraft_count))
+            )
+
+        ids = list(Aircraft.objects.filter(call_sign__startswith='BENCH_').values_list('pk', flat=True))
+        if not ids:
+            return
+
+        now = timezone.now()
+        for start in range(0, logs_count, SEED_BATCH_SIZE):
+            StateChangeLog.objects.bulk_create(
+                StateChangeLog(
+                    aircraft_id=ids[n % len(ids)],
+                    from_state=Aircraft.PARKED,
+                    to_state=Aircraft.TAKE_OFF,
+                    outcome='ACCEPTED',
+                    description='',
+                    time=now - timedelta(seconds=n)
+                )
+                for n in range(start, min(start + SEED_BATCH_SIZE, logs_count))
+            )
@@ -0,0 +1,67 @@
+import itertools
+import math
+import statistics
+import time
+
+import numpy as np
+
+from django.core.management.base import BaseCommand
+
+from airport.separation import find_close_pairs, get_minima
+
+# Pairwise check in Python is measured only up to this many aircraft
+MAX_PAIRWISE = 2000
+
+
+class Command(BaseCommand):
+    """ Django command to measure separation check on random positions,
+    without the database. Aircraft are spread over a square of `--area` km
+    and `--ceiling` altitude units:
+
+        python manage.py benchmark_separation --aircraft 1000 10000
+    """
+
+    help = 'Benchmark separation check of aircraft in flight'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--aircraft', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--area', type=float, default=400)
+        parser.add_argument('--ceiling', type=float, default=40000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        horizontal, vertical = get_minima()
+        random = np.random.RandomState(options['seed'])
+
+        for count in options['aircraft']:
+            x = random.uniform(0, options['area'], count)
+            y = random.uniform(0, options['area'], count)
+            z = random.uniform(0, options['ceiling'], count)
+
+            timings = []
+            for _ in range(max(options['repeat'], 1)):
+                start = time.perf_counter()
+                first, second, _, _ = find_close_pairs(np.column_stack([x, y]), z, horizontal, vertical)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{count} aircraft, {len(first)} close pairs: grid median '
+                f'{statistics.median(timings):.3f} ms, max {max(timings):.3f} ms'
+            ))
+
+            if count <= MAX_PAIRWISE:
+                start = time.perf_counter()
+                pairs = self.pairwise(x, y, z, horizontal, vertical)
+                elapsed = (time.perf_counter() - start) * 1000
+
+                matches = pairs == set(zip(first.tolist(), second.tolist()))
+                self.stdout.write(f'  pairwise in Python {elapsed:.3f} ms, same pairs: {matches}')
+
+    def pairwise(self, x, y, z, horizontal, vertical):
+        x, y, z = x.tolist(), y.tolist(), z.tolist()
+
+        return {
+            (i, j) for i, j in itertools.combinations(range(len(x)), 2)
+            if math.hypot(x[i] - x[j], y[i] - y[j]) < horizontal and abs(z[i] - z[j]) < vertical
+        }
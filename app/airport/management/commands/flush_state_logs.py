@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from airport.logwriter import flush_state_logs, recover_spooled_logs
+
+
+class Command(BaseCommand):
+    """ Django command to insert state change logs left in spool files by
+    buffered log writers which couldn't reach the database. Spool files of
+    processes which still run are left to them."""
+
+    help = 'Insert spooled state change logs'
+
+    def handle(self, *args, **options):
+        inserted = flush_state_logs() + recover_spooled_logs()
+
+        self.stdout.write(self.style.SUCCESS(f'Inserted {inserted} state change logs'))
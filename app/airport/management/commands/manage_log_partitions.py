@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from airport import partitions
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """ Django command to maintain time partitions of state change logs.
+
+    Creates partitions for upcoming periods and detaches partitions older
+    than `AIRPORT_LOG_RETENTION_DAYS`. Detached partitions are kept as
+    `airport_statechangelog_archived_*` tables until dropped with `--drop`.
+    Run it daily, Celery beat does it with `manage_log_partitions` task.
+    """
+
+    help = 'Create upcoming and detach expired state change log partitions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None,
+                            help='Number of future periods to create partitions for')
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Detach partitions holding only logs older than this')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop archived partitions')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned(connection):
+            raise CommandError('State change logs are not partitioned, PostgreSQL is required')
+
+        try:
+            with transaction.atomic():
+                self.maintain(options)
+                if options['dry_run']:
+                    raise Rollback()
+        except Rollback:
+            self.stdout.write('Dry run, nothing was changed')
+
+    def maintain(self, options):
+        for name in partitions.ensure_partitions(connection, ahead=options['ahead']):
+            self.stdout.write(self.style.SUCCESS(f'Created {name}'))
+
+        for name in partitions.expired_partitions(connection, retention_days=options['retention_days']):
+            archived = partitions.detach_partition(connection, name)
+            self.stdout.write(self.style.SUCCESS(f'Detached {name} as {archived}'))
+
+        if options['drop']:
+            for name in partitions.archived_partitions(connection):
+                partitions.drop_archived_partition(connection, name)
+                self.stdout.write(self.style.SUCCESS(f'Dropped {name}'))
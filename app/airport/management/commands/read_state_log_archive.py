@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from airport import archive
+
+
+class Command(BaseCommand):
+    """ Django command to query archived state change logs by time range
+    and call sign, or to import them back into the log table.
+
+        python manage.py read_state_log_archive --after 2026-01-01 --before 2026-01-02 --call-sign CYAN
+        python manage.py read_state_log_archive --after 2026-01-01 --before 2026-02-01 --import
+    """
+
+    help = 'Print or import archived state change logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--after', type=archive.parse_time,
+                            help='Read logs written at or after this date')
+        parser.add_argument('--before', type=archive.parse_time,
+                            help='Read logs written before this date')
+        parser.add_argument('--call-sign')
+        parser.add_argument('--input-dir', default=None)
+        parser.add_argument('--import', dest='import_logs', action='store_true',
+                            help='Insert logs back into the log table instead of printing them')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        records = archive.read_archive(
+            options['input_dir'] or archive.get_archive_dir(),
+            start=options['after'],
+            end=options['before'],
+            call_sign=options['call_sign']
+        )
+
+        if options['import_logs']:
+            imported, skipped = archive.import_records(records, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Imported {imported} state change logs'))
+            if skipped:
+                self.stdout.write(self.style.WARNING(f'Skipped {skipped} logs of removed aircraft'))
+            return
+
+        for record in records:
+            self.stdout.write(json.dumps(dict(record, time=record['time'].isoformat())))
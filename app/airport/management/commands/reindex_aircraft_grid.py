@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from airport.models import Aircraft
+from airport.spatial import cell_size, reindex
+
+
+class Command(BaseCommand):
+    """ Django command to recompute grid cells of all aircraft, needed after
+    `AIRPORT_GRID_CELL_SIZE` is changed or positions were written in bulk."""
+
+    help = 'Recompute grid index of aircraft positions'
+
+    def handle(self, *args, **options):
+        updated = reindex(Aircraft.objects.all())
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {updated} aircraft in {cell_size()} degree cells'))
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_airport_resources(apps, schema_editor):
+    AirportResources = apps.get_model('airport', 'AirportResources')
+    AirportResources.objects.get_or_create(location=settings.AIRPORT_LOCATION)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0004_statechangelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AirportResources',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.RunPython(create_airport_resources, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:21
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_occupancy(apps, schema_editor):
+    Aircraft = apps.get_model('airport', 'Aircraft')
+    AirportResources = apps.get_model('airport', 'AirportResources')
+
+    occupancy = Aircraft.objects.aggregate(
+        runways_in_use=Count('id', filter=Q(state__in=['TAKE_OFF', 'LANDED'])),
+        on_approach=Count('id', filter=Q(state='APPROACH')),
+        parked_airliners=Count('id', filter=Q(state='PARKED', type='AIRLINER')),
+        parked_private=Count('id', filter=Q(state='PARKED') & ~Q(type='AIRLINER'))
+    )
+
+    AirportResources.objects.all().update(**occupancy)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0005_airportresources'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airportresources',
+            name='on_approach',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='airportresources',
+            name='parked_airliners',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='airportresources',
+            name='parked_private',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='airportresources',
+            name='runways_in_use',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0006_airportresources_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aircraft',
+            index=models.Index(fields=['state'], name='aircraft_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='aircraft',
+            index=models.Index(fields=['type', 'state'], name='aircraft_type_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statechangelog',
+            index=models.Index(fields=['time'], name='log_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statechangelog',
+            index=models.Index(fields=['aircraft', 'time'], name='log_aircraft_time_idx'),
+        ),
+    ]
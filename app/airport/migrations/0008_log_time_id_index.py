@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0007_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='statechangelog',
+            name='log_time_idx',
+        ),
+        migrations.AddIndex(
+            model_name='statechangelog',
+            index=models.Index(fields=['time', 'id'], name='log_time_id_idx'),
+        ),
+    ]
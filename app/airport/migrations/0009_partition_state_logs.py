@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def partition_state_logs(apps, schema_editor):
+    # Native partitioning is PostgreSQL only, other databases keep plain table
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from airport.partitions import partition_table
+    partition_table(schema_editor.connection)
+
+
+def unpartition_state_logs(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    from airport.partitions import unpartition_table
+    unpartition_table(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0008_log_time_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_state_logs, unpartition_state_logs),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0009_partition_state_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='airportresources',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='airportresources',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+def index_positions(apps, schema_editor):
+    from airport.spatial import reindex
+
+    Aircraft = apps.get_model('airport', 'Aircraft')
+    reindex(Aircraft.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0010_airport_resources_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aircraft',
+            name='grid_cell',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(index_positions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='aircraft',
+            index=models.Index(fields=['grid_cell'], name='aircraft_grid_cell_idx'),
+        ),
+    ]
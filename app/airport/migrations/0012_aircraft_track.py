@@ -0,0 +1,22 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0011_aircraft_grid_cell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AircraftTrack',
+            fields=[
+                ('aircraft', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='track', serialize=False, to='airport.aircraft')),
+                ('fixes', models.BinaryField()),
+                ('head', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
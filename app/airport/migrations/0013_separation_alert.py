@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0012_aircraft_track'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeparationAlert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizontal_distance', models.FloatField()),
+                ('vertical_distance', models.FloatField()),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resolved', models.DateTimeField(blank=True, null=True)),
+                ('aircraft', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.aircraft')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airport.aircraft')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='separationalert',
+            constraint=models.UniqueConstraint(condition=models.Q(resolved__isnull=True), fields=('aircraft', 'other'), name='separation_alert_open_pair'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:07
+
+import airport.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0013_separation_alert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Airport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255, unique=True)),
+                ('runways', models.PositiveIntegerField(blank=True, null=True)),
+                ('large_parking_spots', models.PositiveIntegerField(blank=True, null=True)),
+                ('small_parking_spots', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='aircraft',
+            name='airport',
+            field=models.CharField(default=airport.models.default_airport, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='aircraft',
+            index=models.Index(fields=['airport', 'state'], name='aircraft_airport_state_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0014_airport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunwaySlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('airport', models.CharField(max_length=255)),
+                ('to_state', models.CharField(choices=[('PARKED', 'Parked'), ('TAKE_OFF', 'Take-off'), ('AIRBORNE', 'Airborne'), ('APPROACH', 'Approach'), ('LANDED', 'Landed')], max_length=50)),
+                ('requested', models.DateTimeField(default=django.utils.timezone.now)),
+                ('aircraft', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='runway_slot', to='airport.aircraft')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='runwayslot',
+            index=models.Index(fields=['airport', 'id'], name='runwayslot_airport_idx'),
+        ),
+    ]
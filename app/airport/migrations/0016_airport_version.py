@@ -0,0 +1,42 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_versions(apps, schema_editor):
+    AirportResources = apps.get_model('airport', 'AirportResources')
+    AirportVersion = apps.get_model('airport', 'AirportVersion')
+
+    AirportVersion.objects.bulk_create([
+        AirportVersion(location=resources.location, version=resources.version, modified=resources.modified)
+        for resources in AirportResources.objects.all()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0015_runway_slot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AirportVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255, unique=True)),
+                ('version', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.RunPython(copy_versions, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='airportresources',
+            name='modified',
+        ),
+        migrations.RemoveField(
+            model_name='airportresources',
+            name='version',
+        ),
+    ]
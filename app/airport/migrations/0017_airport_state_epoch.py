@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0016_airport_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AirportStateEpoch',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
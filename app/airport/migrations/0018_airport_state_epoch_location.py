@@ -0,0 +1,26 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:52
+
+from django.db import migrations, models
+
+
+def delete_epochs(apps, schema_editor):
+    # epoch shared by all airports, engines reload state of all of them
+    # after a restart anyway
+    apps.get_model('airport', 'AirportStateEpoch').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airport', '0017_airport_state_epoch'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_epochs, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='airportstateepoch',
+            name='location',
+            field=models.CharField(default='', max_length=255, unique=True),
+            preserve_default=False,
+        ),
+    ]
@@ -1,6 +1,48 @@
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 from django.utils import timezone
 
+from airport.spatial import grid_cell
+
+# Marks aircraft loaded without state or type, so occupied resource is not known
+UNKNOWN_RESOURCE = object()
+
+# Sent with `location` when a runway of the airport was released
+runway_released = Signal()
+
+# Capacity fields of Airport with settings used when they are not set
+CAPACITY_SETTINGS = {
+    'runways': ('AIRPORT_RUNAWAYS', 1),
+    'large_parking_spots': ('AIRPORT_LARGE_PARKING_SPOTS', 10),
+    'small_parking_spots': ('AIRPORT_SMALL_PARKING_SPOTS', 5),
+}
+
+
+def default_airport():
+    return settings.AIRPORT_LOCATION
+
+
+def default_capacity(name):
+    key, default = CAPACITY_SETTINGS[name]
+    return getattr(settings, key, default)
+
+
+def occupied_resource(state, aircraft_type):
+    """ Returns name of AirportResources counter which aircraft of given
+    type occupies in given state, or None."""
+
+    if state in ['TAKE_OFF', 'LANDED']:
+        return 'runways_in_use'
+    if state == 'APPROACH':
+        return 'on_approach'
+    if state == 'PARKED':
+        if aircraft_type == 'AIRLINER':
+            return 'parked_airliners'
+        return 'parked_private'
+    return None
+
 
 class Aircraft(models.Model):
     PARKED = 'PARKED'
@@ -41,9 +83,146 @@ class Aircraft(models.Model):
     altitude = models.IntegerField(default=0)
     heading = models.IntegerField(default=0)
 
+    # Cell of the position in the grid index, see `airport.spatial`
+    grid_cell = models.IntegerField(default=0)
+
+    # Location of the airport the aircraft belongs to. It is a plain key
+    # instead of a foreign key to Airport, so airports can be kept in
+    # separate databases and AIRPORT_LOCATION works without an Airport row.
+    airport = models.CharField(max_length=255, default=default_airport)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['state'], name='aircraft_state_idx'),
+            models.Index(fields=['type', 'state'], name='aircraft_type_state_idx'),
+            models.Index(fields=['grid_cell'], name='aircraft_grid_cell_idx'),
+            models.Index(fields=['airport', 'state'], name='aircraft_airport_state_idx'),
+        ]
+
     def __str__(self):
         return self.call_sign
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._track_occupied_resource()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._track_occupied_resource()
+
+    def _track_occupied_resource(self):
+        deferred = self.get_deferred_fields()
+        if 'state' in deferred or 'type' in deferred:
+            self._occupied_resource = UNKNOWN_RESOURCE
+        else:
+            self._occupied_resource = self.occupied_resource()
+
+    def occupied_resource(self):
+        """ Returns name of AirportResources counter which this aircraft
+        occupies in its current state, or None."""
+
+        return occupied_resource(self.state, self.type)
+
+    def update_grid_cell(self):
+        self.grid_cell = grid_cell(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields', None)
+
+        if update_fields is None:
+            self.update_grid_cell()
+        elif {'latitude', 'longitude'} & set(update_fields):
+            self.update_grid_cell()
+            kwargs['update_fields'] = update_fields = list(update_fields) + ['grid_cell']
+
+        occupancy_changed = update_fields is None or bool({'state', 'type'} & set(update_fields))
+
+        if self._state.adding:
+            released = None
+        else:
+            released = getattr(self, '_occupied_resource', UNKNOWN_RESOURCE)
+
+        if not occupancy_changed:
+            # position updates don't write the resources row intents lock
+            super().save(*args, **kwargs)
+            AirportVersion.bump_on_commit(self.airport)
+            return
+
+        # Resources row of the airport is written before the aircraft row,
+        # the order in which intents lock them
+        with transaction.atomic(savepoint=False):
+            occupied = self.occupied_resource()
+            if released is UNKNOWN_RESOURCE:
+                AirportResources.lock(self.airport)
+            elif released != occupied:
+                AirportResources.move(released=released, occupied=occupied, location=self.airport)
+            else:
+                AirportVersion.bump_on_commit(self.airport)
+
+            super().save(*args, **kwargs)
+
+            if released is UNKNOWN_RESOURCE:
+                AirportResources.recalculate(self.airport)
+            self._occupied_resource = occupied
+
+    def delete(self, *args, **kwargs):
+        released = getattr(self, '_occupied_resource', UNKNOWN_RESOURCE)
+
+        with transaction.atomic(savepoint=False):
+            if released is UNKNOWN_RESOURCE:
+                AirportResources.lock(self.airport)
+            else:
+                AirportResources.move(released=released, occupied=None, location=self.airport)
+
+            result = super().delete(*args, **kwargs)
+
+            if released is UNKNOWN_RESOURCE:
+                AirportResources.recalculate(self.airport)
+
+        return result
+
+
+class AircraftTrack(models.Model):
+    """
+    Recent positions of an aircraft, kept in a fixed size ring buffer packed
+    into a single binary column, see `airport.tracks`. `head` counts all
+    fixes ever recorded, the next fix is written to slot `head % size`.
+    """
+
+    aircraft = models.OneToOneField(Aircraft, on_delete=models.CASCADE, primary_key=True, related_name='track')
+    fixes = models.BinaryField()
+    head = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.aircraft_id)
+
+
+class SeparationAlert(models.Model):
+    """
+    Two aircraft in flight closer than separation minima, see
+    `airport.separation`. Alert is open while `resolved` is not set, only
+    one alert of a pair can be open.
+    """
+
+    aircraft = models.ForeignKey(Aircraft, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Aircraft, on_delete=models.CASCADE, related_name='+')
+    horizontal_distance = models.FloatField()
+    vertical_distance = models.FloatField()
+    started = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+    resolved = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['aircraft', 'other'],
+                condition=models.Q(resolved__isnull=True),
+                name='separation_alert_open_pair'
+            ),
+        ]
+
 
 class StateChangeLog(models.Model):
     OUTCOMES = [
@@ -56,3 +235,405 @@ class StateChangeLog(models.Model):
     outcome = models.CharField(max_length=10, choices=OUTCOMES)
     description = models.CharField(max_length=255)
     time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['time', 'id'], name='log_time_id_idx'),
+            models.Index(fields=['aircraft', 'time'], name='log_aircraft_time_idx'),
+        ]
+
+
+class Airport(models.Model):
+    """
+    Airport owning runways and parking spots. Aircraft, their occupancy
+    counters (`AirportResources`) and validation of intents are
+    partitioned by airport `location`, so airports don't wait for each
+    other and can be handled by separate workers.
+
+    Capacities which are not set fall back to `AIRPORT_RUNAWAYS`,
+    `AIRPORT_LARGE_PARKING_SPOTS` and `AIRPORT_SMALL_PARKING_SPOTS`, and
+    the airport of `AIRPORT_LOCATION` works without a row.
+    """
+
+    location = models.CharField(max_length=255, unique=True)
+
+    runways = models.PositiveIntegerField(null=True, blank=True)
+    large_parking_spots = models.PositiveIntegerField(null=True, blank=True)
+    small_parking_spots = models.PositiveIntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return self.location
+
+    @classmethod
+    def exists(cls, location):
+        return location == default_airport() or cls.objects.filter(location=location).exists()
+
+    @classmethod
+    def capacities(cls):
+        """ Returns `location -> {capacity: value}` of all airports with
+        defaults applied, including the default airport."""
+
+        capacities = {default_airport(): {name: default_capacity(name) for name in CAPACITY_SETTINGS}}
+
+        for airport in cls.objects.all():
+            capacities[airport.location] = {
+                name: default_capacity(name) if getattr(airport, name) is None else getattr(airport, name)
+                for name in CAPACITY_SETTINGS
+            }
+
+        return capacities
+
+
+class AirportResources(models.Model):
+    """
+    Row per airport guarding its runway, approach and parking spots.
+
+    Intents lock this row for the duration of their transaction, so
+    concurrent checks can't both pass. It is always locked before aircraft
+    rows and every change of aircraft state holds it, see `lock_for()`.
+
+    Occupancy counters are updated incrementally whenever an aircraft
+    changes state, so capacity checks read this single row instead of
+    counting aircraft. Rows are read together with capacities of their
+    `Airport`, so the checks need no other query.
+
+    Only changes of occupancy write this row, version of aircraft data
+    read by conditional requests is kept in `AirportVersion`.
+
+    Methods taking `location` work with the default airport
+    (`AIRPORT_LOCATION`) when it is not given.
+    """
+
+    COUNTERS = ('runways_in_use', 'on_approach', 'parked_airliners', 'parked_private')
+
+    location = models.CharField(max_length=255, unique=True)
+
+    runways_in_use = models.IntegerField(default=0)
+    on_approach = models.IntegerField(default=0)
+    parked_airliners = models.IntegerField(default=0)
+    parked_private = models.IntegerField(default=0)
+
+    def __str__(self):
+        return self.location
+
+    def parked(self, aircraft_type):
+        if aircraft_type == 'AIRLINER':
+            return self.parked_airliners
+        return self.parked_private
+
+    def capacity(self, name):
+        """ Returns capacity of the airport, `runways`,
+        `large_parking_spots` or `small_parking_spots`."""
+
+        if not hasattr(self, name):
+            airport = Airport.objects.filter(location=self.location).first()
+            for capacity in CAPACITY_SETTINGS:
+                setattr(self, capacity, getattr(airport, capacity, None))
+
+        value = getattr(self, name)
+        return default_capacity(name) if value is None else value
+
+    def parking_spots(self, aircraft_type):
+        if aircraft_type == 'AIRLINER':
+            return self.capacity('large_parking_spots')
+        return self.capacity('small_parking_spots')
+
+    @classmethod
+    def with_capacities(cls, queryset):
+        """ Annotates rows with capacities of their airport."""
+
+        airport = Airport.objects.filter(location=models.OuterRef('location'))
+
+        return queryset.annotate(**{
+            name: models.Subquery(airport.values(name)[:1])
+            for name in CAPACITY_SETTINGS
+        })
+
+    @classmethod
+    def current(cls, location=None):
+        resources, _ = cls.with_capacities(cls.objects.all()).get_or_create(
+            location=location or default_airport()
+        )
+
+        return resources
+
+    @classmethod
+    def lock(cls, location=None):
+        """
+        Locks resources of the airport until the end of current transaction.
+        Must be called inside `transaction.atomic()`.
+        """
+
+        resources, _ = cls.with_capacities(cls.objects.select_for_update()).get_or_create(
+            location=location or default_airport()
+        )
+
+        return resources
+
+    @classmethod
+    def lock_for(cls, call_sign, location=None):
+        """
+        Locks resources of the airport of the aircraft with `call_sign`, or
+        of `location` when there is no such aircraft, and loads the aircraft
+        with the same query. Returns `(resources, aircraft)`, aircraft is
+        None when there is no such aircraft.
+
+        Resources row is always locked before aircraft rows, so intents, the
+        ground crew and the runway queue can't deadlock. The aircraft row
+        itself is not locked, state of an aircraft is only changed holding
+        the resources lock of its airport. Must be called inside
+        `transaction.atomic()`.
+        """
+
+        aircraft = Aircraft.objects.filter(call_sign=call_sign)
+        fields = [field.attname for field in Aircraft._meta.concrete_fields]
+        location = location or default_airport()
+
+        resources = cls.with_capacities(cls.objects.select_for_update()).annotate(**{
+            f'aircraft_{name}': models.Subquery(aircraft.values(name)[:1])
+            for name in fields
+        }).filter(
+            location=Coalesce(
+                models.Subquery(aircraft.values('airport')[:1]),
+                models.Value(location, output_field=models.CharField())
+            )
+        ).first()
+
+        if resources is None:
+            # resources row of the airport doesn't exist yet
+            airport = aircraft.values_list('airport', flat=True).first()
+            resources = cls.lock(airport or location)
+            return resources, aircraft.first()
+
+        values = [resources.__dict__.pop(f'aircraft_{name}') for name in fields]
+        if values[fields.index('id')] is None:
+            return resources, None
+
+        return resources, Aircraft.from_db(resources._state.db, fields, values)
+
+    @classmethod
+    def move(cls, released=None, occupied=None, location=None):
+        """
+        Moves one aircraft from `released` to `occupied` counter with a
+        single UPDATE. Either of them can be None.
+        """
+
+        deltas = {}
+        if released:
+            deltas[released] = -1
+        if occupied:
+            deltas[occupied] = deltas.get(occupied, 0) + 1
+
+        cls.shift(location, **deltas)
+
+    @classmethod
+    def shift(cls, location=None, **deltas):
+        """
+        Adds `deltas` to counters with a single UPDATE, for example
+        `shift(runways_in_use=-2, parked_private=2)`, and bumps version of
+        the airport once committed. Called before the aircraft rows are
+        written, so a missing row is rebuilt from aircraft with `deltas`
+        added.
+        """
+
+        location = location or default_airport()
+        AirportVersion.bump_on_commit(location)
+
+        changes = {
+            counter: models.F(counter) + delta
+            for counter, delta in deltas.items() if delta
+        }
+        if not changes:
+            return
+
+        updated = cls.objects.filter(location=location).update(**changes)
+
+        if not updated:
+            cls.recalculate(location)
+            cls.objects.filter(location=location).update(**changes)
+
+        if deltas.get('runways_in_use', 0) < 0:
+            runway_released.send(sender=cls, location=location)
+
+    @classmethod
+    def count_occupancy(cls, location=None):
+        """
+        Counts occupancy by scanning aircraft of the airport. Used to
+        (re)build counters.
+        """
+
+        Count = models.Count
+        Q = models.Q
+
+        return Aircraft.objects.filter(airport=location or default_airport()).aggregate(
+            runways_in_use=Count('id', filter=Q(state__in=[Aircraft.TAKE_OFF, Aircraft.LANDED])),
+            on_approach=Count('id', filter=Q(state=Aircraft.APPROACH)),
+            parked_airliners=Count('id', filter=Q(state=Aircraft.PARKED, type='AIRLINER')),
+            parked_private=Count('id', filter=Q(state=Aircraft.PARKED) & ~Q(type='AIRLINER'))
+        )
+
+    @classmethod
+    def recalculate(cls, location=None):
+        """
+        Rebuilds counters from aircraft table. Needed after bulk operations
+        which bypass `Aircraft.save()`.
+        """
+
+        location = location or default_airport()
+        occupancy = cls.count_occupancy(location)
+        AirportVersion.bump_on_commit(location)
+
+        resources, created = cls.objects.get_or_create(location=location, defaults=occupancy)
+
+        if not created:
+            cls.objects.filter(pk=resources.pk).update(**occupancy)
+            for counter, value in occupancy.items():
+                setattr(resources, counter, value)
+
+        return resources
+
+    @classmethod
+    def recalculate_all(cls):
+        """ Rebuilds counters of all airports."""
+
+        locations = set(cls.objects.values_list('location', flat=True))
+        locations |= set(Aircraft.objects.values_list('airport', flat=True).distinct())
+        locations.add(default_airport())
+
+        for location in sorted(locations):
+            cls.recalculate(location)
+
+
+class AirportVersion(models.Model):
+    """
+    Version of aircraft data of an airport, so readers can tell whether
+    anything moved without reading aircraft.
+
+    `version` is incremented and `modified` set after every change of an
+    aircraft of the airport was committed. It is kept apart from
+    `AirportResources`, so position updates don't write the row intents
+    lock, and it is bumped after commit, so writers never hold this row
+    either. Readers may see the new data with the old version for a moment,
+    never the new version with the old data.
+    """
+
+    location = models.CharField(max_length=255, unique=True)
+    version = models.BigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.location
+
+    @classmethod
+    def bump(cls, location=None):
+        location = location or default_airport()
+        changes = {'version': models.F('version') + 1, 'modified': timezone.now()}
+
+        if cls.objects.filter(location=location).update(**changes):
+            return
+
+        # new row starts with a version of its own, so a sum of versions
+        # of all airports changes too
+        try:
+            with transaction.atomic():
+                cls.objects.create(location=location, version=1)
+        except IntegrityError:
+            # created by a concurrent bump
+            cls.objects.filter(location=location).update(**changes)
+
+    @classmethod
+    def bump_on_commit(cls, location=None):
+        """ Bumps version once the current transaction commits, right away
+        outside of a transaction."""
+
+        transaction.on_commit(lambda: cls.bump(location))
+
+    @classmethod
+    def version_of(cls, location=None):
+        """
+        Returns `(version, modified)` of the airport, or of all airports
+        together when `location` is None: sum of their versions, which
+        grows with every change of any of them, and the last modification.
+        """
+
+        if location:
+            state = cls.objects.filter(location=location).values('version', 'modified').first()
+            if state is None:
+                return 0, timezone.now()
+            return state['version'], state['modified']
+
+        state = cls.objects.aggregate(version=models.Sum('version'), modified=models.Max('modified'))
+        if state['modified'] is None:
+            return 0, timezone.now()
+
+        return state['version'], state['modified']
+
+
+class AirportStateEpoch(models.Model):
+    """
+    Counter of aircraft changes of an airport made outside of intent
+    backends (ground crew, runway queue, admin), shared by all processes.
+    In-memory engines poll epochs of all airports and reload state of the
+    airports whose epoch grew since their last reload.
+    """
+
+    location = models.CharField(max_length=255, unique=True)
+    epoch = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return self.location
+
+    @classmethod
+    def bump(cls, location=None):
+        """ Bumps epoch of the airport at `location`, or of all airports."""
+
+        if location is None:
+            locations = set(AirportResources.objects.values_list('location', flat=True))
+            locations.add(default_airport())
+        else:
+            locations = [location]
+
+        for location in sorted(locations):
+            if cls.objects.filter(location=location).update(epoch=models.F('epoch') + 1):
+                continue
+
+            try:
+                with transaction.atomic():
+                    cls.objects.create(location=location, epoch=1)
+            except IntegrityError:
+                # created by a concurrent bump
+                cls.objects.filter(location=location).update(epoch=models.F('epoch') + 1)
+
+    @classmethod
+    def bump_on_commit(cls, location=None):
+        """ Bumps epoch once the current transaction commits, so engines
+        never reload before the change is visible to them."""
+
+        transaction.on_commit(lambda: cls.bump(location))
+
+    @classmethod
+    def current(cls):
+        """ Returns `location -> epoch` of airports which were ever bumped."""
+
+        return dict(cls.objects.values_list('location', 'epoch'))
+
+
+class RunwaySlot(models.Model):
+    """
+    Intent to take off or land waiting in the runway queue of the airport,
+    see `airport.runway`. Aircraft has at most one slot, slots of an
+    airport are granted in order of `id`.
+    """
+
+    aircraft = models.OneToOneField(Aircraft, on_delete=models.CASCADE, related_name='runway_slot')
+    airport = models.CharField(max_length=255)
+    to_state = models.CharField(max_length=50, choices=Aircraft.STATUSES)
+    requested = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['airport', 'id'], name='runwayslot_airport_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.aircraft_id} {self.to_state}'
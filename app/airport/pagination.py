@@ -0,0 +1,124 @@
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_position(obj):
+    position = f'{obj.time.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_position(encoded):
+    try:
+        time, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|')
+        time = parse_datetime(time)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise NotFound('Invalid cursor')
+
+    if time is None:
+        raise NotFound('Invalid cursor')
+
+    return time, pk
+
+
+def after_position(queryset, time, pk):
+    """ Returns logs of the queryset written after keyset position
+    `(time, pk)`, oldest first."""
+
+    return queryset.filter(Q(time__gt=time) | Q(time=time, id__gt=pk)).order_by('time', 'id')
+
+
+class StateChangeLogPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination which switches to keyset pagination on
+    `(time, id)` when `cursor` or `since` query parameter is sent.
+
+    Keyset pages don't count all logs and don't scan skipped rows:
+
+    * `?cursor=` returns latest logs, newest first, and `next` link
+      pointing to older logs.
+    * `?since=<position>` returns logs written after given position,
+      oldest first, and `next` link which poller should call next time.
+      Empty `since` starts from the latest logs.
+    """
+
+    default_keyset_limit = 10
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_param = None
+
+        for param in (self.cursor_query_param, self.since_query_param):
+            if param in request.query_params:
+                self.keyset_param = param
+
+        if self.keyset_param is None:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request) or self.default_keyset_limit
+
+        position = request.query_params[self.keyset_param]
+
+        if self.keyset_param == self.since_query_param:
+            self.page = self.paginate_since(queryset, position)
+        else:
+            self.page = self.paginate_cursor(queryset, position)
+
+        return self.page
+
+    def paginate_cursor(self, queryset, position):
+        queryset = queryset.order_by('-time', '-id')
+
+        if position:
+            time, pk = decode_position(position)
+            queryset = queryset.filter(Q(time__lt=time) | Q(time=time, id__lt=pk))
+
+        page = list(queryset[:self.limit + 1])
+        self.has_next = len(page) > self.limit
+
+        return page[:self.limit]
+
+    def paginate_since(self, queryset, position):
+        if not position:
+            page = list(queryset.order_by('-time', '-id')[:self.limit])
+            page.reverse()
+        else:
+            time, pk = decode_position(position)
+            page = list(after_position(queryset, time, pk)[:self.limit])
+
+        self.since_position = encode_position(page[-1]) if page else position
+
+        return page
+
+    def get_next_link(self):
+        if self.keyset_param is None:
+            return super().get_next_link()
+
+        url = self.request.build_absolute_uri()
+
+        if self.keyset_param == self.since_query_param:
+            return replace_query_param(url, self.since_query_param, self.since_position)
+
+        if not self.has_next:
+            return None
+
+        return replace_query_param(url, self.cursor_query_param, encode_position(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        if self.keyset_param is None:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,319 @@
+"""
+Range partitioning of state change logs by time on PostgreSQL.
+
+`airport_statechangelog` is partitioned by `time` into daily or monthly
+partitions (`AIRPORT_LOG_PARTITION_INTERVAL`) named after the first day
+they hold, e.g. `airport_statechangelog_p202610` or
+`airport_statechangelog_p20261018`. Rows without a partition land in
+`airport_statechangelog_default`, which is emptied into new partitions as
+they are created.
+
+Partitions older than `AIRPORT_LOG_RETENTION_DAYS` are detached, which
+keeps them out of the indexes and vacuum of the live table, and renamed
+to `airport_statechangelog_archived_<suffix>`.
+"""
+import re
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from airport.serializers import get_setting
+
+TABLE = 'airport_statechangelog'
+DEFAULT_PARTITION = f'{TABLE}_default'
+ARCHIVED_PREFIX = f'{TABLE}_archived_'
+
+DAY = 'day'
+MONTH = 'month'
+
+PARTITION_NAME = re.compile(rf'^{TABLE}_p(\d{{8}}|\d{{6}})$')
+
+
+def get_interval():
+    interval = get_setting('AIRPORT_LOG_PARTITION_INTERVAL', MONTH)
+    if interval not in (DAY, MONTH):
+        raise ValueError(f'Unknown log partition interval {interval!r}')
+    return interval
+
+
+def period_start(moment, interval):
+    day = moment.astimezone(timezone.utc).date() if isinstance(moment, datetime) else moment
+    return day if interval == DAY else day.replace(day=1)
+
+
+def next_period(start, interval):
+    if interval == DAY:
+        return start + timedelta(days=1)
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(start, interval):
+    suffix = start.strftime('%Y%m%d' if interval == DAY else '%Y%m')
+    return f'{TABLE}_p{suffix}'
+
+
+def partition_range(name):
+    """ Returns (start, end) dates of partition with given name or None."""
+
+    match = PARTITION_NAME.match(name)
+    if not match:
+        return None
+
+    suffix = match.group(1)
+    if len(suffix) == 8:
+        start = datetime.strptime(suffix, '%Y%m%d').date()
+        return start, next_period(start, DAY)
+
+    start = datetime.strptime(suffix, '%Y%m').date()
+    return start, next_period(start, MONTH)
+
+
+def bound(day):
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def is_partitioned(connection):
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [TABLE])
+        row = cursor.fetchone()
+
+    return row is not None and row[0] == 'p'
+
+
+def attached_partitions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+            """,
+            [TABLE]
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def archived_partitions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT tablename FROM pg_tables WHERE tablename LIKE %s ORDER BY tablename",
+            [ARCHIVED_PREFIX.replace('_', '\\_') + '%']
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def create_partition(connection, start, end, name):
+    """ Creates partition for [start, end) and moves its rows out of the
+    default partition."""
+
+    qn = connection.ops.quote_name
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(name)} (LIKE {qn(TABLE)} INCLUDING DEFAULTS)')
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {qn(DEFAULT_PARTITION)} WHERE time >= %s AND time < %s RETURNING *
+            )
+            INSERT INTO {qn(name)} SELECT * FROM moved
+            """,
+            [bound(start), bound(end)]
+        )
+        cursor.execute(
+            f'ALTER TABLE {qn(TABLE)} ATTACH PARTITION {qn(name)} FOR VALUES FROM (%s) TO (%s)',
+            [bound(start), bound(end)]
+        )
+
+
+def ensure_partitions(connection, now=None, ahead=None, since=None):
+    """ Creates partitions from `since` (default: current period) up to
+    `ahead` periods in the future. Periods already covered by a partition,
+    also one of another interval, are skipped. Returns created names."""
+
+    interval = get_interval()
+    now = now or timezone.now()
+    ahead = get_setting('AIRPORT_LOG_PARTITIONS_AHEAD', 3) if ahead is None else ahead
+
+    existing = [
+        partition_range(name) for name in attached_partitions(connection)
+        if partition_range(name) is not None
+    ]
+
+    start = period_start(since or now, interval)
+    last = period_start(now, interval)
+    for _ in range(ahead):
+        last = next_period(last, interval)
+
+    created = []
+    while start <= last:
+        end = next_period(start, interval)
+        if not any(start < other_end and other_start < end for other_start, other_end in existing):
+            name = partition_name(start, interval)
+            create_partition(connection, start, end, name)
+            existing.append((start, end))
+            created.append(name)
+        start = end
+
+    return created
+
+
+def expired_partitions(connection, now=None, retention_days=None):
+    """ Returns names of attached partitions holding only logs older than
+    retention period."""
+
+    retention_days = get_setting('AIRPORT_LOG_RETENTION_DAYS', None) if retention_days is None else retention_days
+    if not retention_days:
+        return []
+
+    cutoff = (now or timezone.now()).astimezone(timezone.utc).date() - timedelta(days=retention_days)
+
+    return [
+        name for name in attached_partitions(connection)
+        if partition_range(name) is not None and partition_range(name)[1] <= cutoff
+    ]
+
+
+def archived_name(name):
+    return ARCHIVED_PREFIX + name[len(TABLE) + 2:]
+
+
+def detach_partition(connection, name):
+    """ Detaches partition and renames it to archived name. Foreign keys are
+    dropped, archived logs outlive aircraft which are removed later."""
+
+    qn = connection.ops.quote_name
+    archived = archived_name(name)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} DETACH PARTITION {qn(name)}')
+        cursor.execute(
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [name]
+        )
+        for constraint, in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {qn(name)} DROP CONSTRAINT {qn(constraint)}')
+        cursor.execute(f'ALTER TABLE {qn(name)} RENAME TO {qn(archived)}')
+
+    return archived
+
+
+def drop_archived_partition(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+
+
+def partition_table(connection):
+    """ Converts plain log table to partitioned one keeping its rows,
+    indexes, foreign keys and id sequence."""
+
+    qn = connection.ops.quote_name
+    old = f'{TABLE}_unpartitioned'
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE tablename = %s AND indexname <> %s
+            """,
+            [TABLE, f'{TABLE}_pkey']
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [TABLE]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])
+        sequence, = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} RENAME TO {qn(old)}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        for index, _ in indexes:
+            cursor.execute(f'DROP INDEX {qn(index)}')
+        cursor.execute(f'ALTER TABLE {qn(old)} RENAME CONSTRAINT {qn(TABLE + "_pkey")} TO {qn(old + "_pkey")}')
+
+        cursor.execute(
+            f"""
+            CREATE TABLE {qn(TABLE)} (
+                LIKE {qn(old)} INCLUDING DEFAULTS,
+                CONSTRAINT {qn(TABLE + '_pkey')} PRIMARY KEY (id, time)
+            ) PARTITION BY RANGE (time)
+            """
+        )
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(TABLE)}.id')
+        cursor.execute(f'CREATE TABLE {qn(DEFAULT_PARTITION)} PARTITION OF {qn(TABLE)} DEFAULT')
+        cursor.execute(f'SELECT min(time) FROM {qn(old)}')
+        first, = cursor.fetchone()
+
+    # partitions are created before rows are copied, so rows are routed
+    # directly and indexes are built once per partition afterwards
+    ensure_partitions(connection, since=first)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(TABLE)} SELECT * FROM {qn(old)}')
+        cursor.execute(f'DROP TABLE {qn(old)}')
+
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(name)} {definition}')
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+        # autovacuum never analyzes partitioned table itself
+        cursor.execute(f'ANALYZE {qn(TABLE)}')
+
+
+def unpartition_table(connection):
+    """ Reverts `partition_table`, attached partitions are merged back into
+    a plain table. Archived partitions are left untouched."""
+
+    qn = connection.ops.quote_name
+    old = f'{TABLE}_partitioned'
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname <> %s",
+            [TABLE, f'{TABLE}_pkey']
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [TABLE]
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [TABLE, 'id'])
+        sequence, = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {qn(TABLE)} RENAME TO {qn(old)}')
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        for index, _ in indexes:
+            cursor.execute(f'DROP INDEX {qn(index)}')
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(old)} DROP CONSTRAINT {qn(name)}')
+        cursor.execute(f'ALTER TABLE {qn(old)} RENAME CONSTRAINT {qn(TABLE + "_pkey")} TO {qn(old + "_pkey")}')
+
+        cursor.execute(
+            f"""
+            CREATE TABLE {qn(TABLE)} (
+                LIKE {qn(old)} INCLUDING DEFAULTS,
+                CONSTRAINT {qn(TABLE + '_pkey')} PRIMARY KEY (id)
+            )
+            """
+        )
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY {qn(TABLE)}.id')
+        cursor.execute(f'INSERT INTO {qn(TABLE)} SELECT * FROM {qn(old)}')
+        cursor.execute(f'DROP TABLE {qn(old)}')
+
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(name)} {definition}')
+        for _, definition in indexes:
+            cursor.execute(definition)
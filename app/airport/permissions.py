@@ -1,21 +1,27 @@
-from Crypto.PublicKey import RSA
-
 from rest_framework.permissions import BasePermission
 
+from airport.authentication import AircraftToken
 from airport.exceptions import InvalidPublicKey
+from airport.keystore import key_store
+
+
+class HasAircraftToken(BasePermission):
+    """Permission class which will check if request is authenticated
+    with a session token issued to the aircraft from the URL."""
+
+    def has_permission(self, request, view):
+        if not isinstance(request.auth, AircraftToken):
+            return False
+
+        return request.auth.call_sign == view.kwargs.get('call_sign')
 
 
 class IsValidPublicKey(BasePermission):
     """Custom permission class which will check if provided
     public key is in pair with used private key."""
 
-    def __init__(self):
-        self.private_key = None
-
     def has_permission(self, request, view):
-        with open("/keys/airport_ops_rsa") as private_key_file:
-            self.private_key = RSA.importKey(private_key_file.read())
-        if not self.private_key:
+        if not key_store.get_private_key():
             raise InvalidPublicKey()
 
         public_key_content = request.data.get('public_key', None)
@@ -23,9 +29,7 @@ class IsValidPublicKey(BasePermission):
         if not public_key_content:
             raise InvalidPublicKey()
 
-        public_key = RSA.importKey(public_key_content)
-
-        if not self.private_key.publickey() == public_key:
+        if not key_store.is_valid_public_key(public_key_content):
             raise InvalidPublicKey()
 
         return True
@@ -34,14 +38,4 @@ class IsValidPublicKey(BasePermission):
         """ This method will answer if given public key matches
         a given private key or not"""
 
-        private_key = None
-
-        with open("/keys/airport_ops_rsa") as private_key_file:
-            private_key = RSA.importKey(private_key_file.read())
-
-        if not private_key:
-            return False
-
-        public_key = RSA.importKey(public_key_content)
-
-        return private_key.publickey() == public_key
+        return key_store.is_valid_public_key(public_key_content)
@@ -0,0 +1,154 @@
+"""
+Runway queue.
+
+Intent to take off or land sent with `queue` while all runways of the
+airport are in use is not rejected. The aircraft gets a slot in the queue
+of its airport instead, answered with its position and an estimated slot
+time, so it doesn't have to retry.
+
+Whenever a runway is released the waiting slots are granted in order by
+the `runway_scheduler` task, as if the intents were sent again at that
+moment. Granted intents are
+written and logged like any other intent, so aircraft learn about them
+from the state change log stream. Slots which are no longer valid, for
+example when the aircraft moved on meanwhile, are dropped and logged as
+rejected.
+
+Estimated slot time assumes every aircraft ahead takes
+`AIRPORT_RUNWAY_SLOT_SECONDS` on one of the runways.
+"""
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from airport.admission import invalidate_airport_state
+from airport.exceptions import RunwayOccupied, StateConflict
+from airport.logwriter import write_state_log
+from airport.models import AirportResources, RunwaySlot
+from airport.serializers import AircraftSerializer, get_setting
+
+
+def queue_position(slot):
+    """ Returns 1-based position of the slot in the queue of its airport."""
+
+    return RunwaySlot.objects.filter(airport=slot.airport, id__lte=slot.id).count()
+
+
+def describe_slot(slot, resources=None):
+    """ Returns position and estimated time of the slot."""
+
+    resources = resources or AirportResources.current(slot.airport)
+    position = queue_position(slot)
+    turns = math.ceil(position / max(resources.capacity('runways'), 1))
+
+    return {
+        'state': slot.to_state,
+        'position': position,
+        'estimated_slot': timezone.now() + timedelta(seconds=turns * get_setting('AIRPORT_RUNWAY_SLOT_SECONDS', 60))
+    }
+
+
+def enqueue(aircraft, to_state):
+    """
+    Puts intent of the aircraft to the runway queue of its airport, an
+    aircraft already waiting keeps its position. Returns the slot, or None
+    when the queue is full. Queue of the airport is checked and changed
+    holding its resources lock, so concurrent intents can't overfill it.
+    """
+
+    with transaction.atomic():
+        AirportResources.lock(aircraft.airport)
+
+        slot = RunwaySlot.objects.filter(aircraft_id=aircraft.pk).first()
+        if slot is not None:
+            if slot.to_state != to_state:
+                slot.to_state = to_state
+                slot.save(update_fields=['to_state'])
+            return slot
+
+        if RunwaySlot.objects.filter(airport=aircraft.airport).count() >= get_setting('AIRPORT_RUNWAY_QUEUE_SIZE', 50):
+            return None
+
+        return RunwaySlot.objects.create(aircraft_id=aircraft.pk, airport=aircraft.airport, to_state=to_state)
+
+
+def grant_slot(slot, resources):
+    """
+    Validates and writes intent of the slot against locked `resources`.
+    Returns True when it was granted, False when it was dropped and None
+    when the runway is still occupied.
+    """
+
+    aircraft = slot.aircraft
+    serializer = AircraftSerializer(
+        data={
+            'call_sign': aircraft.call_sign,
+            'state': slot.to_state,
+            'type': None,
+            'airport': None,
+        },
+        context={'resources': resources, 'aircraft': aircraft}
+    )
+
+    try:
+        valid = serializer.is_valid()
+    except RunwayOccupied:
+        return None
+    except StateConflict as conflict:
+        slot.delete()
+        write_state_log(
+            aircraft=aircraft,
+            from_state=conflict.from_state,
+            to_state=conflict.to_state,
+            description=conflict.description,
+            outcome='REJECTED'
+        )
+        return False
+
+    slot.delete()
+    if not valid:
+        return False
+
+    aircraft = serializer.db_object
+    from_state = aircraft.state
+    aircraft.state = slot.to_state
+    aircraft.save(update_fields=['state'])
+
+    write_state_log(
+        aircraft=aircraft,
+        from_state=from_state,
+        to_state=aircraft.state,
+        description='Runway slot granted',
+        outcome='ACCEPTED'
+    )
+    return True
+
+
+def grant_slots(location):
+    """
+    Grants waiting slots of the airport in order while it has a free
+    runway, every slot in its own transaction. Returns number of granted
+    slots.
+    """
+
+    granted = 0
+
+    while True:
+        with transaction.atomic():
+            resources = AirportResources.lock(location)
+            slot = RunwaySlot.objects.filter(airport=location).select_related('aircraft').order_by('id').first()
+            if slot is None or resources.runways_in_use >= resources.capacity('runways'):
+                break
+
+            outcome = grant_slot(slot, resources)
+            if outcome is None:
+                break
+
+        granted += outcome
+
+    if granted:
+        invalidate_airport_state(location)
+
+    return granted
@@ -0,0 +1,196 @@
+"""
+Separation checks of flying aircraft.
+
+Positions of all aircraft in flight are loaded into NumPy arrays and
+projected to kilometres on a sphere of the Earth's radius, each aircraft
+by its own latitude and longitude. Aircraft are hashed into cubic cells
+with the side of the horizontal minimum, so aircraft closer than the
+minimum are in the same or a neighbouring cell and only those pairs are
+measured. Work grows with the number of aircraft and the
+number of close pairs instead of with all pairs.
+
+Pairs closer than `AIRPORT_SEPARATION_HORIZONTAL_KM` horizontally and
+`AIRPORT_SEPARATION_VERTICAL` vertically (in altitude units) are kept as
+open `SeparationAlert`s, which are resolved once the pair is separated.
+"""
+import itertools
+
+import numpy as np
+
+from django.db import transaction
+from django.utils import timezone
+
+from airport.models import Aircraft, SeparationAlert
+from airport.serializers import get_setting
+from airport.spatial import EARTH_RADIUS_KM
+
+FLYING_STATES = [Aircraft.TAKE_OFF, Aircraft.AIRBORNE, Aircraft.APPROACH]
+
+
+def get_minima():
+    return (
+        get_setting('AIRPORT_SEPARATION_HORIZONTAL_KM', 5.556),
+        get_setting('AIRPORT_SEPARATION_VERTICAL', 1000)
+    )
+
+
+def project(latitudes, longitudes):
+    """ Returns `(n, 3)` array of points in km on a sphere of the Earth's
+    radius. Straight distance between two points is shorter than along the
+    surface by about a metre at 100 km, at any latitude and across the
+    180th meridian."""
+
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+
+    return EARTH_RADIUS_KM * np.column_stack([
+        np.cos(latitudes) * np.cos(longitudes),
+        np.cos(latitudes) * np.sin(longitudes),
+        np.sin(latitudes)
+    ])
+
+
+def neighbour_cells(dimensions):
+    """ Returns offsets of cells checked against each cell, the cell itself
+    first. The other half of the neighbourhood is covered when the
+    neighbour is the cell."""
+
+    origin = (0,) * dimensions
+    offsets = itertools.product((-1, 0, 1), repeat=dimensions)
+
+    return [origin] + [offset for offset in offsets if offset > origin]
+
+
+def expand_pairs(first_starts, first_counts, second_starts, second_counts):
+    """ Returns indexes of all pairs of points between cells given by start
+    and size of their runs in sorted order."""
+
+    sizes = first_counts * second_counts
+    total = int(sizes.sum())
+    if not total:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    pair_cell = np.repeat(np.arange(len(sizes)), sizes)
+    offsets = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    width = second_counts[pair_cell]
+
+    return first_starts[pair_cell] + offsets // width, second_starts[pair_cell] + offsets % width
+
+
+def find_close_pairs(points, altitudes, horizontal, vertical):
+    """
+    Returns `(first, second, horizontal_distance, vertical_distance)`
+    arrays of all pairs of points closer than both minima. `points` is an
+    `(n, dimensions)` array of positions in km, `first` and `second` are
+    indexes into it with `first < second`.
+    """
+
+    empty = np.empty(0, dtype=np.int64)
+    if len(points) < 2:
+        return empty, empty, np.empty(0), np.empty(0)
+
+    cell = np.floor(points / horizontal).astype(np.int64)
+    cell -= cell.min(axis=0) - 1
+    # room for neighbours of the last cell in every dimension
+    sizes = cell.max(axis=0) + 2
+    strides = np.append(np.cumprod(sizes[:0:-1])[::-1], 1)
+    keys = cell @ strides
+
+    order = np.argsort(keys, kind='stable')
+    cells, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    firsts, seconds = [], []
+    for offset in neighbour_cells(points.shape[1]):
+        neighbours = cells + int(np.dot(offset, strides))
+        found = np.searchsorted(cells, neighbours)
+        found[found == len(cells)] = 0
+        exists = cells[found] == neighbours
+
+        first, second = expand_pairs(starts[exists], counts[exists],
+                                     starts[found[exists]], counts[found[exists]])
+        if not any(offset):
+            keep = first < second
+            first, second = first[keep], second[keep]
+
+        firsts.append(order[first])
+        seconds.append(order[second])
+
+    first, second = np.concatenate(firsts), np.concatenate(seconds)
+
+    horizontal_distance = np.linalg.norm(points[first] - points[second], axis=1)
+    vertical_distance = np.abs(altitudes[first] - altitudes[second])
+    close = (horizontal_distance < horizontal) & (vertical_distance < vertical)
+
+    first, second = first[close], second[close]
+    swap = first > second
+    first[swap], second[swap] = second[swap], first[swap]
+
+    return first, second, horizontal_distance[close], vertical_distance[close]
+
+
+def load_positions():
+    """ Returns ids and projected positions of all aircraft in flight."""
+
+    rows = Aircraft.objects.filter(state__in=FLYING_STATES).order_by('id').values_list(
+        'id', 'latitude', 'longitude', 'altitude'
+    )
+    positions = np.array(list(rows), dtype=np.float64).reshape(-1, 4)
+
+    ids = positions[:, 0].astype(np.int64)
+
+    return ids, project(positions[:, 1], positions[:, 2]), positions[:, 3]
+
+
+def check_separation(now=None):
+    """
+    Finds aircraft in flight which are too close and updates open alerts:
+    new conflicts are opened, ongoing ones get their last distances and
+    separated pairs are resolved. Returns number of open alerts.
+    """
+
+    now = now or timezone.now()
+    horizontal, vertical = get_minima()
+
+    ids, points, altitudes = load_positions()
+    first, second, horizontal_distance, vertical_distance = find_close_pairs(points, altitudes, horizontal, vertical)
+
+    # aircraft are loaded ordered by id, so pairs have the lower id first
+    conflicts = {
+        (int(ids[i]), int(ids[j])): (float(h), float(v))
+        for i, j, h, v in zip(first, second, horizontal_distance, vertical_distance)
+    }
+
+    with transaction.atomic():
+        open_alerts = {
+            (alert.aircraft_id, alert.other_id): alert
+            for alert in SeparationAlert.objects.select_for_update().filter(resolved__isnull=True)
+        }
+
+        resolved = [alert.pk for pair, alert in open_alerts.items() if pair not in conflicts]
+        if resolved:
+            SeparationAlert.objects.filter(pk__in=resolved).update(resolved=now)
+
+        ongoing = []
+        for pair, alert in open_alerts.items():
+            if pair in conflicts:
+                alert.horizontal_distance, alert.vertical_distance = conflicts[pair]
+                alert.last_seen = now
+                ongoing.append(alert)
+        if ongoing:
+            SeparationAlert.objects.bulk_update(
+                ongoing, ['horizontal_distance', 'vertical_distance', 'last_seen']
+            )
+
+        SeparationAlert.objects.bulk_create([
+            SeparationAlert(
+                aircraft_id=aircraft_id,
+                other_id=other_id,
+                horizontal_distance=horizontal_distance,
+                vertical_distance=vertical_distance,
+                started=now,
+                last_seen=now
+            )
+            for (aircraft_id, other_id), (horizontal_distance, vertical_distance) in conflicts.items()
+            if (aircraft_id, other_id) not in open_alerts
+        ], ignore_conflicts=True)
+
+    return len(conflicts)
@@ -1,10 +1,17 @@
 from django.conf import settings
+from django.db import transaction
 
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from airport.models import Aircraft, StateChangeLog
-from airport.exceptions import StateConflict
+from airport.models import Aircraft, Airport, AirportResources, StateChangeLog, default_airport
+from airport.exceptions import RunwayOccupied, StateConflict
+
+POSITION_FIELDS = ('longitude', 'latitude', 'altitude', 'heading')
+
+# States which occupy the runway, approach or a parking spot. Intents
+# into these states are processed holding the airport resources lock.
+RESOURCE_STATES = [Aircraft.TAKE_OFF, Aircraft.LANDED, Aircraft.APPROACH, Aircraft.PARKED]
 
 STATE_FLOW = {
     Aircraft.PARKED: [Aircraft.TAKE_OFF],
@@ -29,11 +36,12 @@ def get_setting(key, default):
 class AircraftSerializer(serializers.ModelSerializer):
 
     type = serializers.CharField(allow_null=True)
+    airport = serializers.CharField(max_length=255, required=False, allow_null=True)
 
     class Meta:
         model = Aircraft
         fields = ('id', 'call_sign', 'state', 'type', 'longitude', 'latitude',
-                  'altitude', 'heading')
+                  'altitude', 'heading', 'airport')
         read_only_fields = ('id',)
         optional_fields = ['type']
         extra_kwargs = {
@@ -46,33 +54,118 @@ class AircraftSerializer(serializers.ModelSerializer):
         }
 
     def is_valid(self, raise_exception=False):
+        """
+        Validates fields and airport rules. When rules are checked by an
+        admission backend passed in context as `admission`, only fields
+        are validated.
+        """
         valid = super().is_valid(raise_exception)
 
-        if valid:
-            try:
-                self.db_object = Aircraft.objects.get(call_sign=self.data['call_sign'])
-            except Aircraft.DoesNotExist:
-                self.db_object = None
+        if valid and self.context.get('admission', None) is None:
+            self.db_object = self.get_db_object()
 
             self.check_mandatory_type_for_new_aircraft()
+            self.check_airport()
             self.validate_next_state()
+
+            self.occupancy = self.get_occupancy()
+
             self.validate_empty_runway()
             self.validate_no_other_approaching()
             self.validate_parking_available()
 
         return valid
 
+    def get_db_object(self):
+        """
+        Returns aircraft with sent call sign or None. With in-memory state
+        engine passed in context as `engine`, or aircraft already loaded
+        with the resources lock passed as `aircraft`, the database is not
+        queried.
+        """
+
+        engine = self.context.get('engine', None)
+        if engine is not None:
+            return engine.get_aircraft(self.data['call_sign'])
+
+        if 'aircraft' in self.context:
+            return self.context['aircraft']
+
+        queryset = Aircraft.objects.all()
+        if not transaction.get_autocommit():
+            # Inside a transaction aircraft row stays locked until commit
+            queryset = queryset.select_for_update()
+
+        try:
+            return queryset.get(call_sign=self.data['call_sign'])
+        except Aircraft.DoesNotExist:
+            return None
+
+    def validate_airport(self, value):
+        return value or default_airport()
+
+    def get_airport(self):
+        """ Returns location of the airport whose resources the intent
+        claims, the one the aircraft belongs to."""
+
+        if self.db_object is None:
+            return self.validated_data.get('airport', None) or default_airport()
+        return self.db_object.airport
+
+    def get_aircraft_type(self):
+        if self.db_object is None:
+            return self.data['type']
+        return self.db_object.type
+
+    def get_from_state(self):
+        if self.db_object:
+            return self.db_object.state
+        return ''
+
+    def get_occupancy(self):
+        """
+        Returns AirportResources of the aircraft's airport with occupancy
+        counters. When the view already locked the resources row of that
+        airport it is passed in context as `resources` and reused. With
+        state engine its counters are used.
+        """
+
+        location = self.get_airport()
+
+        engine = self.context.get('engine', None)
+        if engine is not None:
+            return engine.occupancy(location)
+
+        resources = self.context.get('resources', None)
+        if resources is not None and resources.location == location:
+            return resources
+
+        if resources is not None or (self.data['state'] in RESOURCE_STATES and not transaction.get_autocommit()):
+            return AirportResources.lock(location)
+
+        return AirportResources.current(location)
+
     def check_mandatory_type_for_new_aircraft(self):
         new_aircraft = self.db_object is None
 
         if new_aircraft and not self.data['type']:
             raise ValidationError()
 
+    def check_airport(self):
+        """ New aircraft joins an existing airport, intent of an existing
+        aircraft can only be sent to its own airport."""
+
+        if self.db_object is None:
+            if not Airport.exists(self.get_airport()):
+                raise ValidationError({'airport': 'Unknown airport'})
+        elif self.initial_data.get('airport', None) not in (None, self.db_object.airport):
+            raise ValidationError({'airport': 'Aircraft belongs to another airport'})
+
     def validate_next_state(self):
         if self.db_object:
             aircraft = self.db_object
 
-            valid_next_states = STATE_FLOW.get(aircraft.state)
+            valid_next_states = STATE_FLOW.get(aircraft.state, [])
 
             if not self.data['state'] in valid_next_states:
                 raise StateConflict(
@@ -84,60 +177,38 @@ class AircraftSerializer(serializers.ModelSerializer):
 
     def validate_empty_runway(self):
         if self.data['state'] in [Aircraft.TAKE_OFF, Aircraft.LANDED]:
-            on_runway = Aircraft.objects.filter(
-                    state__in=[Aircraft.TAKE_OFF, Aircraft.LANDED]
-            ).count()
+            on_runway = self.occupancy.runways_in_use
 
-            RUNWAY_CONT = get_setting('AIRPORT_RUNAWAYS', 1)
+            RUNWAY_CONT = self.occupancy.capacity('runways')
 
             if on_runway > RUNWAY_CONT - 1:
-                from_state = ''
-                if self.db_object:
-                    from_state = self.db_object.state
-                raise StateConflict(
+                raise RunwayOccupied(
                     aircraft=self.db_object,
-                    from_state=from_state,
-                    to_state=self.data['state'],
-                    description='The runway is occupied'
+                    from_state=self.get_from_state(),
+                    to_state=self.data['state']
                 )
 
     def validate_no_other_approaching(self):
         if self.data['state'] == Aircraft.APPROACH:
-            try:
-                Aircraft.objects.get(state=Aircraft.APPROACH)
-                from_state = ''
-                if self.db_object:
-                    from_state = self.db_object.state
+            if self.occupancy.on_approach > 0:
                 raise StateConflict(
                     aircraft=self.db_object,
-                    from_state=from_state,
+                    from_state=self.get_from_state(),
                     to_state=self.data['state'],
                     description="Other aircraft is on approach"
                 )
-            except Aircraft.DoesNotExist:
-                pass
 
     def validate_parking_available(self):
-        if self.db_object is None:
-            type_to_check = self.data['type']
-        else:
-            type_to_check = self.db_object.type
+        type_to_check = self.get_aircraft_type()
 
-        parking_taken_count = Aircraft.objects.filter(
-                type=type_to_check, state='PARKED').count()
+        parking_taken_count = self.occupancy.parked(type_to_check)
 
-        if type_to_check == 'AIRLINER':
-            PARKING_PLACES = get_setting('AIRPORT_LARGE_PARKING_SPOTS', 10)
-        else:
-            PARKING_PLACES = get_setting('AIRPORT_SMALL_PARKING_SPOTS', 5)
+        PARKING_PLACES = self.occupancy.parking_spots(type_to_check)
 
         if parking_taken_count >= PARKING_PLACES:
-            from_state = ''
-            if self.db_object:
-                from_state = self.db_object.state
             raise StateConflict(
                 aircraft=self.db_object,
-                from_state=from_state,
+                from_state=self.get_from_state(),
                 to_state=self.data['state'],
                 description='No free parking spot'
             )
@@ -155,16 +226,51 @@ class LocationSerializer(serializers.ModelSerializer):
         }
 
     def is_valid(self, raise_exception=False):
+        """
+        Aircraft already loaded by the caller can be passed in context as
+        `aircraft` to avoid fetching it again.
+        """
         valid = super().is_valid(raise_exception)
 
         if valid:
-            from_db = Aircraft.objects.get(call_sign=self.data['call_sign'])
+            from_db = self.context.get('aircraft', None)
+            if from_db is None:
+                from_db = Aircraft.objects.get(call_sign=self.data['call_sign'])
             if self.data['type'] != from_db.type:
                 raise ValidationError()
 
         return valid
 
 
+class BoundingBoxSerializer(serializers.Serializer):
+    """ Query of aircraft inside a box. A box crossing the 180th meridian
+    has `min_longitude` greater than `max_longitude`."""
+
+    min_latitude = serializers.FloatField(min_value=-90, max_value=90)
+    min_longitude = serializers.FloatField(min_value=-180, max_value=180)
+    max_latitude = serializers.FloatField(min_value=-90, max_value=90)
+    max_longitude = serializers.FloatField(min_value=-180, max_value=180)
+
+    def validate(self, data):
+        if data['min_latitude'] > data['max_latitude']:
+            raise ValidationError()
+        return data
+
+
+class ProximitySerializer(serializers.Serializer):
+    """ Query of aircraft within `distance` km of a position, the airport
+    by default."""
+
+    distance = serializers.FloatField(min_value=0, max_value=20038)
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False)
+
+    def validate(self, data):
+        data.setdefault('latitude', get_setting('AIRPORT_LATITUDE', 0))
+        data.setdefault('longitude', get_setting('AIRPORT_LONGITUDE', 0))
+        return data
+
+
 class StateChangeLogSerializer(serializers.ModelSerializer):
     aircraft = serializers.SlugRelatedField(many=False, read_only=True, slug_field='call_sign')
 
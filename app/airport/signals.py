@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from airport.models import StateChangeLog, runway_released
+from airport.tasks import request_runway_grants
+from airport.streaming import publish_state_logs
+
+
+@receiver(post_save, sender=StateChangeLog)
+def publish_created_state_log(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: publish_state_logs([instance]))
+
+
+@receiver(runway_released)
+def grant_runway_slots(sender, location, **kwargs):
+    transaction.on_commit(lambda: request_runway_grants(location))
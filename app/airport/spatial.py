@@ -0,0 +1,195 @@
+"""
+Grid index of aircraft positions.
+
+The world is divided into cells of `AIRPORT_GRID_CELL_SIZE` degrees and
+every aircraft stores number of the cell it is in (`Aircraft.grid_cell`),
+kept up to date whenever its position is saved. Cells are numbered row by
+row from south-west, so cells of one row of a bounding box form a single
+range and a query reads only index ranges of the cells it covers before
+checking exact coordinates.
+"""
+import math
+
+from django.conf import settings
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Cast, Floor, Greatest, Least
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Boxes spanning more rows than this are filtered by coordinates only,
+# they cover a large part of the table anyway
+MAX_CELL_ROWS = 200
+
+
+def cell_size():
+    return getattr(settings, 'AIRPORT_GRID_CELL_SIZE', 0.1)
+
+
+def grid_shape(size):
+    """ Returns number of rows and columns of the grid."""
+
+    return math.ceil(180 / size), math.ceil(360 / size)
+
+
+def clamp(value, lowest, highest):
+    return min(max(value, lowest), highest)
+
+
+def cell_row(latitude, size):
+    rows, _ = grid_shape(size)
+    return clamp(math.floor((latitude + 90) / size), 0, rows - 1)
+
+
+def cell_column(longitude, size):
+    _, columns = grid_shape(size)
+    return clamp(math.floor((longitude + 180) / size), 0, columns - 1)
+
+
+def grid_cell(latitude, longitude, size=None):
+    """ Returns number of the cell containing given position."""
+
+    size = size or cell_size()
+    _, columns = grid_shape(size)
+
+    return cell_row(latitude, size) * columns + cell_column(longitude, size)
+
+
+def grid_cell_expression(size=None):
+    """ Returns database expression computing `grid_cell` from aircraft
+    coordinates the same way as `grid_cell()`, to index many aircraft with
+    a single UPDATE."""
+
+    size = size or cell_size()
+    rows, columns = grid_shape(size)
+
+    row = Least(Greatest(Floor((F('latitude') + Value(90)) / Value(size)), Value(0)), Value(rows - 1))
+    column = Least(Greatest(Floor((F('longitude') + Value(180)) / Value(size)), Value(0)), Value(columns - 1))
+
+    return Cast(row * Value(columns) + column, output_field=IntegerField())
+
+
+def reindex(queryset, size=None):
+    """ Recomputes grid cells of all aircraft in `queryset`."""
+
+    return queryset.update(grid_cell=grid_cell_expression(size))
+
+
+def cell_ranges(min_latitude, min_longitude, max_latitude, max_longitude, size=None):
+    """
+    Returns `(first, last)` ranges of cells covering the bounding box, one
+    per row, or None when the box spans more than `MAX_CELL_ROWS` rows.
+    Longitudes must not wrap around, see `longitude_spans()`.
+    """
+
+    size = size or cell_size()
+    _, columns = grid_shape(size)
+
+    first_row, last_row = cell_row(min_latitude, size), cell_row(max_latitude, size)
+    if last_row - first_row >= MAX_CELL_ROWS:
+        return None
+
+    first_column, last_column = cell_column(min_longitude, size), cell_column(max_longitude, size)
+
+    if first_column == 0 and last_column == columns - 1:
+        # whole rows are one contiguous range
+        return [(first_row * columns, last_row * columns + last_column)]
+
+    return [
+        (row * columns + first_column, row * columns + last_column)
+        for row in range(first_row, last_row + 1)
+    ]
+
+
+def longitude_spans(min_longitude, max_longitude):
+    """ Splits longitudes of a box crossing the 180th meridian, given as
+    `min_longitude > max_longitude`, into two boxes."""
+
+    if min_longitude <= max_longitude:
+        return [(min_longitude, max_longitude)]
+
+    return [(min_longitude, 180), (-180, max_longitude)]
+
+
+def bounding_box_filter(min_latitude, min_longitude, max_latitude, max_longitude, size=None):
+    """ Returns Q matching aircraft inside the bounding box, which reads
+    only grid cells the box covers."""
+
+    condition = Q(pk__in=[])
+
+    for west, east in longitude_spans(min_longitude, max_longitude):
+        span = Q(
+            latitude__gte=min_latitude,
+            latitude__lte=max_latitude,
+            longitude__gte=west,
+            longitude__lte=east
+        )
+
+        ranges = cell_ranges(min_latitude, west, max_latitude, east, size)
+        if ranges is not None:
+            cells = Q(pk__in=[])
+            for first, last in ranges:
+                cells |= Q(grid_cell__range=(first, last))
+            span &= cells
+
+        condition |= span
+
+    return condition
+
+
+def within_bounding_box(queryset, min_latitude, min_longitude, max_latitude, max_longitude):
+    return queryset.filter(bounding_box_filter(min_latitude, min_longitude, max_latitude, max_longitude))
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """ Returns great-circle distance between two positions."""
+
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, distance):
+    """ Returns `(min_latitude, min_longitude, max_latitude, max_longitude)`
+    of a box containing all positions within `distance` km. Longitudes are
+    wrapped around the 180th meridian when needed."""
+
+    d_latitude = distance / KM_PER_DEGREE
+    min_latitude, max_latitude = latitude - d_latitude, latitude + d_latitude
+
+    if min_latitude <= -90 or max_latitude >= 90:
+        # the circle contains a pole, all longitudes
+        return max(min_latitude, -90), -180, min(max_latitude, 90), 180
+
+    # widest at latitude of the box edge closest to a pole
+    widest = max(abs(min_latitude), abs(max_latitude))
+    d_longitude = distance / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    if d_longitude >= 180:
+        return min_latitude, -180, max_latitude, 180
+
+    min_longitude, max_longitude = longitude - d_longitude, longitude + d_longitude
+    if min_longitude < -180:
+        min_longitude += 360
+    if max_longitude > 180:
+        max_longitude -= 360
+
+    return min_latitude, min_longitude, max_latitude, max_longitude
+
+
+def within_distance(queryset, latitude, longitude, distance):
+    """ Returns `(aircraft, distance)` of aircraft in `queryset` within
+    `distance` km of the position, closest first."""
+
+    candidates = within_bounding_box(queryset, *bounding_box(latitude, longitude, distance))
+
+    found = []
+    for aircraft in candidates:
+        aircraft_distance = distance_km(latitude, longitude, aircraft.latitude, aircraft.longitude)
+        if aircraft_distance <= distance:
+            found.append((aircraft, aircraft_distance))
+
+    found.sort(key=lambda pair: pair[1])
+    return found
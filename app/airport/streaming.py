@@ -0,0 +1,334 @@
+"""
+Streaming of state change logs to subscribers as server-sent events.
+
+Every written StateChangeLog is published once to a broker. Each ASGI
+process keeps a single subscription to the broker and fans messages out
+to all of its connected clients, so N viewers cost one producer instead
+of N polling queries.
+
+Brokers:
+
+* `local` - in-process, useful when logs are written by the same process
+  which serves the stream (runserver, tests).
+* `redis` - Redis pub/sub, used when logs are written by other processes
+  (API workers, Celery).
+
+Event ids are keyset positions of the logs (see `airport.pagination`). A
+reconnecting client sends the last one it has seen as `Last-Event-ID`
+header (EventSource does that on its own) or `last_event_id` query
+parameter, and logs written meanwhile are sent before the new ones. A
+subscriber which can't keep up with published logs is disconnected, so
+its client reconnects and resumes the same way instead of losing logs.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from urllib.parse import parse_qs
+
+import redis
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from rest_framework.exceptions import NotFound
+
+from airport.models import StateChangeLog
+from airport.pagination import after_position, decode_position, encode_position
+from airport.serializers import StateChangeLogSerializer, get_setting
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = '/api/state_logs/stream/'
+
+# put into a subscriber's queue in place of the messages it couldn't keep up with
+OVERFLOW = object()
+
+
+class Broadcaster:
+    """Fans out published messages to subscribers' asyncio queues.
+
+    Safe to call `fanout` from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self):
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=get_setting('AIRPORT_STREAM_QUEUE_SIZE', 100))
+        subscriber = (loop, queue)
+
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def fanout(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            loop, _ = subscriber
+            try:
+                loop.call_soon_threadsafe(self._put, subscriber, message)
+            except RuntimeError:
+                # loop of disconnected subscriber is already closed
+                self.unsubscribe(subscriber)
+
+    def _put(self, subscriber, message):
+        _, queue = subscriber
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # slow subscriber is disconnected instead of slowing down others,
+            # its client resumes from the last event it has got
+            self.unsubscribe(subscriber)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(OVERFLOW)
+            logger.warning('State log stream subscriber is too slow, disconnecting it')
+
+
+class LocalBroker:
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+
+    def publish(self, message):
+        self.broadcaster.fanout(message)
+
+    def start(self):
+        pass
+
+
+class RedisBroker:
+    """Publishes to Redis channel and runs a single subscriber thread per
+    process which feeds the broadcaster."""
+
+    def __init__(self, broadcaster, url, channel):
+        self.broadcaster = broadcaster
+        self.url = url
+        self.channel = channel
+        self._client = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    def publish(self, message):
+        self.client.publish(self.channel, message)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._listen, name='state-log-stream', daemon=True)
+            self._thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for item in pubsub.listen():
+                    data = item['data']
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    self.broadcaster.fanout(data)
+            except redis.RedisError:
+                logger.exception('State log stream lost connection to Redis, reconnecting')
+                threading.Event().wait(1)
+
+
+broadcaster = Broadcaster()
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+
+    with _broker_lock:
+        if _broker is None:
+            backend = get_setting('AIRPORT_STREAM_BACKEND', 'local')
+            if backend == 'redis':
+                _broker = RedisBroker(
+                    broadcaster,
+                    url=get_setting('AIRPORT_STREAM_REDIS_URL', settings.CELERY_BROKER_URL),
+                    channel=get_setting('AIRPORT_STREAM_CHANNEL', 'airport:state_logs')
+                )
+            else:
+                _broker = LocalBroker(broadcaster)
+
+    return _broker
+
+
+def reset_broker():
+    global _broker
+
+    with _broker_lock:
+        _broker = None
+
+
+def format_event(log):
+    return json.dumps({
+        'id': encode_position(log),
+        'data': StateChangeLogSerializer(log).data
+    }, cls=DjangoJSONEncoder)
+
+
+def publish_state_logs(logs):
+    """ Publishes given logs to stream subscribers. Errors are logged and
+    never propagated to the writer of the logs."""
+
+    try:
+        broker = get_broker()
+        for log in logs:
+            broker.publish(format_event(log))
+    except Exception:
+        logger.exception('Publishing state change logs to stream failed')
+
+
+def last_event_position(scope):
+    """ Returns keyset position of the last event the client has seen, or
+    None when it wasn't sent or is not valid."""
+
+    headers = dict(scope.get('headers', []))
+    last_event_id = headers.get(b'last-event-id', b'').decode('latin-1')
+
+    if not last_event_id:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        last_event_id = query.get('last_event_id', [''])[0]
+
+    if not last_event_id:
+        return None
+
+    try:
+        return decode_position(last_event_id)
+    except NotFound:
+        return None
+
+
+def missed_events(position, limit):
+    """ Returns up to `limit` messages of logs written after `position`,
+    oldest first."""
+
+    # runs in a worker thread outside of request cycle, which would
+    # otherwise close its connection
+    close_old_connections()
+    try:
+        logs = after_position(StateChangeLog.objects.select_related('aircraft'), *position)
+        return [format_event(log) for log in logs[:limit]]
+    finally:
+        close_old_connections()
+
+
+def event_id(message):
+    return json.loads(message)['id']
+
+
+def event_position(message):
+    return decode_position(event_id(message))
+
+
+def encode_sse(message):
+    event = json.loads(message)
+    return (
+        f"id: {event['id']}\n"
+        f"event: state_log\n"
+        f"data: {json.dumps(event['data'])}\n\n"
+    ).encode()
+
+
+async def state_log_stream(scope, receive, send):
+    """ ASGI application streaming new state change logs as server-sent
+    events. Clients which were disconnected get logs they missed first,
+    see `last_event_position()`. The stream ends when the client falls
+    behind published logs, see `Broadcaster`."""
+
+    if scope['type'] != 'http' or scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    get_broker().start()
+    # subscribed before missed logs are read, so none falls in between
+    subscriber = broadcaster.subscribe()
+    _, queue = subscriber
+    keepalive = get_setting('AIRPORT_STREAM_KEEPALIVE', 15)
+    position = last_event_position(scope)
+    # ids of missed logs sent, which may be published while they are read
+    replayed = deque(maxlen=get_setting('AIRPORT_STREAM_DEDUPE_WINDOW', 1000))
+
+    disconnected = asyncio.ensure_future(receive_disconnect(receive))
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+
+        if position is not None:
+            limit = get_setting('AIRPORT_STREAM_REPLAY_BATCH_SIZE', 100)
+            while not disconnected.done():
+                missed = await sync_to_async(missed_events)(position, limit)
+                for message in missed:
+                    await send({'type': 'http.response.body', 'body': encode_sse(message), 'more_body': True})
+                    replayed.append(event_id(message))
+                if missed:
+                    position = event_position(missed[-1])
+                if len(missed) < limit:
+                    break
+
+        while not disconnected.done():
+            message = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                [message, disconnected],
+                timeout=keepalive,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if message in done:
+                if message.result() is OVERFLOW:
+                    await send({'type': 'http.response.body', 'body': b''})
+                    break
+                if event_id(message.result()) in replayed:
+                    # already sent with missed logs
+                    continue
+                await send({'type': 'http.response.body', 'body': encode_sse(message.result()), 'more_body': True})
+            else:
+                message.cancel()
+                if not disconnected.done():
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        disconnected.cancel()
+
+
+async def receive_disconnect(receive):
+    while True:
+        event = await receive()
+        if event['type'] == 'http.disconnect':
+            return
@@ -1,22 +1,182 @@
+import logging
+
 from celery import shared_task
+from celery.signals import worker_process_shutdown
+
+from django.core.management import call_command
+from django.db import connection, transaction
+
+from airport.admission import invalidate_airport_state
+from airport.logwriter import flush_state_logs, write_state_logs
+from airport.models import Aircraft, AirportResources, RunwaySlot, StateChangeLog
+from airport.partitions import is_partitioned
+from airport.runway import grant_slots
+from airport.separation import check_separation
+
+logger = logging.getLogger(__name__)
+
+# Key of PostgreSQL advisory lock held by a running ground crew routine,
+# the second key is the hash of the airport location
+GROUND_CREW_LOCK = 7301
+
+
+def try_lock_ground_crew(location):
+    """ Takes advisory lock of the ground crew of the airport until the end
+    of current transaction, returns False if another run holds it. Other
+    databases serialize runs on the airport resources lock."""
+
+    if connection.vendor != 'postgresql':
+        return True
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))', [GROUND_CREW_LOCK, location])
+        return cursor.fetchone()[0]
+
+
+def landed_with_free_spot(resources):
+    """ Returns ids of landed aircraft of the airport, oldest first, up to
+    number of free parking spots of their type."""
+
+    landed = Aircraft.objects.filter(airport=resources.location, state=Aircraft.LANDED).order_by('id')
+    free_airliner_spots = resources.parking_spots('AIRLINER') - resources.parked_airliners
+    free_private_spots = resources.parking_spots('PRIVATE') - resources.parked_private
+
+    ids = []
+    if free_airliner_spots > 0:
+        ids += landed.filter(type='AIRLINER').values_list('id', flat=True)[:free_airliner_spots]
+    if free_private_spots > 0:
+        ids += landed.exclude(type='AIRLINER').values_list('id', flat=True)[:free_private_spots]
+
+    return ids
+
+
+def park(ids):
+    """ Parks landed aircraft with given ids, returns `(id, type)` of those
+    which were still landed."""
+
+    if connection.vendor == 'postgresql':
+        table = connection.ops.quote_name(Aircraft._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET state = %s WHERE id = ANY(%s) AND state = %s RETURNING id, type',
+                [Aircraft.PARKED, ids, Aircraft.LANDED]
+            )
+            return cursor.fetchall()
+
+    landed = Aircraft.objects.select_for_update().filter(pk__in=ids, state=Aircraft.LANDED)
+    parked = list(landed.values_list('id', 'type'))
+    Aircraft.objects.filter(pk__in=[pk for pk, _ in parked]).update(state=Aircraft.PARKED)
+    return parked
+
+
+def park_landed(location):
+    """
+    Parks all landed aircraft of the airport which have a free parking spot
+    of their type in one transaction, oldest first. Returns number of parked
+    aircraft, or None when another run is in progress at the airport.
+    """
+
+    with transaction.atomic():
+        if not try_lock_ground_crew(location):
+            return None
+
+        resources = AirportResources.lock(location)
+
+        ids = landed_with_free_spot(resources)
+        parked = park(ids) if ids else []
 
-from airport.models import Aircraft, StateChangeLog
+        if parked:
+            airliners = sum(1 for _, aircraft_type in parked if aircraft_type == 'AIRLINER')
+            AirportResources.shift(
+                location,
+                runways_in_use=-len(parked),
+                parked_airliners=airliners,
+                parked_private=len(parked) - airliners
+            )
+
+            write_state_logs([
+                StateChangeLog(
+                    aircraft_id=pk,
+                    from_state=Aircraft.LANDED,
+                    to_state=Aircraft.PARKED,
+                    outcome='ACCEPTED',
+                    description='Paked by ground crew'
+                )
+                for pk, _ in parked
+            ])
+
+    return len(parked)
 
 
 @shared_task
-def ground_crew_routine():
-    aircraft = Aircraft.objects.filter(
-            state=Aircraft.LANDED
-    ).first()
-
-    if aircraft:
-        aircraft.state = Aircraft.PARKED
-        aircraft.save()
-
-        StateChangeLog.objects.create(
-            aircraft=aircraft,
-            from_state=Aircraft.LANDED,
-            to_state=Aircraft.PARKED,
-            outcome='ACCEPTED',
-            description='Paked by ground crew'
+def ground_crew_routine(location=None):
+    """
+    Parks landed aircraft at every airport which has some, or only at the
+    airport of given `location`. Airports are handled in separate
+    transactions. Returns number of parked aircraft, or None when runs at
+    all the airports were in progress.
+    """
+
+    if location is None:
+        locations = list(
+            Aircraft.objects.filter(state=Aircraft.LANDED).values_list('airport', flat=True).distinct()
         )
+    else:
+        locations = [location]
+
+    results = [park_landed(airport) for airport in locations]
+    parked = [result for result in results if result is not None]
+
+    for airport, result in zip(locations, results):
+        if result:
+            invalidate_airport_state(airport)
+
+    if results and not parked:
+        return None
+
+    return sum(parked)
+
+
+@shared_task
+def runway_scheduler(location=None):
+    """ Grants waiting runway slots at every airport which has some, or
+    only at the airport of given `location`. It is requested right after a
+    runway is released and runs periodically to catch up on grants which
+    failed then. Returns number of granted slots."""
+
+    if location is None:
+        locations = list(RunwaySlot.objects.values_list('airport', flat=True).distinct())
+    else:
+        locations = [location]
+
+    return sum(grant_slots(airport) for airport in locations)
+
+
+def request_runway_grants(location):
+    """ Enqueues granting of waiting slots once a runway of the airport was
+    released. Called after the releasing change was committed, so failures
+    are logged instead of failing it."""
+
+    try:
+        if RunwaySlot.objects.filter(airport=location).exists():
+            runway_scheduler.delay(location)
+    except Exception:
+        logger.exception('Requesting runway slot grants at %s failed', location)
+
+
+@shared_task
+def separation_check():
+    return check_separation()
+
+
+@shared_task
+def manage_log_partitions():
+    if is_partitioned(connection):
+        call_command('manage_log_partitions')
+
+
+@worker_process_shutdown.connect
+def flush_state_logs_on_shutdown(**kwargs):
+    # pool processes exit without running atexit handlers. Spool files of
+    # other processes are left to them, they could still be running
+    flush_state_logs()
@@ -0,0 +1,271 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+import redis
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.admission import get_redis_admission, reset_redis_admission
+from airport.engine import load_airport_state
+from airport.models import Aircraft, Airport, AirportResources, RunwaySlot, StateChangeLog, default_airport
+from airport.tasks import ground_crew_routine
+
+REDIS_URL = getattr(settings, 'AIRPORT_ADMISSION_REDIS_URL', None) or settings.CELERY_BROKER_URL
+KEY_PREFIX = 'airport-test'
+PARALLEL_INTENTS = 8
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5).ping()
+    except redis.RedisError:
+        return False
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class RedisAdmissionMixin:
+
+    def setUp(self):
+        self.settings_override = override_settings(
+            AIRPORT_INTENT_BACKEND='redis',
+            AIRPORT_ADMISSION_REDIS_URL=REDIS_URL,
+            AIRPORT_ADMISSION_KEY_PREFIX=KEY_PREFIX,
+            AIRPORT_RUNAWAYS=1
+        )
+        self.settings_override.enable()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+        reset_redis_admission()
+
+    def tearDown(self):
+        admission = get_redis_admission()
+        keys = list(admission.client.scan_iter(match=f'{KEY_PREFIX}:*'))
+        if keys:
+            admission.client.delete(*keys)
+        reset_redis_admission()
+        self.patcher.stop()
+        self.settings_override.disable()
+
+    def post_intent(self, call_sign, payload, client=None):
+        client = client or APIClient()
+        return client.post(f'/api/{call_sign}/intent/', dict(payload, public_key='valid public key'))
+
+
+@skipUnless(redis_available(), 'Redis is not available')
+class RedisAdmissionTests(RedisAdmissionMixin, TestCase):
+
+    def counters(self):
+        admission = get_redis_admission()
+        return {
+            key.decode(): int(value)
+            for key, value in admission.client.hgetall(admission.counters_key(default_airport())).items()
+        }
+
+    def test_admitted_intent_is_written_to_database(self):
+        create_aircraft('CS1', state='PARKED')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'TAKE_OFF')
+        self.assertEqual(AirportResources.current().runways_in_use, 1)
+        self.assertEqual(self.counters()['runways_in_use'], 1)
+        self.assertEqual(self.counters()['parked_airliners'], 0)
+        self.assertEqual(StateChangeLog.objects.get().outcome, 'ACCEPTED')
+
+    def test_new_aircraft_is_admitted(self):
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'intent': 'APPROACH'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Aircraft.objects.get(call_sign='NEW1').state, 'APPROACH')
+        self.assertEqual(StateChangeLog.objects.get().from_state, 'AIRBORNE')
+
+        # id of the new aircraft is known to the next admission
+        self.assertEqual(self.post_intent('NEW1', {'state': 'LANDED'}).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(StateChangeLog.objects.filter(aircraft__call_sign='NEW1').count(), 2)
+
+    def test_new_aircraft_without_type_is_invalid(self):
+        response = self.post_intent('NEW1', {'state': 'AIRBORNE'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Aircraft.objects.exists())
+
+    def test_invalid_state_change_is_rejected_and_logged(self):
+        aircraft = create_aircraft('CS1', state='PARKED')
+
+        response = self.post_intent('CS1', {'state': 'LANDED'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        log = StateChangeLog.objects.get()
+        self.assertEqual((log.aircraft, log.outcome, log.description),
+                         (aircraft, 'REJECTED', 'Not a valid state change'))
+
+    def test_occupied_runway_is_rejected(self):
+        create_aircraft('CS1', state='PARKED')
+        create_aircraft('CS2', state='TAKE_OFF')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(StateChangeLog.objects.get().description, 'The runway is occupied')
+
+    def test_intent_waits_for_occupied_runway(self):
+        create_aircraft('CS1', state='PARKED')
+        create_aircraft('CS2', state='TAKE_OFF')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF', 'queue': True})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['position'], 1)
+        self.assertEqual(RunwaySlot.objects.get().aircraft.call_sign, 'CS1')
+        self.assertFalse(StateChangeLog.objects.exists())
+
+    @override_settings(AIRPORT_SMALL_PARKING_SPOTS=1)
+    def test_full_parking_is_rejected(self):
+        create_aircraft('CS1', state='PARKED', type='PRIVATE')
+
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Aircraft.objects.filter(call_sign='NEW1').exists())
+
+    def test_database_changed_behind_redis_is_revalidated(self):
+        create_aircraft('CS1', state='PARKED')
+        get_redis_admission().reconcile()
+        Aircraft.objects.filter(call_sign='CS1').update(state='AIRBORNE')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'AIRBORNE')
+
+    def test_ground_crew_makes_admission_reload(self):
+        create_aircraft('CS1', state='LANDED')
+        create_aircraft('CS2', state='PARKED')
+        get_redis_admission().reconcile()
+
+        ground_crew_routine()
+
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_airports_are_admitted_separately(self):
+        Airport.objects.create(location='Nis')
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        Aircraft.objects.filter(call_sign='CS2').update(airport='Nis')
+
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(
+            self.post_intent('CS2', {'state': 'AIRBORNE', 'airport': default_airport()}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+
+        self.assertEqual(AirportResources.current('Nis').runways_in_use, 1)
+        self.assertEqual(self.counters()['runways_in_use'], 1)
+
+    def test_airport_added_after_reload_is_admitted(self):
+        get_redis_admission().reconcile()
+        Airport.objects.create(location='Nis')
+
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'airport': 'Nis'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Aircraft.objects.get(call_sign='NEW1').airport, 'Nis')
+
+    def test_only_stale_airport_is_refreshed(self):
+        Airport.objects.create(location='Nis')
+        create_aircraft('CS1', state='PARKED')
+        create_aircraft('CS2', state='PARKED')
+        create_aircraft('CS3', state='PARKED')
+        Aircraft.objects.filter(call_sign__in=['CS2', 'CS3']).update(airport='Nis')
+        admission = get_redis_admission()
+        admission.reconcile()
+
+        Aircraft.objects.filter(call_sign='CS2').update(state='TAKE_OFF')
+        Aircraft.objects.filter(call_sign='CS3').delete()
+        admission.invalidate('Nis')
+
+        with patch('airport.admission.load_airport_state', wraps=load_airport_state) as load:
+            response = self.post_intent('CS2', {'state': 'AIRBORNE'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        load.assert_called_once_with(['Nis'])
+        self.assertIsNone(admission.client.hget(admission.aircraft_key, 'CS3'))
+        self.assertEqual(admission.client.smembers(admission.members_key('Nis')), {b'CS2'})
+        self.assertIsNotNone(admission.client.hget(admission.aircraft_key, 'CS1'))
+
+    @override_settings(AIRPORT_ADMISSION_RELOAD_TIMEOUT=1)
+    def test_state_is_reloaded_by_one_process_at_a_time(self):
+        admission = get_redis_admission()
+        # reload of another process
+        admission.client.set(admission.reload_key(), 'other', px=100)
+
+        with patch.object(admission, 'reconcile') as reconcile:
+            admission.reload()
+
+        reconcile.assert_not_called()
+        self.assertFalse(admission.client.exists(admission.reload_key()))
+
+    def test_reload_lock_is_released(self):
+        admission = get_redis_admission()
+
+        admission.reload()
+
+        self.assertTrue(admission.client.exists(admission.loaded_key))
+        self.assertFalse(admission.client.exists(admission.reload_key()))
+
+    def test_unknown_airport_is_invalid(self):
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'airport': 'Atlantis'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Aircraft.objects.exists())
+
+
+@skipUnless(redis_available(), 'Redis is not available')
+@skipUnless(connection.features.has_select_for_update, 'Database does not support row locking')
+class ConcurrentRedisAdmissionTests(RedisAdmissionMixin, TransactionTestCase):
+
+    @override_settings(AIRPORT_LARGE_PARKING_SPOTS=PARALLEL_INTENTS + 1)
+    def test_runway_is_never_double_booked(self):
+        for i in range(PARALLEL_INTENTS):
+            create_aircraft(call_sign=f'CS{i}', state='PARKED')
+
+        barrier = threading.Barrier(PARALLEL_INTENTS)
+        responses = [None] * PARALLEL_INTENTS
+
+        def send(index):
+            try:
+                client = APIClient()
+                barrier.wait()
+                responses[index] = self.post_intent(f'CS{index}', {'state': 'TAKE_OFF'}, client)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(PARALLEL_INTENTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        statuses = [response.status_code for response in responses]
+        self.assertEqual(statuses.count(status.HTTP_204_NO_CONTENT), 1)
+        self.assertEqual(Aircraft.objects.filter(state='TAKE_OFF').count(), 1)
@@ -1,6 +1,8 @@
 from unittest.mock import patch
 
+from django.db import connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -260,6 +262,20 @@ class AircraftPrivateApiTests(TestCase):
         self.assertEqual(res.data, None)
         self.assertEqual(aircraft.state, 'AIRBORNE')
 
+    def test_LANDED_aircraft_cant_switch_state(self):
+        aircraft = create_aircraft(call_sign='AB1234', state='LANDED')
+        payload = {
+            'state': 'TAKE_OFF',
+            'public_key': 'valid public key'
+        }
+
+        res = self.client.post(f'/api/{aircraft.call_sign}/intent/', payload)
+
+        aircraft.refresh_from_db()
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(aircraft.state, 'LANDED')
+
     #################################
     # TESTS FOR AIRPORT CONSTRAINTS #
     #################################
@@ -414,6 +430,60 @@ class AircraftPrivateApiTests(TestCase):
         self.assertIsNone(res.data)
         self.assertTrue(Aircraft.objects.filter(call_sign=NEW_CALL_SIGN).exists())
 
+    ###############################
+    # TESTS FOR NUMBER OF QUERIES #
+    ###############################
+
+    def test_known_aircraft_intent_query_count(self):
+        aircraft = create_aircraft(call_sign='AB1234', state='PARKED')
+        payload = {
+            'state': 'TAKE_OFF',
+            'public_key': 'valid public key'
+        }
+
+        # savepoint, lock resources and load aircraft, update resources
+        # counters, update aircraft, insert log, release savepoint
+        with self.assertNumQueries(6):
+            res = self.client.post(f'/api/{aircraft.call_sign}/intent/', payload)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_new_aircraft_intent_query_count(self):
+        payload = {
+            'type': 'AIRLINER',
+            'state': 'TAKE_OFF',
+            'intent': 'AIRBORNE',
+            'public_key': 'valid public key'
+        }
+
+        # savepoint, lock resources and load aircraft, insert aircraft,
+        # insert log, release savepoint, version is bumped after commit
+        with self.assertNumQueries(5):
+            res = self.client.post('/api/NC9574/intent/', payload)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_intent_locks_resources_before_aircraft(self):
+        aircraft = create_aircraft(call_sign='AB1234', state='TAKE_OFF')
+        payload = {
+            'state': 'AIRBORNE',
+            'public_key': 'valid public key'
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(f'/api/{aircraft.call_sign}/intent/', payload)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        tables = [
+            query['sql'] for query in queries
+            if '"airport_aircraft"' in query['sql'] or '"airport_airportresources"' in query['sql']
+        ]
+        # aircraft is loaded by the query locking resources
+        self.assertIn('FROM "airport_airportresources"', tables[0])
+        self.assertIn('AS "aircraft_state"', tables[0])
+        self.assertTrue(tables[1].startswith('UPDATE "airport_airportresources"'))
+        self.assertTrue(tables[2].startswith('UPDATE "airport_aircraft"'))
+
 
 class AircraftLocationTests(TestCase):
 
@@ -622,3 +692,100 @@ class LocationApiInvalidKeyTests(TestCase):
         saved_aircraft = Aircraft.objects.get(call_sign=CALL_SIGN)
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
         self.assertEqual(saved_aircraft, aircraft)
+
+
+class BulkLocationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def location(self, call_sign, type='AIRLINER', altitude=3500):
+        return {
+            'call_sign': call_sign,
+            'type': type,
+            'longitude': 20.455516172478386,
+            'latitude': 44.82128505247063,
+            'altitude': altitude,
+            'heading': 220
+        }
+
+    def test_should_save_locations_of_all_aircraft(self):
+        aircraft1 = create_aircraft(call_sign='CS1')
+        aircraft2 = create_aircraft(call_sign='CS2', type='PRIVATE')
+
+        payload = {
+            'public_key': 'valid public key',
+            'locations': [
+                self.location('CS1', altitude=3500),
+                self.location('CS2', type='PRIVATE', altitude=4500),
+            ]
+        }
+
+        res = self.client.put('/api/locations/', payload, format='json')
+
+        aircraft1.refresh_from_db()
+        aircraft2.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'call_sign': 'CS1', 'status': status.HTTP_204_NO_CONTENT},
+            {'call_sign': 'CS2', 'status': status.HTTP_204_NO_CONTENT},
+        ])
+        self.assertEqual(aircraft1.altitude, 3500)
+        self.assertEqual(aircraft2.altitude, 4500)
+        self.assertEqual(aircraft2.heading, 220)
+
+    def test_should_report_outcome_for_every_location(self):
+        aircraft = create_aircraft(call_sign='CS1', type='AIRLINER')
+        create_aircraft(call_sign='CS2', type='AIRLINER')
+        missing_altitude = self.location('CS2')
+        missing_altitude.pop('altitude')
+
+        payload = {
+            'public_key': 'valid public key',
+            'locations': [
+                self.location('CS1', altitude=3500),
+                self.location('UNKNOWN'),
+                self.location('CS1', type='PRIVATE'),
+                missing_altitude,
+            ]
+        }
+
+        res = self.client.put('/api/locations/', payload, format='json')
+
+        aircraft.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['results'], [
+            {'call_sign': 'CS1', 'status': status.HTTP_204_NO_CONTENT},
+            {'call_sign': 'UNKNOWN', 'status': status.HTTP_404_NOT_FOUND},
+            {'call_sign': 'CS1', 'status': status.HTTP_400_BAD_REQUEST},
+            {'call_sign': 'CS2', 'status': status.HTTP_400_BAD_REQUEST},
+        ])
+        self.assertEqual(aircraft.altitude, 3500)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS2').altitude, 0)
+
+    def test_locations_param_is_mandatory(self):
+        res = self.client.put('/api/locations/', {'public_key': 'valid public key'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_aircraft_are_loaded_and_saved_with_constant_number_of_queries(self):
+        for i in range(20):
+            create_aircraft(call_sign=f'CS{i}')
+
+        payload = {
+            'public_key': 'valid public key',
+            'locations': [self.location(f'CS{i}') for i in range(20)]
+        }
+
+        # load aircraft, update aircraft, version is bumped after commit and
+        # tracks are tested with airport.tracks
+        with patch('airport.views.record_positions'), self.assertNumQueries(2):
+            res = self.client.put('/api/locations/', payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
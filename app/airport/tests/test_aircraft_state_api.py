@@ -0,0 +1,182 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from django.utils.http import http_date
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.models import Aircraft, AirportResources, AirportVersion, default_airport
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class AircraftStateApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_can_retrieve_all_aircraft(self):
+        create_aircraft('CS1', state='PARKED')
+        create_aircraft('CS2', state='AIRBORNE', type='PRIVATE', altitude=3000)
+
+        res = self.client.get('/api/aircraft/')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([(a['call_sign'], a['state'], a['type'], a['altitude']) for a in res.data], [
+            ('CS1', 'PARKED', 'AIRLINER', 0),
+            ('CS2', 'AIRBORNE', 'PRIVATE', 3000),
+        ])
+        self.assertEqual(res['ETag'], f'"{AirportVersion.version_of()[0]}"')
+
+    def test_can_retrieve_aircraft_by_call_sign(self):
+        create_aircraft('CS1', state='APPROACH')
+
+        res = self.client.get('/api/CS1/')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual((res.data['call_sign'], res.data['state']), ('CS1', 'APPROACH'))
+        self.assertIn('ETag', res)
+
+    def test_unknown_aircraft_returns_404(self):
+        self.assertEqual(self.client.get('/api/CS1/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_other_routes_are_not_taken_by_aircraft(self):
+        self.assertEqual(self.client.get('/api/state_logs/').status_code, status.HTTP_200_OK)
+
+    def test_unchanged_state_returns_304_without_reading_aircraft(self):
+        create_aircraft('CS1')
+        etag = self.client.get('/api/aircraft/')['ETag']
+
+        # read airport version only
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/aircraft/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], etag)
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/CS1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_unchanged_state_since_last_modified_returns_304(self):
+        create_aircraft('CS1')
+        minute_ago = timezone.now() - timedelta(minutes=1)
+        AirportVersion.objects.filter(location=default_airport()).update(modified=minute_ago)
+        last_modified = self.client.get('/api/CS1/')['Last-Modified']
+
+        res = self.client.get('/api/CS1/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_last_modified_is_rounded_up(self):
+        create_aircraft('CS1')
+        modified = timezone.now().replace(microsecond=300000) - timedelta(minutes=1)
+        AirportVersion.objects.filter(location=default_airport()).update(modified=modified)
+
+        res = self.client.get('/api/CS1/')
+
+        self.assertEqual(res['Last-Modified'], http_date(modified.timestamp() + 0.7))
+
+    def test_last_modified_is_not_sent_during_second_of_last_change(self):
+        create_aircraft('CS1')
+        AirportVersion.objects.filter(location=default_airport()).update(modified=timezone.now())
+
+        res = self.client.get('/api/CS1/')
+        self.assertNotIn('Last-Modified', res)
+
+        res = self.client.get('/api/CS1/', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_position_update_does_not_write_airport_resources(self):
+        aircraft = create_aircraft('CS1', state='AIRBORNE')
+        resources = AirportResources.current()
+
+        with patch('airport.models.AirportResources.shift') as shift:
+            self.client.put('/api/CS1/location/', {
+                'type': 'AIRLINER', 'longitude': 20.45, 'latitude': 44.82, 'altitude': 3500, 'heading': 220,
+                'public_key': 'valid public key'
+            })
+            aircraft.refresh_from_db()
+            aircraft.altitude = 4000
+            aircraft.save(update_fields=['altitude'])
+
+        shift.assert_not_called()
+        self.assertEqual(AirportResources.current().on_approach, resources.on_approach)
+
+
+class AircraftStateVersionTests(TransactionTestCase):
+    """ Version is bumped after commit, which test transactions never do."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_accepted_intent_changes_etag(self):
+        create_aircraft('CS1', state='PARKED')
+        etag = self.client.get('/api/aircraft/')['ETag']
+
+        self.client.post('/api/CS1/intent/', {'state': 'TAKE_OFF', 'public_key': 'valid public key'})
+        res = self.client.get('/api/aircraft/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+        self.assertEqual(res.data[0]['state'], 'TAKE_OFF')
+
+    def test_location_update_changes_etag(self):
+        create_aircraft('CS1', state='AIRBORNE')
+        etag = self.client.get('/api/CS1/')['ETag']
+
+        self.client.put('/api/CS1/location/', {
+            'type': 'AIRLINER', 'longitude': 20.45, 'latitude': 44.82, 'altitude': 3500, 'heading': 220,
+            'public_key': 'valid public key'
+        })
+        res = self.client.get('/api/CS1/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['altitude'], 3500)
+
+    def test_bulk_location_update_changes_etag(self):
+        create_aircraft('CS1', state='AIRBORNE')
+        version = AirportVersion.version_of()[0]
+
+        self.client.put('/api/locations/', {
+            'public_key': 'valid public key',
+            'locations': [{
+                'call_sign': 'CS1', 'type': 'AIRLINER', 'longitude': 20.45, 'latitude': 44.82,
+                'altitude': 3500, 'heading': 220
+            }]
+        }, format='json')
+
+        self.assertEqual(AirportVersion.version_of()[0], version + 1)
+
+    def test_removed_aircraft_changes_version(self):
+        aircraft = create_aircraft('CS1', state='AIRBORNE')
+        version = AirportVersion.version_of()[0]
+
+        aircraft.delete()
+
+        self.assertEqual(AirportVersion.version_of()[0], version + 1)
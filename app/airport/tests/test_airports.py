@@ -0,0 +1,190 @@
+from unittest.mock import patch
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.engine import get_state_engine, reset_state_engine
+from airport.models import Aircraft, Airport, AirportResources
+from airport.tasks import ground_crew_routine
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', airport='Belgrade', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        airport=airport,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+@override_settings(AIRPORT_LOCATION='Belgrade', AIRPORT_RUNAWAYS=1)
+class AirportTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+        Airport.objects.create(location='Nis', runways=2)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def post_intent(self, call_sign, payload):
+        return self.client.post(f'/api/{call_sign}/intent/', dict(payload, public_key='valid public key'))
+
+    def test_new_aircraft_joins_given_airport(self):
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'airport': 'Nis'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Aircraft.objects.get(call_sign='NEW1').airport, 'Nis')
+
+    def test_new_aircraft_joins_default_airport(self):
+        self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE'})
+
+        self.assertEqual(Aircraft.objects.get(call_sign='NEW1').airport, 'Belgrade')
+
+    def test_unknown_airport_is_rejected(self):
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'airport': 'Atlantis'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Aircraft.objects.exists())
+        self.assertFalse(AirportResources.objects.filter(location='Atlantis').exists())
+
+    def test_unknown_airport_of_landing_aircraft_is_rejected(self):
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'LANDED', 'airport': 'Atlantis'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AirportResources.objects.filter(location='Atlantis').exists())
+
+    def test_aircraft_cannot_change_airport(self):
+        create_aircraft('CS1', state='PARKED')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF', 'airport': 'Nis'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'PARKED')
+
+    def test_runways_of_airports_are_independent(self):
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED', airport='Nis')
+
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertEqual(AirportResources.current('Nis').runways_in_use, 1)
+        self.assertEqual(AirportResources.current('Belgrade').runways_in_use, 1)
+
+    def test_airport_capacity_overrides_settings(self):
+        for call_sign in ['CS1', 'CS2', 'CS3']:
+            create_aircraft(call_sign, state='PARKED', airport='Nis')
+
+        self.assertEqual(self.post_intent('CS1', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.post_intent('CS3', {'state': 'TAKE_OFF'}).status_code, status.HTTP_409_CONFLICT)
+
+    @override_settings(AIRPORT_SMALL_PARKING_SPOTS=1)
+    def test_capacity_not_set_falls_back_to_settings(self):
+        create_aircraft('CS1', state='PARKED', type='PRIVATE', airport='Nis')
+
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'airport': 'Nis'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_ground_crew_parks_at_every_airport(self):
+        Airport.objects.filter(location='Nis').update(large_parking_spots=0)
+        create_aircraft('CS1', state='LANDED')
+        create_aircraft('CS2', state='LANDED', airport='Nis')
+        create_aircraft('CS3', state='LANDED', type='PRIVATE', airport='Nis')
+
+        self.assertEqual(ground_crew_routine(), 2)
+
+        self.assertEqual(
+            dict(Aircraft.objects.values_list('call_sign', 'state')),
+            {'CS1': 'PARKED', 'CS2': 'LANDED', 'CS3': 'PARKED'}
+        )
+        resources = AirportResources.current('Nis')
+        self.assertEqual((resources.runways_in_use, resources.parked_private), (1, 1))
+
+    def test_aircraft_are_listed_per_airport(self):
+        create_aircraft('CS1')
+        create_aircraft('CS2', airport='Nis')
+
+        res = self.client.get('/api/aircraft/', {'airport': 'Nis'})
+
+        self.assertEqual([aircraft['call_sign'] for aircraft in res.data], ['CS2'])
+        self.assertEqual(res.data[0]['airport'], 'Nis')
+
+
+@override_settings(AIRPORT_LOCATION='Belgrade', AIRPORT_RUNAWAYS=1)
+class AirportVersionTests(TransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+        Airport.objects.create(location='Nis', runways=2)
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_change_at_other_airport_keeps_etag(self):
+        create_aircraft('CS1', state='PARKED')
+        create_aircraft('CS2', airport='Nis')
+        etag = self.client.get('/api/aircraft/', {'airport': 'Nis'})['ETag']
+
+        self.client.post('/api/CS1/intent/', {'state': 'TAKE_OFF', 'public_key': 'valid public key'})
+
+        res = self.client.get('/api/aircraft/', {'airport': 'Nis'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        res = self.client.get('/api/aircraft/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+@override_settings(AIRPORT_LOCATION='Belgrade', AIRPORT_INTENT_BACKEND='memory', AIRPORT_RUNAWAYS=1)
+class AirportStateEngineTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+        Airport.objects.create(location='Nis', runways=2)
+        reset_state_engine()
+
+    def tearDown(self):
+        reset_state_engine()
+        self.patcher.stop()
+
+    def post_intent(self, call_sign, payload):
+        return self.client.post(f'/api/{call_sign}/intent/', dict(payload, public_key='valid public key'))
+
+    def test_counters_are_kept_per_airport(self):
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED', airport='Nis')
+        create_aircraft('CS3', state='PARKED', airport='Nis')
+        get_state_engine().reconcile()
+
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.post_intent('CS3', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+
+        engine = get_state_engine()
+        self.assertEqual(engine.occupancy('Nis').runways_in_use, 2)
+        self.assertEqual(engine.occupancy('Belgrade').runways_in_use, 1)
+        self.assertEqual(AirportResources.current('Nis').runways_in_use, 2)
+
+    def test_new_aircraft_joins_given_airport(self):
+        get_state_engine().reconcile()
+
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'AIRBORNE', 'airport': 'Nis'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Aircraft.objects.get(call_sign='NEW1').airport, 'Nis')
+        self.assertEqual(get_state_engine().get_aircraft('NEW1').airport, 'Nis')
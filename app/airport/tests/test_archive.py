@@ -0,0 +1,245 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import date, datetime
+from io import StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from airport import archive, partitions
+from airport.models import Aircraft, StateChangeLog
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+def create_log(aircraft, time, to_state='TAKE_OFF'):
+    return StateChangeLog.objects.create(
+        aircraft=aircraft,
+        from_state='PARKED',
+        to_state=to_state,
+        outcome='ACCEPTED',
+        time=time
+    )
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cyan = create_aircraft('CYAN')
+        self.blue = create_aircraft('BLUE')
+
+        self.logs = [
+            create_log(self.cyan, utc(2026, 1, 1, 10)),
+            create_log(self.blue, utc(2026, 1, 1, 23, 59)),
+            create_log(self.cyan, utc(2026, 1, 2, 8), to_state='AIRBORNE'),
+            create_log(self.cyan, utc(2026, 1, 5, 8), to_state='APPROACH'),
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_file(self, day):
+        with gzip.open(archive.archive_path(self.directory.name, day), 'rt') as f:
+            return [json.loads(line) for line in f]
+
+    def test_logs_are_exported_to_daily_files(self):
+        counts = archive.export_logs(self.directory.name, end=utc(2026, 1, 3))
+
+        self.assertEqual(counts, {date(2026, 1, 1): 2, date(2026, 1, 2): 1})
+        self.assertEqual(
+            archive.archive_path(self.directory.name, date(2026, 1, 1)),
+            os.path.join(self.directory.name, '2026', '01', 'state_logs-2026-01-01.jsonl.gz')
+        )
+
+        records = self.read_file(date(2026, 1, 1))
+        self.assertEqual([record['id'] for record in records], [self.logs[0].pk, self.logs[1].pk])
+        self.assertEqual(records[1]['call_sign'], 'BLUE')
+        self.assertEqual(records[1]['aircraft_id'], self.blue.pk)
+        self.assertEqual(records[1]['time'], '2026-01-01T23:59:00+00:00')
+        self.assertEqual(StateChangeLog.objects.count(), 4)
+
+    def test_export_with_delete_removes_only_exported_logs(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 3), chunk_size=2, delete=True)
+
+        self.assertEqual(list(StateChangeLog.objects.values_list('pk', flat=True)), [self.logs[3].pk])
+
+    def test_exports_are_appended(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 1, 12))
+        archive.export_logs(self.directory.name, start=utc(2026, 1, 1, 12), end=utc(2026, 1, 2))
+
+        self.assertEqual(len(self.read_file(date(2026, 1, 1))), 2)
+
+    def test_exporting_range_again_skips_archived_logs(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 2))
+
+        counts = archive.export_logs(self.directory.name, end=utc(2026, 1, 3))
+
+        self.assertEqual(counts, {date(2026, 1, 2): 1})
+        self.assertEqual(
+            [record['id'] for record in self.read_file(date(2026, 1, 1))],
+            [self.logs[0].pk, self.logs[1].pk]
+        )
+
+    def test_logs_archived_before_are_deleted_too(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 2))
+
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 3), chunk_size=1, delete=True)
+
+        self.assertEqual(list(StateChangeLog.objects.values_list('pk', flat=True)), [self.logs[3].pk])
+
+    def test_failed_export_keeps_archive_and_logs(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 1, 12))
+        StateChangeLog.objects.create(aircraft=self.cyan, from_state='PARKED', to_state='TAKE_OFF',
+                                      outcome='ACCEPTED', time=utc(2026, 1, 1, 13))
+
+        write = archive.ArchiveWriter.write
+        written = []
+
+        def write_one_record(writer, record):
+            if written:
+                raise OSError('No space left on device')
+            written.append(record)
+            write(writer, record)
+
+        with patch.object(archive.ArchiveWriter, 'write', write_one_record), self.assertRaises(OSError):
+            archive.export_logs(self.directory.name, end=utc(2026, 1, 2), delete=True)
+
+        self.assertEqual([record['id'] for record in self.read_file(date(2026, 1, 1))], [self.logs[0].pk])
+        self.assertEqual(StateChangeLog.objects.count(), 5)
+        files = os.listdir(os.path.join(self.directory.name, '2026', '01'))
+        self.assertEqual(sorted(files), ['state_logs-2026-01-01.jsonl.gz', 'state_logs-2026-01-01.jsonl.gz.idx'])
+
+    def test_exports_are_appended_to_file_in_place(self):
+        path = archive.archive_path(self.directory.name, date(2026, 1, 1))
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 1, 12))
+        with open(path, 'rb') as f:
+            content = f.read()
+        inode = os.stat(path).st_ino
+
+        archive.export_logs(self.directory.name, start=utc(2026, 1, 1, 12), end=utc(2026, 1, 2))
+
+        self.assertEqual(os.stat(path).st_ino, inode)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(len(content)), content)
+
+    def test_member_not_listed_in_index_is_ignored_and_cut_off(self):
+        path = archive.archive_path(self.directory.name, date(2026, 1, 1))
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 1, 12))
+        size = os.path.getsize(path)
+
+        # crash in the middle of the next export
+        with open(path, 'ab') as f:
+            f.write(gzip.compress(b'{"id": 0}\n')[:15])
+        with open(path + archive.INDEX_SUFFIX, 'ab') as f:
+            f.write(b'{"size": ')
+
+        records = list(archive.read_archive(self.directory.name))
+        self.assertEqual([record['id'] for record in records], [self.logs[0].pk])
+
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 2))
+
+        self.assertEqual([record['id'] for record in self.read_file(date(2026, 1, 1))],
+                         [self.logs[0].pk, self.logs[1].pk])
+        self.assertGreater(archive.read_index(path)[0], size)
+
+    def test_file_without_index_is_indexed_when_appended_to(self):
+        path = archive.archive_path(self.directory.name, date(2026, 1, 1))
+        archive.export_logs(self.directory.name, end=utc(2026, 1, 1, 12))
+        os.remove(path + archive.INDEX_SUFFIX)
+
+        counts = archive.export_logs(self.directory.name, end=utc(2026, 1, 2))
+
+        self.assertEqual(counts, {date(2026, 1, 1): 1})
+        size, ids, _ = archive.read_index(path)
+        self.assertEqual(size, os.path.getsize(path))
+        self.assertEqual(ids, {self.logs[0].pk, self.logs[1].pk})
+
+    def test_archive_is_read_by_range_and_call_sign(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 2, 1))
+
+        records = list(archive.read_archive(self.directory.name, start=utc(2026, 1, 1, 12), end=utc(2026, 1, 5)))
+        self.assertEqual([record['id'] for record in records], [self.logs[1].pk, self.logs[2].pk])
+        self.assertEqual(records[0]['time'], utc(2026, 1, 1, 23, 59))
+
+        records = list(archive.read_archive(self.directory.name, call_sign='CYAN'))
+        self.assertEqual([record['id'] for record in records], [self.logs[0].pk, self.logs[2].pk, self.logs[3].pk])
+
+    def test_only_files_of_range_are_read(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 2, 1))
+
+        files = archive.archive_files(self.directory.name, start=utc(2026, 1, 2), end=utc(2026, 1, 5))
+
+        self.assertEqual(files, [archive.archive_path(self.directory.name, date(2026, 1, 2))])
+
+    def test_archived_logs_are_imported_back_once(self):
+        archive.export_logs(self.directory.name, end=utc(2026, 2, 1), delete=True)
+        self.blue.delete()
+
+        imported, skipped = archive.import_records(archive.read_archive(self.directory.name))
+        archive.import_records(archive.read_archive(self.directory.name))
+
+        self.assertEqual((imported, skipped), (3, 1))
+        restored = StateChangeLog.objects.order_by('time')
+        self.assertEqual(
+            [(log.pk, log.to_state, log.time) for log in restored],
+            [(log.pk, log.to_state, log.time) for log in self.logs if log.aircraft == self.cyan]
+        )
+
+    def test_archive_commands(self):
+        out = StringIO()
+        call_command('archive_state_logs', before='2026-01-02', output_dir=self.directory.name, stdout=out)
+        self.assertIn('Exported 2 state change logs', out.getvalue())
+
+        out = StringIO()
+        call_command('read_state_log_archive', call_sign='BLUE', input_dir=self.directory.name, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['id'], self.logs[1].pk)
+
+    def test_archive_command_requires_upper_bound(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_state_logs', output_dir=self.directory.name, stdout=StringIO())
+
+    def test_dates_on_command_line_are_utc(self):
+        self.assertEqual(archive.parse_time('2026-01-02'), utc(2026, 1, 2))
+        self.assertEqual(archive.parse_time('2026-01-02T10:00:00+02:00'), utc(2026, 1, 2, 8))
+        with self.assertRaises(ValueError):
+            archive.parse_time('yesterday')
+
+    @skipUnless(connection.vendor == 'postgresql', 'Log partitioning requires PostgreSQL')
+    def test_detached_partition_is_exported_and_dropped(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        partitions.ensure_partitions(connection, since=utc(2026, 1, 1), now=utc(2026, 1, 1), ahead=0)
+        partitions.detach_partition(connection, 'airport_statechangelog_p202601')
+
+        out = StringIO()
+        call_command('archive_state_logs', partition='airport_statechangelog_archived_202601',
+                     delete=True, output_dir=self.directory.name, stdout=out)
+
+        self.assertIn('Exported 4 state change logs', out.getvalue())
+        self.assertEqual(partitions.archived_partitions(connection), [])
+        self.assertEqual(self.read_file(date(2026, 1, 5))[0]['call_sign'], 'CYAN')
@@ -0,0 +1,144 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.authentication import issue_token, verify_token
+from airport.exceptions import InvalidPublicKey
+from airport.models import Aircraft
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class AircraftTokenTests(TestCase):
+
+    def test_issued_token_is_verified(self):
+        token = issue_token('CS123')
+
+        self.assertEqual(verify_token(token).call_sign, 'CS123')
+
+    def test_tampered_token_is_not_verified(self):
+        token = issue_token('CS123')
+
+        self.assertIsNone(verify_token(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        self.assertIsNone(verify_token('not a token'))
+
+    @override_settings(AIRPORT_TOKEN_MAX_AGE=60)
+    def test_expired_token_is_not_verified(self):
+        with patch('django.core.signing.time.time', return_value=1000):
+            token = issue_token('CS123')
+
+        with patch('django.core.signing.time.time', return_value=1061):
+            self.assertIsNone(verify_token(token))
+
+
+class HandshakeApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_handshake_returns_token_for_call_sign(self):
+        res = self.client.post('/api/CS123/handshake/', {'public_key': 'valid public key'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(verify_token(res.data['token']).call_sign, 'CS123')
+        self.assertIn('expires_in', res.data)
+
+    def test_handshake_requires_valid_public_key(self):
+        self.public_key_is_valid.side_effect = InvalidPublicKey
+
+        res = self.client.post('/api/CS123/handshake/', {'public_key': 'invalid public key'})
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PublicKeyApiTests(TestCase):
+
+    @patch('airport.keystore.KeyStore.get_private_key')
+    def test_public_key_which_is_not_text_is_unauthorized(self, get_private_key):
+        get_private_key.return_value = object()
+        client = APIClient()
+
+        for public_key in [42, ['key'], {'key': 'value'}]:
+            res = client.post('/api/CS123/handshake/', {'public_key': public_key}, format='json')
+
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenAuthenticatedApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.side_effect = InvalidPublicKey
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_intent_with_token_does_not_need_public_key(self):
+        aircraft = create_aircraft(call_sign='CS123', state='PARKED')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(aircraft.call_sign)}')
+
+        res = self.client.post(f'/api/{aircraft.call_sign}/intent/', {'state': 'TAKE_OFF'})
+
+        aircraft.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(aircraft.state, 'TAKE_OFF')
+        self.public_key_is_valid.assert_not_called()
+
+    def test_location_with_token_does_not_need_public_key(self):
+        aircraft = create_aircraft(call_sign='CS123')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(aircraft.call_sign)}')
+
+        payload = {
+            'type': 'AIRLINER',
+            'longitude': "20.455516172478386",
+            'latitude': "44.82128505247063",
+            'altitude': 3500,
+            'heading': 220,
+        }
+        res = self.client.put(f'/api/{aircraft.call_sign}/location/', payload)
+
+        aircraft.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(aircraft.altitude, 3500)
+
+    def test_token_of_other_aircraft_is_rejected(self):
+        aircraft = create_aircraft(call_sign='CS123', state='PARKED')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token("OTHER")}')
+
+        res = self.client.post(f'/api/{aircraft.call_sign}/intent/', {'state': 'TAKE_OFF'})
+
+        aircraft.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(aircraft.state, 'PARKED')
+
+    def test_invalid_token_is_rejected(self):
+        aircraft = create_aircraft(call_sign='CS123', state='PARKED')
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.post(f'/api/{aircraft.call_sign}/intent/', {'state': 'TAKE_OFF'})
+
+        aircraft.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(aircraft.state, 'PARKED')
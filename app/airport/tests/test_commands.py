@@ -1,9 +1,12 @@
+from io import StringIO
 from unittest.mock import patch
 
 from django.core.management import call_command
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from airport.models import Aircraft, AirportResources, StateChangeLog
+
 
 class CommandTests(TestCase):
     def test_wait_for_db_ready(self):
@@ -21,3 +24,16 @@ class CommandTests(TestCase):
             call_command('wait_for_db')
 
             self.assertEqual(gi.call_count, 6)
+
+    def test_benchmark_hot_queries_seeds_and_measures(self):
+        out = StringIO()
+
+        call_command('benchmark_hot_queries', seed=True, aircraft=10, logs=50, repeat=1, stdout=out)
+
+        self.assertEqual(Aircraft.objects.filter(call_sign__startswith='BENCH_').count(), 10)
+        self.assertEqual(StateChangeLog.objects.count(), 50)
+        self.assertEqual(
+            AirportResources.current().parked_airliners,
+            Aircraft.objects.filter(type='AIRLINER', state='PARKED').count()
+        )
+        self.assertIn('latest logs: median', out.getvalue())
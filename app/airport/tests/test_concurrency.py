@@ -0,0 +1,102 @@
+import threading
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.models import Aircraft, StateChangeLog
+
+PARALLEL_INTENTS = 8
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+@skipUnless(connection.features.has_select_for_update, 'Database does not support row locking')
+class ConcurrentIntentTests(TransactionTestCase):
+
+    def setUp(self):
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def send_intents_in_parallel(self, intents):
+        barrier = threading.Barrier(len(intents))
+        responses = [None] * len(intents)
+
+        def send(index, call_sign, payload):
+            try:
+                client = APIClient()
+                barrier.wait()
+                responses[index] = client.post(f'/api/{call_sign}/intent/', payload)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=send, args=(index, call_sign, payload))
+            for index, (call_sign, payload) in enumerate(intents)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return [response.status_code for response in responses]
+
+    @override_settings(AIRPORT_RUNAWAYS=1, AIRPORT_LARGE_PARKING_SPOTS=PARALLEL_INTENTS + 1)
+    def test_runway_is_never_double_booked_on_take_off(self):
+        intents = []
+        for i in range(PARALLEL_INTENTS):
+            aircraft = create_aircraft(call_sign=f'CS{i}', state='PARKED')
+            intents.append((aircraft.call_sign, {'state': 'TAKE_OFF', 'public_key': 'valid public key'}))
+
+        statuses = self.send_intents_in_parallel(intents)
+
+        self.assertEqual(statuses.count(status.HTTP_204_NO_CONTENT), 1)
+        self.assertEqual(statuses.count(status.HTTP_409_CONFLICT), PARALLEL_INTENTS - 1)
+        self.assertEqual(Aircraft.objects.filter(state='TAKE_OFF').count(), 1)
+        self.assertEqual(StateChangeLog.objects.filter(outcome='ACCEPTED').count(), 1)
+
+    @override_settings(AIRPORT_RUNAWAYS=1, AIRPORT_LARGE_PARKING_SPOTS=PARALLEL_INTENTS + 1)
+    def test_runway_is_never_double_booked_on_landing(self):
+        intents = []
+        for i in range(PARALLEL_INTENTS):
+            intents.append((f'NEW{i}', {
+                'type': 'AIRLINER',
+                'state': 'APPROACH',
+                'intent': 'LANDED',
+                'public_key': 'valid public key'
+            }))
+
+        statuses = self.send_intents_in_parallel(intents)
+
+        self.assertEqual(statuses.count(status.HTTP_204_NO_CONTENT), 1)
+        self.assertEqual(Aircraft.objects.filter(state='LANDED').count(), 1)
+
+    def test_only_one_aircraft_gets_approach(self):
+        intents = []
+        for i in range(PARALLEL_INTENTS):
+            aircraft = create_aircraft(call_sign=f'CS{i}', state='AIRBORNE', type='PRIVATE')
+            intents.append((aircraft.call_sign, {'state': 'APPROACH', 'public_key': 'valid public key'}))
+
+        statuses = self.send_intents_in_parallel(intents)
+
+        self.assertEqual(statuses.count(status.HTTP_204_NO_CONTENT), 1)
+        self.assertEqual(Aircraft.objects.filter(state='APPROACH').count(), 1)
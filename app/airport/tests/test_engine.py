@@ -0,0 +1,252 @@
+import threading
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.engine import AirportStateEngine, get_state_engine, load_airport_state, reset_state_engine
+from airport.models import Aircraft, AirportResources, AirportStateEpoch, StateChangeLog, default_airport
+from airport.tasks import ground_crew_routine
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0, **fields):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading,
+        **fields
+    )
+
+
+@override_settings(AIRPORT_INTENT_BACKEND='memory', AIRPORT_RUNAWAYS=1)
+class AirportStateEngineTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+        reset_state_engine()
+
+    def tearDown(self):
+        reset_state_engine()
+        self.patcher.stop()
+
+    def post_intent(self, call_sign, payload):
+        return self.client.post(f'/api/{call_sign}/intent/', dict(payload, public_key='valid public key'))
+
+    def test_intent_is_validated_without_reading_aircraft(self):
+        create_aircraft('CS1', state='PARKED')
+        get_state_engine().reconcile()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_intent('CS1', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'airport_aircraft' in query['sql']
+        ])
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'TAKE_OFF')
+        self.assertEqual(AirportResources.current().runways_in_use, 1)
+        self.assertEqual(AirportResources.current().parked_airliners, 0)
+
+        log = StateChangeLog.objects.get()
+        self.assertEqual((log.from_state, log.to_state, log.outcome), ('PARKED', 'TAKE_OFF', 'ACCEPTED'))
+
+    def test_new_aircraft_is_written_through(self):
+        response = self.post_intent('NEW1', {
+            'type': 'PRIVATE', 'state': 'AIRBORNE', 'intent': 'APPROACH', 'altitude': 3000
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        aircraft = Aircraft.objects.get(call_sign='NEW1')
+        self.assertEqual((aircraft.state, aircraft.altitude), ('APPROACH', 3000))
+        self.assertEqual(AirportResources.current().on_approach, 1)
+        self.assertEqual(StateChangeLog.objects.get().from_state, 'AIRBORNE')
+
+        # engine knows about the new aircraft right away
+        self.assertEqual(self.post_intent('NEW1', {'state': 'LANDED'}).status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_rejected_intent_is_logged(self):
+        aircraft = create_aircraft('CS1', state='PARKED')
+
+        response = self.post_intent('CS1', {'state': 'LANDED'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        log = StateChangeLog.objects.get()
+        self.assertEqual((log.aircraft, log.outcome), (aircraft, 'REJECTED'))
+
+    def test_state_changed_in_database_is_revalidated(self):
+        create_aircraft('CS1', state='PARKED')
+        get_state_engine().reconcile()
+        Aircraft.objects.filter(call_sign='CS1').update(state='AIRBORNE')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'AIRBORNE')
+        self.assertEqual(StateChangeLog.objects.get().description, 'Not a valid state change')
+
+    def test_runway_taken_by_another_process_is_not_double_booked(self):
+        create_aircraft('CS1', state='PARKED')
+        get_state_engine().reconcile()
+        create_aircraft('OTHER', state='TAKE_OFF')
+
+        response = self.post_intent('CS1', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Aircraft.objects.filter(state='TAKE_OFF').count(), 1)
+        self.assertEqual(AirportResources.current().runways_in_use, 1)
+        self.assertEqual(StateChangeLog.objects.get().description, 'The runway is occupied')
+
+    def test_aircraft_created_by_another_process_is_revalidated(self):
+        get_state_engine().reconcile()
+        create_aircraft('CS1', state='PARKED')
+
+        response = self.post_intent('CS1', {'type': 'AIRLINER', 'state': 'AIRBORNE'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'PARKED')
+
+    def test_reconcile_rebuilds_drifted_counters(self):
+        create_aircraft('CS1', state='APPROACH')
+        AirportResources.objects.update(on_approach=5)
+
+        get_state_engine().reconcile()
+
+        self.assertEqual(AirportResources.current().on_approach, 1)
+        self.assertEqual(get_state_engine().occupancy().on_approach, 1)
+
+    def test_ground_crew_parks_landed_aircraft(self):
+        create_aircraft('CS1', state='LANDED')
+
+        ground_crew_routine()
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'PARKED')
+        self.assertEqual(AirportResources.current().runways_in_use, 0)
+        self.assertEqual(AirportResources.current().parked_airliners, 1)
+        self.assertEqual(StateChangeLog.objects.get().description, 'Paked by ground crew')
+
+    @override_settings(AIRPORT_ENGINE_EPOCH_INTERVAL=0)
+    def test_change_made_by_another_process_reloads_engine(self):
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        get_state_engine().reconcile()
+
+        # ground crew of another process released the runway
+        Aircraft.objects.filter(call_sign='CS1').update(state='AIRBORNE')
+        AirportResources.recalculate()
+        AirportStateEpoch.bump()
+
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF'}).status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_landed_aircraft_cannot_change_state(self):
+        create_aircraft('CS1', state='LANDED')
+
+        self.assertEqual(self.post_intent('CS1', {'state': 'TAKE_OFF'}).status_code, status.HTTP_409_CONFLICT)
+
+    @override_settings(AIRPORT_INTENT_BACKEND='database')
+    def test_engine_is_not_used_by_default(self):
+        self.assertIsNone(get_state_engine())
+
+
+@override_settings(AIRPORT_LOCATION='Belgrade')
+class AirportStateEngineReloadTests(TestCase):
+
+    def setUp(self):
+        create_aircraft('CS1', state='PARKED')
+        create_aircraft('CS2', state='PARKED', airport='Nis')
+        create_aircraft('CS3', state='PARKED', airport='Nis')
+        self.engine = AirportStateEngine(epoch_interval=0)
+        self.engine.reconcile()
+
+    def test_only_airports_with_grown_epoch_are_reloaded(self):
+        Aircraft.objects.update(state='AIRBORNE')
+        Aircraft.objects.filter(call_sign='CS3').delete()
+        AirportStateEpoch.bump('Nis')
+
+        with patch('airport.engine.load_airport_state', wraps=load_airport_state) as load:
+            self.engine.refresh()
+
+        load.assert_called_once_with({'Nis'})
+        self.assertEqual(self.engine.get_aircraft('CS2').state, 'AIRBORNE')
+        self.assertIsNone(self.engine.get_aircraft('CS3'))
+        self.assertEqual(self.engine.occupancy('Nis').parked_airliners, 0)
+        self.assertEqual(self.engine.get_aircraft('CS1').state, 'PARKED')
+        self.assertEqual(self.engine.occupancy('Belgrade').parked_airliners, 1)
+
+        # reloaded airports are not reloaded again
+        with patch('airport.engine.load_airport_state') as load:
+            self.engine.refresh()
+        load.assert_not_called()
+
+    def test_epochs_are_read_at_most_once_per_interval(self):
+        self.engine.epoch_interval = 60
+        AirportStateEpoch.bump('Nis')
+
+        with self.assertNumQueries(0):
+            self.engine.refresh()
+
+    def test_invalidated_airport_is_reloaded_right_away(self):
+        self.engine.epoch_interval = 60
+        Aircraft.objects.filter(call_sign='CS2').update(state='AIRBORNE')
+
+        self.engine.invalidate('Nis')
+        self.engine.refresh()
+
+        self.assertEqual(self.engine.get_aircraft('CS2').state, 'AIRBORNE')
+
+    def test_state_is_read_outside_of_engine_lock(self):
+        acquired = []
+
+        def validate():
+            if self.engine.lock.acquire(timeout=1):
+                acquired.append(True)
+                self.engine.lock.release()
+
+        def validate_meanwhile(*args):
+            # intent of another thread
+            thread = threading.Thread(target=validate)
+            thread.start()
+            thread.join()
+            return load_airport_state(*args)
+
+        self.engine.invalidate()
+        with patch('airport.engine.load_airport_state', side_effect=validate_meanwhile):
+            self.engine.refresh()
+
+        self.assertEqual(acquired, [True])
+
+
+@override_settings(AIRPORT_INTENT_BACKEND='memory', AIRPORT_RUNAWAYS=1)
+class AirportStateEpochTests(TransactionTestCase):
+
+    def setUp(self):
+        reset_state_engine()
+
+    def tearDown(self):
+        reset_state_engine()
+
+    def test_ground_crew_bumps_epoch_after_commit(self):
+        create_aircraft('CS1', state='LANDED')
+        epoch = AirportStateEpoch.current().get(default_airport(), 0)
+
+        ground_crew_routine()
+
+        self.assertEqual(AirportStateEpoch.current(), {default_airport(): epoch + 1})
+
+    def test_nothing_parked_keeps_epoch(self):
+        create_aircraft('CS1', state='PARKED')
+        ground_crew_routine()
+
+        self.assertEqual(AirportStateEpoch.current(), {})
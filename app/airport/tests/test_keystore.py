@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from Crypto.PublicKey import RSA
+
+from django.test import TestCase
+
+from airport.keystore import KeyStore
+
+
+def write_private_key(path, key):
+    with open(path, 'wb') as private_key_file:
+        private_key_file.write(key.exportKey())
+
+
+class KeyStoreTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.private_key = RSA.generate(1024)
+        cls.other_private_key = RSA.generate(1024)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'airport_ops_rsa')
+        write_private_key(self.path, self.private_key)
+        self.key_store = KeyStore(path=self.path, max_verified=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def public_key(self, private_key=None):
+        return (private_key or self.private_key).publickey().exportKey().decode()
+
+    def test_matching_public_key_is_valid(self):
+        self.assertTrue(self.key_store.is_valid_public_key(self.public_key()))
+
+    def test_public_key_of_other_pair_is_not_valid(self):
+        public_key = self.public_key(self.other_private_key)
+
+        self.assertFalse(self.key_store.is_valid_public_key(public_key))
+
+    def test_malformed_public_key_is_not_valid(self):
+        self.assertFalse(self.key_store.is_valid_public_key('invalid public key'))
+        self.assertFalse(self.key_store.is_valid_public_key(''))
+
+    def test_public_key_which_is_not_text_is_not_valid(self):
+        for public_key in [42, ['key'], {'key': 'value'}, True]:
+            self.assertFalse(self.key_store.is_valid_public_key(public_key))
+
+    def test_missing_private_key_file_means_no_key_is_valid(self):
+        key_store = KeyStore(path=os.path.join(self.directory, 'missing'))
+
+        self.assertIsNone(key_store.get_private_key())
+        self.assertFalse(key_store.is_valid_public_key(self.public_key()))
+
+    def test_private_key_is_parsed_only_once(self):
+        self.key_store.get_private_key()
+
+        with patch('airport.keystore.RSA.importKey') as import_key:
+            self.key_store.get_private_key()
+            self.key_store.get_private_key()
+
+        import_key.assert_not_called()
+
+    def test_repeat_caller_is_verified_without_parsing_keys(self):
+        public_key = self.public_key()
+        self.key_store.is_valid_public_key(public_key)
+
+        with patch('airport.keystore.RSA.importKey') as import_key:
+            self.assertTrue(self.key_store.is_valid_public_key(public_key))
+
+        import_key.assert_not_called()
+
+    def test_rotated_private_key_is_reloaded(self):
+        old_public_key = self.public_key()
+        new_public_key = self.public_key(self.other_private_key)
+        self.assertTrue(self.key_store.is_valid_public_key(old_public_key))
+
+        write_private_key(self.path, self.other_private_key)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        self.assertFalse(self.key_store.is_valid_public_key(old_public_key))
+        self.assertTrue(self.key_store.is_valid_public_key(new_public_key))
+
+    def test_key_verified_during_rotation_is_not_remembered(self):
+        old_public_key = self.public_key()
+        self.key_store.get_private_key()
+        import_key = RSA.importKey
+
+        def import_and_rotate(content):
+            # rotate once, while the public key is being verified
+            if not rotated:
+                rotated.append(True)
+                write_private_key(self.path, self.other_private_key)
+                stat = os.stat(self.path)
+                os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+                self.key_store.get_private_key()
+            return import_key(content)
+
+        rotated = []
+        with patch('airport.keystore.RSA.importKey', side_effect=import_and_rotate):
+            self.assertTrue(self.key_store.is_valid_public_key(old_public_key))
+
+        self.assertEqual(len(self.key_store._verified), 0)
+        self.assertFalse(self.key_store.is_valid_public_key(old_public_key))
+
+    def test_verified_keys_cache_is_bounded(self):
+        public_key = self.public_key()
+        variants = [public_key, public_key + '\n', public_key + '\n\n']
+
+        for variant in variants:
+            self.assertTrue(self.key_store.is_valid_public_key(variant))
+
+        self.assertEqual(len(self.key_store._verified), 2)
@@ -0,0 +1,261 @@
+import json
+import os
+import socket
+import tempfile
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import transaction
+from django.db.utils import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from rest_framework.test import APIClient
+
+from airport import logwriter
+from airport.logwriter import (BufferedLogWriter, flush_state_logs, get_spool_path, recover_spool_file,
+                               recover_spooled_logs, write_state_log)
+from airport.models import Aircraft, StateChangeLog
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class BufferedWriterMixin:
+
+    def setUp(self):
+        self.spool_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            AIRPORT_LOG_WRITER='buffered',
+            AIRPORT_LOG_SPOOL_DIR=self.spool_dir.name
+        )
+        self.settings_override.enable()
+
+        # logs are flushed explicitly instead of by the background thread
+        self.start_patcher = patch('airport.logwriter.BufferedLogWriter.start')
+        self.start_patcher.start()
+        logwriter._writer = None
+
+    def tearDown(self):
+        logwriter._writer = None
+        self.start_patcher.stop()
+        self.settings_override.disable()
+        self.spool_dir.cleanup()
+
+
+class BufferedLogWriterTests(BufferedWriterMixin, TestCase):
+
+    def test_log_flushed_after_newer_log_is_polled(self):
+        aircraft = create_aircraft('CS1')
+        writer = BufferedLogWriter()
+        writer.write(StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF',
+                                    outcome='ACCEPTED', description='queued'))
+        # written by another process while the log waits for the flush
+        StateChangeLog.objects.create(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF',
+                                      outcome='REJECTED', description='inserted')
+
+        client = APIClient()
+        res = client.get('/api/state_logs/?since=')
+        self.assertEqual([log['description'] for log in res.data['results']], ['inserted'])
+
+        writer.flush()
+
+        res = client.get(res.data['next'])
+        self.assertEqual([log['description'] for log in res.data['results']], ['queued'])
+
+    def test_logs_are_inserted_on_flush(self):
+        aircraft = create_aircraft('CS1')
+        writer = BufferedLogWriter()
+
+        for to_state in ('TAKE_OFF', 'AIRBORNE', 'APPROACH'):
+            writer.write(StateChangeLog(aircraft=aircraft, from_state='PARKED',
+                                        to_state=to_state, outcome='ACCEPTED'))
+
+        self.assertEqual(StateChangeLog.objects.count(), 0)
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(
+            list(StateChangeLog.objects.order_by('time').values_list('to_state', flat=True)),
+            ['TAKE_OFF', 'AIRBORNE', 'APPROACH']
+        )
+        self.assertEqual(len(writer), 0)
+
+    def test_full_batch_wakes_up_writer(self):
+        aircraft = create_aircraft('CS1')
+        writer = BufferedLogWriter(batch_size=2)
+
+        writer.write(StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED'))
+        self.assertFalse(writer._wakeup.is_set())
+
+        writer.write(StateChangeLog(aircraft=aircraft, from_state='TAKE_OFF', to_state='AIRBORNE', outcome='ACCEPTED'))
+        self.assertTrue(writer._wakeup.is_set())
+
+    def test_failed_flush_spools_logs_and_next_flush_inserts_them(self):
+        aircraft = create_aircraft('CS1')
+        writer = BufferedLogWriter()
+        writer.write(StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED'))
+
+        with patch('airport.logwriter.logger'), \
+                patch('airport.logwriter.StateChangeLog.objects.bulk_create', side_effect=OperationalError):
+            self.assertEqual(writer.flush(), 0)
+
+        with open(get_spool_path()) as spool:
+            records = [json.loads(line) for line in spool]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['aircraft_id'], aircraft.pk)
+
+        writer.write(StateChangeLog(aircraft=aircraft, from_state='TAKE_OFF', to_state='AIRBORNE', outcome='ACCEPTED'))
+
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(StateChangeLog.objects.count(), 2)
+        self.assertFalse(os.path.exists(get_spool_path()))
+
+    def test_spooled_log_is_stamped_when_inserted(self):
+        aircraft = create_aircraft('CS1')
+        log = StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED')
+        writer = BufferedLogWriter()
+        writer.spool([log])
+        newer = StateChangeLog.objects.create(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF',
+                                              outcome='REJECTED')
+
+        writer.flush()
+
+        self.assertGreater(StateChangeLog.objects.get(outcome='ACCEPTED').time, newer.time)
+
+    def other_process_spool(self, log):
+        path = os.path.join(self.spool_dir.name, 'airport_state_logs.other-host.4242.0123abcd.jsonl')
+        writer = BufferedLogWriter(spool_path=path)
+        writer.spool([log])
+        return writer
+
+    def test_spool_file_is_named_by_host_and_process(self):
+        name = os.path.basename(get_spool_path())
+
+        self.assertTrue(name.startswith(f'airport_state_logs.{socket.gethostname()}.{os.getpid()}.'))
+        self.assertEqual(get_spool_path(), get_spool_path())
+
+    def test_flush_command_inserts_spool_files_of_stopped_processes(self):
+        aircraft = create_aircraft('CS1')
+        log = StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED')
+        writer = self.other_process_spool(log)
+        # lock is released when the process stops
+        writer.close()
+
+        call_command('flush_state_logs', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual(StateChangeLog.objects.count(), 1)
+        self.assertEqual(os.listdir(self.spool_dir.name), [])
+
+    def test_spool_file_of_running_process_is_left_to_it(self):
+        aircraft = create_aircraft('CS1')
+        log = StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED')
+        writer = self.other_process_spool(log)
+
+        self.assertEqual(recover_spooled_logs(), 0)
+        self.assertIsNone(recover_spool_file(writer.spool_path))
+
+        self.assertFalse(StateChangeLog.objects.exists())
+        self.assertTrue(os.path.exists(writer.spool_path))
+        writer.close()
+
+    def test_process_flushes_only_its_own_spool(self):
+        aircraft = create_aircraft('CS1')
+        log = StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED')
+        other = self.other_process_spool(log)
+        other.close()
+        logwriter.get_writer().spool([StateChangeLog(aircraft=aircraft, from_state='TAKE_OFF',
+                                                     to_state='AIRBORNE', outcome='ACCEPTED')])
+
+        self.assertEqual(flush_state_logs(), 1)
+
+        self.assertEqual(StateChangeLog.objects.get().to_state, 'AIRBORNE')
+        self.assertTrue(os.path.exists(other.spool_path))
+
+    def test_failed_recovery_keeps_spool_file(self):
+        aircraft = create_aircraft('CS1')
+        log = StateChangeLog(aircraft=aircraft, from_state='PARKED', to_state='TAKE_OFF', outcome='ACCEPTED')
+        writer = self.other_process_spool(log)
+        writer.close()
+
+        with patch('airport.logwriter.logger'), \
+                patch('airport.logwriter.StateChangeLog.objects.bulk_create', side_effect=OperationalError):
+            self.assertEqual(recover_spool_file(writer.spool_path), 0)
+
+        self.assertTrue(os.path.exists(writer.spool_path))
+        self.assertEqual(recover_spool_file(writer.spool_path), 1)
+
+    def test_sync_writer_inserts_immediately(self):
+        aircraft = create_aircraft('CS1')
+
+        with self.settings(AIRPORT_LOG_WRITER='sync'):
+            log = write_state_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+
+        self.assertIsNotNone(log.pk)
+        self.assertEqual(StateChangeLog.objects.count(), 1)
+
+
+class BufferedLogWriterIntentTests(BufferedWriterMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+        super().tearDown()
+
+    def test_intent_logs_are_written_after_response(self):
+        create_aircraft('CS1', state='PARKED')
+
+        response = self.client.post('/api/CS1/intent/', {'state': 'TAKE_OFF', 'public_key': 'valid public key'})
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(StateChangeLog.objects.count(), 0)
+
+        self.assertEqual(flush_state_logs(), 1)
+        log = StateChangeLog.objects.get()
+        self.assertEqual((log.from_state, log.to_state, log.outcome), ('PARKED', 'TAKE_OFF', 'ACCEPTED'))
+
+    def test_rejected_intent_is_logged(self):
+        create_aircraft('CS1', state='PARKED')
+
+        response = self.client.post('/api/CS1/intent/', {'state': 'LANDED', 'public_key': 'valid public key'})
+
+        self.assertEqual(response.status_code, 409)
+        flush_state_logs()
+        self.assertEqual(StateChangeLog.objects.get().outcome, 'REJECTED')
+
+    def test_rolled_back_log_is_not_queued(self):
+        aircraft = create_aircraft('CS1')
+
+        try:
+            with transaction.atomic():
+                write_state_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        self.assertEqual(flush_state_logs(), 0)
+
+    def test_logs_of_removed_aircraft_are_dropped(self):
+        removed = create_aircraft('CS1')
+        kept = create_aircraft('CS2')
+        write_state_log(removed, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+        write_state_log(kept, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+        removed.delete()
+
+        with patch('airport.logwriter.logger'):
+            self.assertEqual(flush_state_logs(), 1)
+
+        self.assertEqual(StateChangeLog.objects.get().aircraft, kept)
@@ -1,7 +1,8 @@
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
 from django.db.utils import IntegrityError
 
-from airport.models import Aircraft
+from airport.models import Aircraft, AirportResources, AirportVersion
 
 
 def create_aircraft(call_sign):
@@ -35,3 +36,106 @@ class AircraftTest(TestCase):
         aircraft = create_aircraft(call_sign='ABCD')
 
         self.assertEqual(aircraft.state, 'PARKED')
+
+
+class AirportResourcesTest(TestCase):
+
+    def resources(self):
+        return AirportResources.current()
+
+    def test_counters_follow_aircraft_state_changes(self):
+        aircraft = Aircraft.objects.create(call_sign='CS1', type='AIRLINER', state=Aircraft.PARKED)
+        self.assertEqual(self.resources().parked_airliners, 1)
+
+        aircraft.state = Aircraft.TAKE_OFF
+        aircraft.save()
+        resources = self.resources()
+        self.assertEqual(resources.parked_airliners, 0)
+        self.assertEqual(resources.runways_in_use, 1)
+
+        aircraft.state = Aircraft.AIRBORNE
+        aircraft.save()
+        self.assertEqual(self.resources().runways_in_use, 0)
+
+        aircraft.state = Aircraft.APPROACH
+        aircraft.save()
+        self.assertEqual(self.resources().on_approach, 1)
+
+        aircraft.delete()
+        self.assertEqual(self.resources().on_approach, 0)
+
+    def test_private_aircraft_use_small_parking_spots(self):
+        Aircraft.objects.create(call_sign='CS1', type='PRIVATE', state=Aircraft.PARKED)
+
+        resources = self.resources()
+        self.assertEqual(resources.parked_private, 1)
+        self.assertEqual(resources.parked_airliners, 0)
+
+    def test_saving_position_only_does_not_touch_counters(self):
+        aircraft = Aircraft.objects.create(call_sign='CS1', type='AIRLINER', state=Aircraft.PARKED)
+
+        before = self.resources()
+
+        # update aircraft, version is bumped after commit
+        with self.assertNumQueries(1):
+            aircraft.altitude = 1000
+            aircraft.save(update_fields=['altitude'])
+
+        after = self.resources()
+        self.assertEqual(after.parked_airliners, before.parked_airliners)
+
+    def test_aircraft_loaded_without_state_is_handled(self):
+        Aircraft.objects.create(call_sign='CS1', type='AIRLINER', state=Aircraft.PARKED)
+
+        aircraft = Aircraft.objects.only('id', 'call_sign').get(call_sign='CS1')
+        aircraft.state = Aircraft.TAKE_OFF
+        aircraft.save()
+
+        resources = self.resources()
+        self.assertEqual(resources.parked_airliners, 0)
+        self.assertEqual(resources.runways_in_use, 1)
+
+    def test_recalculate_rebuilds_counters_after_bulk_changes(self):
+        Aircraft.objects.create(call_sign='CS1', type='AIRLINER', state=Aircraft.PARKED)
+        Aircraft.objects.create(call_sign='CS2', type='AIRLINER', state=Aircraft.PARKED)
+        Aircraft.objects.filter(call_sign='CS1').update(state=Aircraft.LANDED)
+
+        AirportResources.recalculate()
+
+        resources = self.resources()
+        self.assertEqual(resources.parked_airliners, 1)
+        self.assertEqual(resources.runways_in_use, 1)
+
+
+class AirportVersionTest(TransactionTestCase):
+
+    def version(self):
+        return AirportVersion.version_of()[0]
+
+    def test_every_change_bumps_version_after_commit(self):
+        aircraft = Aircraft.objects.create(call_sign='CS1', type='AIRLINER', state=Aircraft.PARKED)
+        version = self.version()
+        self.assertGreater(version, 0)
+
+        aircraft.altitude = 1000
+        aircraft.save(update_fields=['altitude'])
+        self.assertEqual(self.version(), version + 1)
+
+        aircraft.state = Aircraft.TAKE_OFF
+        aircraft.save(update_fields=['state'])
+        self.assertEqual(self.version(), version + 2)
+
+    def test_rolled_back_change_keeps_version(self):
+        aircraft = Aircraft.objects.create(call_sign='CS1', type='AIRLINER', state=Aircraft.PARKED)
+        version = self.version()
+
+        try:
+            with transaction.atomic():
+                aircraft.state = Aircraft.TAKE_OFF
+                aircraft.save(update_fields=['state'])
+                self.assertEqual(self.version(), version)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+
+        self.assertEqual(self.version(), version)
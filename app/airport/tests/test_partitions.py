@@ -0,0 +1,154 @@
+from datetime import date, datetime
+from io import StringIO
+from unittest import skipIf, skipUnless
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from airport import partitions
+from airport.models import Aircraft, StateChangeLog
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class PartitionNamingTests(SimpleTestCase):
+
+    def test_monthly_partition_name_and_range(self):
+        name = partitions.partition_name(date(2030, 12, 1), partitions.MONTH)
+
+        self.assertEqual(name, 'airport_statechangelog_p203012')
+        self.assertEqual(partitions.partition_range(name), (date(2030, 12, 1), date(2031, 1, 1)))
+
+    def test_daily_partition_name_and_range(self):
+        name = partitions.partition_name(date(2030, 2, 28), partitions.DAY)
+
+        self.assertEqual(name, 'airport_statechangelog_p20300228')
+        self.assertEqual(partitions.partition_range(name), (date(2030, 2, 28), date(2030, 3, 1)))
+
+    def test_default_partition_has_no_range(self):
+        self.assertIsNone(partitions.partition_range(partitions.DEFAULT_PARTITION))
+
+    def test_period_start_is_in_utc(self):
+        moment = datetime(2030, 2, 1, 0, 30, tzinfo=timezone.get_fixed_timezone(60))
+
+        self.assertEqual(partitions.period_start(moment, partitions.MONTH), date(2030, 1, 1))
+
+    @override_settings(AIRPORT_LOG_PARTITION_INTERVAL='week')
+    def test_unknown_interval_is_rejected(self):
+        with self.assertRaises(ValueError):
+            partitions.get_interval()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Log partitioning requires PostgreSQL')
+class PartitionMaintenanceTests(TestCase):
+
+    def setUp(self):
+        # partitions can't be altered while deferred foreign key checks are pending
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+    def partition_of(self, log):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM airport_statechangelog WHERE id = %s', [log.pk])
+            return cursor.fetchone()[0]
+
+    def create_log(self, time):
+        return StateChangeLog.objects.create(
+            aircraft=create_aircraft(f'CS{StateChangeLog.objects.count()}'),
+            from_state='PARKED',
+            to_state='TAKE_OFF',
+            outcome='ACCEPTED',
+            time=time
+        )
+
+    def test_log_table_is_partitioned(self):
+        self.assertTrue(partitions.is_partitioned(connection))
+        self.assertIn(partitions.DEFAULT_PARTITION, partitions.attached_partitions(connection))
+
+    def test_future_partitions_are_created_once(self):
+        created = partitions.ensure_partitions(connection, now=utc(2030, 1, 15), ahead=2)
+
+        self.assertEqual(created, [
+            'airport_statechangelog_p203001',
+            'airport_statechangelog_p203002',
+            'airport_statechangelog_p203003',
+        ])
+        self.assertEqual(partitions.ensure_partitions(connection, now=utc(2030, 1, 15), ahead=2), [])
+
+    def test_logs_are_moved_from_default_partition_to_new_partition(self):
+        log = self.create_log(utc(2030, 3, 5))
+        self.assertEqual(self.partition_of(log), partitions.DEFAULT_PARTITION)
+
+        partitions.ensure_partitions(connection, now=utc(2030, 3, 1), ahead=0)
+
+        self.assertEqual(self.partition_of(log), 'airport_statechangelog_p203003')
+
+    def test_daily_partitions_skip_periods_covered_by_monthly_partition(self):
+        partitions.ensure_partitions(connection, now=utc(2030, 1, 1), ahead=0)
+
+        with self.settings(AIRPORT_LOG_PARTITION_INTERVAL='day'):
+            created = partitions.ensure_partitions(connection, now=utc(2030, 1, 31), ahead=1)
+
+        self.assertEqual(created, ['airport_statechangelog_p20300201'])
+
+    def test_expired_partition_is_detached_and_archived(self):
+        partitions.ensure_partitions(connection, since=utc(2020, 1, 1), now=utc(2020, 1, 1), ahead=0)
+        old = self.create_log(utc(2020, 1, 10))
+        recent = self.create_log(timezone.now())
+
+        out = StringIO()
+        call_command('manage_log_partitions', retention_days=30, ahead=0, stdout=out)
+
+        self.assertIn('Detached airport_statechangelog_p202001', out.getvalue())
+        self.assertIn('airport_statechangelog_archived_202001', partitions.archived_partitions(connection))
+        self.assertEqual(list(StateChangeLog.objects.values_list('pk', flat=True)), [recent.pk])
+
+        # archived logs don't prevent removal of their aircraft
+        old.aircraft.delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM airport_statechangelog_archived_202001')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_archived_partitions_are_dropped(self):
+        partitions.ensure_partitions(connection, now=utc(2030, 1, 1), ahead=0)
+        partitions.detach_partition(connection, 'airport_statechangelog_p203001')
+
+        call_command('manage_log_partitions', drop=True, retention_days=0, ahead=0, stdout=StringIO())
+
+        self.assertEqual(partitions.archived_partitions(connection), [])
+
+    def test_dry_run_changes_nothing(self):
+        out = StringIO()
+
+        call_command('manage_log_partitions', ahead=24, dry_run=True, stdout=out)
+
+        self.assertIn('Created', out.getvalue())
+        self.assertIn('Dry run', out.getvalue())
+        self.assertEqual(partitions.ensure_partitions(connection, ahead=0), [])
+        self.assertLess(len(partitions.attached_partitions(connection)), 24)
+
+
+@skipIf(connection.vendor == 'postgresql', 'Log table is partitioned on PostgreSQL')
+class UnpartitionedLogsTests(TestCase):
+
+    def test_command_requires_partitioned_table(self):
+        with self.assertRaises(CommandError):
+            call_command('manage_log_partitions', stdout=StringIO())
@@ -0,0 +1,251 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.engine import get_state_engine, reset_state_engine
+from airport.models import (
+    Aircraft, AirportResources, AirportStateEpoch, RunwaySlot, StateChangeLog, default_airport
+)
+from airport.runway import enqueue, grant_slots
+from airport.tasks import runway_scheduler
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class RunwayQueueMixin:
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def post_intent(self, call_sign, payload):
+        return self.client.post(f'/api/{call_sign}/intent/', dict(payload, public_key='valid public key'))
+
+
+@override_settings(AIRPORT_RUNAWAYS=1, AIRPORT_RUNWAY_SLOT_SECONDS=60, AIRPORT_RUNWAY_QUEUE_SIZE=50)
+class RunwayQueueTests(RunwayQueueMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        create_aircraft('CS3', state='APPROACH')
+
+    def test_intent_waits_for_occupied_runway(self):
+        response = self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual((response.data['call_sign'], response.data['state']), ('CS2', 'TAKE_OFF'))
+        self.assertEqual(response.data['position'], 1)
+        self.assertAlmostEqual(
+            response.data['estimated_slot'], timezone.now() + timedelta(seconds=60), delta=timedelta(seconds=5)
+        )
+        self.assertEqual(Aircraft.objects.get(call_sign='CS2').state, 'PARKED')
+        self.assertFalse(StateChangeLog.objects.exists())
+
+    def test_intent_without_queue_is_rejected(self):
+        response = self.post_intent('CS2', {'state': 'TAKE_OFF'})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(RunwaySlot.objects.exists())
+        self.assertEqual(StateChangeLog.objects.get().outcome, 'REJECTED')
+
+    def test_other_conflicts_are_not_queued(self):
+        response = self.post_intent('CS2', {'state': 'LANDED', 'queue': True})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(RunwaySlot.objects.exists())
+
+    def test_new_aircraft_is_not_queued(self):
+        response = self.post_intent('NEW1', {'type': 'PRIVATE', 'state': 'LANDED', 'queue': True})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(RunwaySlot.objects.exists())
+
+    def test_slots_are_queued_in_order(self):
+        first = self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': 'true'})
+        second = self.post_intent('CS3', {'state': 'LANDED', 'queue': 'true'})
+
+        self.assertEqual((first.data['position'], second.data['position']), (1, 2))
+        self.assertGreater(second.data['estimated_slot'], first.data['estimated_slot'])
+
+        # waiting aircraft asking again keeps its position
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True}).data['position'], 1)
+        self.assertEqual(RunwaySlot.objects.count(), 2)
+
+    @override_settings(AIRPORT_RUNWAY_QUEUE_SIZE=1)
+    def test_full_queue_rejects_intent(self):
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+
+        response = self.post_intent('CS3', {'state': 'LANDED', 'queue': True})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(RunwaySlot.objects.count(), 1)
+
+    def test_queue_is_checked_holding_resources_lock(self):
+        aircraft = Aircraft.objects.get(call_sign='CS2')
+
+        with patch('airport.runway.AirportResources.lock', wraps=AirportResources.lock) as lock:
+            slot = enqueue(aircraft, 'TAKE_OFF')
+
+        lock.assert_called_once_with(aircraft.airport)
+        self.assertEqual(slot.aircraft, aircraft)
+
+    def test_slot_can_be_read(self):
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+
+        response = self.client.get('/api/CS2/runway_slot/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['position'], 1)
+        self.assertEqual(self.client.get('/api/CS3/runway_slot/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_slot_cannot_be_read_without_key(self):
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+        self.public_key_is_valid.return_value = False
+
+        response = self.client.get('/api/CS2/runway_slot/')
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_slot_is_not_granted_while_runway_is_occupied(self):
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+
+        self.assertEqual(grant_slots(default_airport()), 0)
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS2').state, 'PARKED')
+        self.assertTrue(RunwaySlot.objects.exists())
+
+    def test_slots_are_granted_in_order_when_runway_is_free(self):
+        self.post_intent('CS3', {'state': 'LANDED', 'queue': True})
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+        self.post_intent('CS1', {'state': 'AIRBORNE'})
+
+        self.assertEqual(grant_slots(default_airport()), 1)
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS3').state, 'LANDED')
+        self.assertEqual(Aircraft.objects.get(call_sign='CS2').state, 'PARKED')
+        log = StateChangeLog.objects.get(aircraft__call_sign='CS3')
+        self.assertEqual((log.from_state, log.to_state, log.outcome), ('APPROACH', 'LANDED', 'ACCEPTED'))
+        self.assertEqual(AirportResources.current().runways_in_use, 1)
+        self.assertEqual(RunwaySlot.objects.get().aircraft.call_sign, 'CS2')
+
+    def test_slot_which_is_no_longer_valid_is_dropped(self):
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+        self.post_intent('CS3', {'state': 'LANDED', 'queue': True})
+        Aircraft.objects.filter(call_sign__in=['CS1', 'CS2']).update(state='AIRBORNE')
+        AirportResources.recalculate()
+
+        self.assertEqual(runway_scheduler(), 1)
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS3').state, 'LANDED')
+        log = StateChangeLog.objects.get(aircraft__call_sign='CS2')
+        self.assertEqual((log.outcome, log.description), ('REJECTED', 'Not a valid state change'))
+        self.assertFalse(RunwaySlot.objects.exists())
+
+
+@override_settings(AIRPORT_RUNAWAYS=1, AIRPORT_INTENT_BACKEND='memory')
+class RunwayQueueStateEngineTests(RunwayQueueMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        reset_state_engine()
+
+    def tearDown(self):
+        reset_state_engine()
+        super().tearDown()
+
+    def test_granted_slot_is_seen_by_engine(self):
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        get_state_engine().reconcile()
+
+        self.assertEqual(self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True}).status_code,
+                         status.HTTP_202_ACCEPTED)
+        self.post_intent('CS1', {'state': 'AIRBORNE'})
+        self.assertEqual(grant_slots(default_airport()), 1)
+
+        # engine reloads state changed by the grant
+        self.assertEqual(self.post_intent('CS2', {'state': 'AIRBORNE'}).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(get_state_engine().get_aircraft('CS2').state, 'AIRBORNE')
+
+
+@override_settings(AIRPORT_RUNAWAYS=1)
+class RunwayReleaseTests(RunwayQueueMixin, TransactionTestCase):
+
+    @patch('airport.tasks.runway_scheduler.delay')
+    def test_released_runway_is_granted_to_waiting_aircraft(self, delay):
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        waiting = self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+
+        self.assertEqual(self.post_intent('CS1', {'state': 'AIRBORNE'}).status_code, status.HTTP_204_NO_CONTENT)
+
+        # granted by a worker, not by the releasing request
+        delay.assert_called_once_with(default_airport())
+        self.assertEqual(Aircraft.objects.get(call_sign='CS2').state, 'PARKED')
+        self.assertEqual(runway_scheduler(default_airport()), 1)
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS2').state, 'TAKE_OFF')
+        log = StateChangeLog.objects.get(aircraft__call_sign='CS2')
+        self.assertEqual((log.outcome, log.description), ('ACCEPTED', 'Runway slot granted'))
+        self.assertLessEqual(log.time, parse_datetime(waiting.data['estimated_slot'].isoformat()))
+        self.assertFalse(RunwaySlot.objects.exists())
+
+    @patch('airport.tasks.runway_scheduler.delay')
+    def test_release_without_waiting_aircraft_requests_nothing(self, delay):
+        create_aircraft('CS1', state='TAKE_OFF')
+
+        self.post_intent('CS1', {'state': 'AIRBORNE'})
+
+        delay.assert_not_called()
+
+    @patch('airport.tasks.runway_scheduler.delay', side_effect=ConnectionError)
+    def test_failed_request_keeps_released_runway(self, delay):
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+
+        with self.assertLogs('airport.tasks', 'ERROR'):
+            response = self.post_intent('CS1', {'state': 'AIRBORNE'})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, 'AIRBORNE')
+        self.assertTrue(RunwaySlot.objects.exists())
+
+    @override_settings(AIRPORT_INTENT_BACKEND='memory')
+    @patch('airport.tasks.runway_scheduler.delay')
+    def test_grant_reloads_engines_of_all_processes(self, delay):
+        reset_state_engine()
+        self.addCleanup(reset_state_engine)
+        create_aircraft('CS1', state='TAKE_OFF')
+        create_aircraft('CS2', state='PARKED')
+        self.post_intent('CS2', {'state': 'TAKE_OFF', 'queue': True})
+        self.post_intent('CS1', {'state': 'AIRBORNE'})
+        epoch = AirportStateEpoch.current().get(default_airport(), 0)
+
+        self.assertEqual(runway_scheduler(default_airport()), 1)
+
+        self.assertEqual(AirportStateEpoch.current(), {default_airport(): epoch + 1})
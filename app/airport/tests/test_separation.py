@@ -0,0 +1,144 @@
+import itertools
+import math
+from datetime import datetime
+
+import numpy as np
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from airport import separation
+from airport.models import Aircraft, SeparationAlert
+from airport.tasks import separation_check
+
+
+def create_aircraft(call_sign, state='AIRBORNE', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class FindClosePairsTests(TestCase):
+
+    def pairs(self, x, y, z, horizontal=5, vertical=1000):
+        points = np.column_stack([np.array(x, dtype=float), np.array(y, dtype=float)]).reshape(-1, 2)
+        first, second, _, _ = separation.find_close_pairs(points, np.array(z, dtype=float), horizontal, vertical)
+        return sorted(zip(first.tolist(), second.tolist()))
+
+    def test_pairs_in_neighbouring_cells_are_found(self):
+        # cells are 5 km wide, every pair is across a cell border
+        x = [4.9, 5.1, 14.9, 15.1, 24.9, 25.1]
+        y = [4.9, 5.1, 0, 0, 9.9, 5.1]
+
+        self.assertEqual(self.pairs(x, y, [0] * 6), [(0, 1), (2, 3), (4, 5)])
+
+    def test_pairs_are_separated_vertically(self):
+        self.assertEqual(self.pairs([0, 1, 2], [0, 0, 0], [0, 2000, 2500]), [(1, 2)])
+
+    def test_no_pairs_with_less_than_two_aircraft(self):
+        self.assertEqual(self.pairs([], [], []), [])
+        self.assertEqual(self.pairs([0], [0], [0]), [])
+
+    def test_same_pairs_as_checking_all_pairs(self):
+        random = np.random.RandomState(1)
+        x, y, z = random.uniform(-50, 50, 500), random.uniform(-50, 50, 500), random.uniform(0, 20000, 500)
+
+        expected = [
+            (i, j) for i, j in itertools.combinations(range(500), 2)
+            if math.hypot(x[i] - x[j], y[i] - y[j]) < 5 and abs(z[i] - z[j]) < 1000
+        ]
+
+        self.assertTrue(expected)
+        self.assertEqual(self.pairs(x, y, z), expected)
+
+    def test_pairs_are_found_in_three_dimensions(self):
+        random = np.random.RandomState(2)
+        points, z = random.uniform(-30, 30, (300, 3)), np.zeros(300)
+
+        expected = [
+            (i, j) for i, j in itertools.combinations(range(300), 2)
+            if np.linalg.norm(points[i] - points[j]) < 5
+        ]
+        first, second, _, _ = separation.find_close_pairs(points, z, 5, 1000)
+
+        self.assertTrue(expected)
+        self.assertEqual(sorted(zip(first.tolist(), second.tolist())), expected)
+
+
+class ProjectTests(TestCase):
+
+    def distance(self, first, second):
+        points = separation.project(np.array([first[0], second[0]]), np.array([first[1], second[1]]))
+        return float(np.linalg.norm(points[0] - points[1]))
+
+    def test_every_point_is_scaled_by_its_latitude(self):
+        # 0.08 degree of longitude is 4.45 km at 60 degrees, whatever else is in flight
+        points = separation.project(np.array([60, 60, 0]), np.array([20, 20.08, 20]))
+
+        self.assertAlmostEqual(float(np.linalg.norm(points[0] - points[1])), 4.45, places=2)
+
+    def test_distance_across_180th_meridian(self):
+        self.assertAlmostEqual(self.distance((0, 179.99), (0, -179.99)), 2.22, places=2)
+
+    def test_distance_near_pole(self):
+        self.assertAlmostEqual(self.distance((89.99, 0), (89.99, 180)), 2.22, places=2)
+
+
+@override_settings(AIRPORT_SEPARATION_HORIZONTAL_KM=5, AIRPORT_SEPARATION_VERTICAL=1000)
+class CheckSeparationTests(TestCase):
+
+    def setUp(self):
+        # 0.01 degree of latitude is about 1.1 km
+        self.first = create_aircraft('CS1', latitude=44.80, longitude=20.30, altitude=3000)
+        self.second = create_aircraft('CS2', latitude=44.81, longitude=20.30, altitude=3500)
+        self.far = create_aircraft('CS3', latitude=45.50, longitude=20.30, altitude=3000)
+
+    def test_conflict_opens_alert(self):
+        self.assertEqual(separation_check(), 1)
+
+        alert = SeparationAlert.objects.get()
+        self.assertEqual((alert.aircraft, alert.other), (self.first, self.second))
+        self.assertAlmostEqual(alert.horizontal_distance, 1.11, places=2)
+        self.assertEqual(alert.vertical_distance, 500)
+        self.assertIsNone(alert.resolved)
+
+    def test_ongoing_conflict_updates_open_alert(self):
+        separation.check_separation(now=utc(2026, 1, 1, 10))
+        Aircraft.objects.filter(pk=self.second.pk).update(altitude=3800)
+
+        separation.check_separation(now=utc(2026, 1, 1, 10, 1))
+
+        alert = SeparationAlert.objects.get()
+        self.assertEqual(alert.vertical_distance, 800)
+        self.assertEqual((alert.started, alert.last_seen), (utc(2026, 1, 1, 10), utc(2026, 1, 1, 10, 1)))
+
+    def test_separated_pair_resolves_alert(self):
+        separation.check_separation(now=utc(2026, 1, 1, 10))
+        Aircraft.objects.filter(pk=self.second.pk).update(altitude=5000)
+
+        self.assertEqual(separation.check_separation(now=utc(2026, 1, 1, 10, 1)), 0)
+
+        self.assertEqual(SeparationAlert.objects.get().resolved, utc(2026, 1, 1, 10, 1))
+
+        # new conflict of the same pair opens a new alert
+        Aircraft.objects.filter(pk=self.second.pk).update(altitude=3000)
+        separation.check_separation(now=utc(2026, 1, 1, 10, 2))
+        self.assertEqual(SeparationAlert.objects.filter(resolved__isnull=True).count(), 1)
+        self.assertEqual(SeparationAlert.objects.count(), 2)
+
+    def test_aircraft_on_the_ground_are_not_checked(self):
+        Aircraft.objects.filter(pk=self.second.pk).update(state=Aircraft.PARKED)
+
+        self.assertEqual(separation.check_separation(), 0)
+        self.assertFalse(SeparationAlert.objects.exists())
@@ -0,0 +1,202 @@
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport import spatial
+from airport.models import Aircraft
+
+
+def create_aircraft(call_sign, state='AIRBORNE', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class GridTests(TestCase):
+
+    def test_cells_are_numbered_by_rows_from_south_west(self):
+        self.assertEqual(spatial.grid_cell(-90, -180, size=1), 0)
+        self.assertEqual(spatial.grid_cell(-90, -179, size=1), 1)
+        self.assertEqual(spatial.grid_cell(-89, -180, size=1), 360)
+        self.assertEqual(spatial.grid_cell(90, 180, size=1), 180 * 360 - 1)
+
+    def test_positions_outside_of_grid_are_kept_in_edge_cells(self):
+        self.assertEqual(spatial.grid_cell(1000, 1000, size=1), spatial.grid_cell(90, 180, size=1))
+
+    def test_box_is_covered_by_one_range_per_row(self):
+        ranges = spatial.cell_ranges(0.5, 10.5, 2.5, 12.5, size=1)
+
+        self.assertEqual(ranges, [
+            (90 * 360 + 190, 90 * 360 + 192),
+            (91 * 360 + 190, 91 * 360 + 192),
+            (92 * 360 + 190, 92 * 360 + 192),
+        ])
+
+    def test_box_around_the_world_is_single_range(self):
+        self.assertEqual(spatial.cell_ranges(0.5, -180, 2.5, 180, size=1), [(90 * 360, 92 * 360 + 359)])
+
+    def test_box_crossing_180th_meridian_is_split(self):
+        self.assertEqual(spatial.longitude_spans(170, -170), [(170, 180), (-180, -170)])
+
+    def test_bounding_box_of_distance(self):
+        min_latitude, min_longitude, max_latitude, max_longitude = spatial.bounding_box(0, 179.9, 111.2)
+
+        self.assertAlmostEqual(min_latitude, -1, places=2)
+        self.assertAlmostEqual(max_latitude, 1, places=2)
+        self.assertAlmostEqual(min_longitude, 178.9, places=1)
+        self.assertAlmostEqual(max_longitude, -179.1, places=1)
+
+    def test_distance(self):
+        # Belgrade to Novi Sad
+        self.assertAlmostEqual(spatial.distance_km(44.8184, 20.3091, 45.2671, 19.8335), 62, delta=1)
+
+
+class GridIndexMaintenanceTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def location(self, longitude, latitude):
+        return {
+            'type': 'AIRLINER',
+            'longitude': longitude,
+            'latitude': latitude,
+            'altitude': 3500,
+            'heading': 220,
+        }
+
+    def test_new_aircraft_is_indexed(self):
+        aircraft = create_aircraft('CS1', longitude=20.45, latitude=44.82)
+
+        self.assertEqual(aircraft.grid_cell, spatial.grid_cell(44.82, 20.45))
+
+    def test_location_update_moves_aircraft_to_new_cell(self):
+        create_aircraft('CS1')
+
+        self.client.put('/api/CS1/location/', dict(self.location(20.45, 44.82), public_key='valid public key'))
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').grid_cell, spatial.grid_cell(44.82, 20.45))
+
+    def test_bulk_location_update_moves_aircraft_to_new_cells(self):
+        create_aircraft('CS1')
+        create_aircraft('CS2')
+
+        self.client.put('/api/locations/', {
+            'public_key': 'valid public key',
+            'locations': [
+                dict(self.location(20.45, 44.82), call_sign='CS1'),
+                dict(self.location(-73.78, 40.64), call_sign='CS2'),
+            ]
+        }, format='json')
+
+        self.assertEqual(
+            list(Aircraft.objects.order_by('call_sign').values_list('grid_cell', flat=True)),
+            [spatial.grid_cell(44.82, 20.45), spatial.grid_cell(40.64, -73.78)]
+        )
+
+    def test_database_index_matches_python(self):
+        positions = [(44.82, 20.45), (-33.94, 151.18), (0, 0), (-90, -180), (90, 180), (40.64, -73.78)]
+        for n, (latitude, longitude) in enumerate(positions):
+            create_aircraft(f'CS{n}', latitude=latitude, longitude=longitude)
+
+        Aircraft.objects.update(grid_cell=-1)
+        spatial.reindex(Aircraft.objects.all())
+
+        self.assertEqual(
+            list(Aircraft.objects.order_by('call_sign').values_list('grid_cell', flat=True)),
+            [spatial.grid_cell(latitude, longitude) for latitude, longitude in positions]
+        )
+
+    @override_settings(AIRPORT_GRID_CELL_SIZE=1)
+    def test_reindex_command(self):
+        aircraft = create_aircraft('CS1', longitude=20.45, latitude=44.82)
+        Aircraft.objects.update(grid_cell=0)
+
+        call_command('reindex_aircraft_grid', stdout=StringIO())
+
+        aircraft.refresh_from_db()
+        self.assertEqual(aircraft.grid_cell, spatial.grid_cell(44.82, 20.45, size=1))
+
+
+@override_settings(AIRPORT_LATITUDE=44.8184, AIRPORT_LONGITUDE=20.3091)
+class SpatialApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        create_aircraft('BEG', latitude=44.82, longitude=20.31)
+        create_aircraft('NOVI_SAD', latitude=45.2671, longitude=19.8335)
+        create_aircraft('NIS', latitude=43.3209, longitude=21.8954)
+        create_aircraft('FIJI', latitude=-17.0, longitude=179.97)
+        create_aircraft('SAMOA', latitude=-17.0, longitude=-179.95)
+
+    def call_signs(self, response):
+        return [aircraft['call_sign'] for aircraft in response.data]
+
+    def test_aircraft_within_bounding_box(self):
+        res = self.client.get('/api/aircraft/within/', {
+            'min_latitude': 44, 'min_longitude': 19, 'max_latitude': 46, 'max_longitude': 21
+        })
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.call_signs(res), ['BEG', 'NOVI_SAD'])
+        self.assertIn('ETag', res)
+
+    def test_bounding_box_crossing_180th_meridian(self):
+        res = self.client.get('/api/aircraft/within/', {
+            'min_latitude': -18, 'min_longitude': 179, 'max_latitude': -16, 'max_longitude': -179
+        })
+
+        self.assertEqual(self.call_signs(res), ['FIJI', 'SAMOA'])
+
+    def test_query_reads_only_cells_of_the_box(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/aircraft/within/', {
+                'min_latitude': 44, 'min_longitude': 19, 'max_latitude': 46, 'max_longitude': 21
+            })
+
+        self.assertIn('grid_cell', queries.captured_queries[-1]['sql'])
+
+    def test_invalid_bounding_box_returns_400(self):
+        res = self.client.get('/api/aircraft/within/', {
+            'min_latitude': 46, 'min_longitude': 19, 'max_latitude': 44, 'max_longitude': 21
+        })
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+        res = self.client.get('/api/aircraft/within/', {'min_latitude': 44})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_aircraft_near_the_airport_closest_first(self):
+        res = self.client.get('/api/aircraft/nearby/', {'distance': 100})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.call_signs(res), ['BEG', 'NOVI_SAD'])
+        self.assertLess(res.data[0]['distance'], 1)
+        self.assertAlmostEqual(res.data[1]['distance'], 62, delta=1)
+
+    def test_aircraft_near_given_position(self):
+        res = self.client.get('/api/aircraft/nearby/', {'distance': 50, 'latitude': -17, 'longitude': 180})
+
+        self.assertEqual(self.call_signs(res), ['FIJI', 'SAMOA'])
+
+    def test_distance_is_required(self):
+        self.assertEqual(self.client.get('/api/aircraft/nearby/').status_code, status.HTTP_400_BAD_REQUEST)
@@ -1,4 +1,6 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APIClient
 from rest_framework import status
@@ -77,3 +79,83 @@ class StateChangeLogApiTests(TestCase):
         self.assertNotIn(serialized_log2.data, res.data['results'])
         self.assertIn(serialized_log3.data, res.data['results'])
         self.assertIn(serialized_log4.data, res.data['results'])
+
+
+class StateChangeLogKeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        aircraft = create_aircraft('A1', state='PARKED', type='AIRLINER')
+        self.logs = [create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED', description=str(i)) for i in range(5)]
+
+    def descriptions(self, res):
+        return [log['description'] for log in res.data['results']]
+
+    def test_cursor_pages_through_logs_newest_first_without_count(self):
+        res = self.client.get('/api/state_logs/?cursor=&limit=2')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', res.data)
+        self.assertEqual(self.descriptions(res), ['4', '3'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(self.descriptions(res), ['2', '1'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(self.descriptions(res), ['0'])
+        self.assertIsNone(res.data['next'])
+
+    def test_cursor_page_does_not_count_logs(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/state_logs/?cursor=&limit=2')
+
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+    def test_cursor_handles_logs_written_at_same_time(self):
+        StateChangeLog.objects.update(time=self.logs[0].time)
+
+        res = self.client.get('/api/state_logs/?cursor=&limit=3')
+        res = self.client.get(res.data['next'])
+
+        self.assertEqual(self.descriptions(res), ['1', '0'])
+
+    def test_since_returns_only_new_logs(self):
+        res = self.client.get('/api/state_logs/?since=&limit=2')
+
+        self.assertEqual(self.descriptions(res), ['3', '4'])
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(self.descriptions(res), [])
+
+        create_log(self.logs[0].aircraft, 'TAKE_OFF', 'AIRBORNE', 'ACCEPTED', description='5')
+        create_log(self.logs[0].aircraft, 'AIRBORNE', 'APPROACH', 'ACCEPTED', description='6')
+
+        res = self.client.get(res.data['next'])
+        self.assertEqual(self.descriptions(res), ['5', '6'])
+
+    def test_invalid_cursor_returns_404(self):
+        res = self.client.get('/api/state_logs/?cursor=invalid')
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StateChangeLogQueryCountTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(100):
+            aircraft = create_aircraft(f'A{i}', state='PARKED', type='AIRLINER')
+            create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+
+    def test_call_signs_are_fetched_with_logs(self):
+        # count and page with aircraft joined
+        with self.assertNumQueries(2):
+            res = self.client.get('/api/state_logs/?limit=100')
+
+        self.assertEqual(len(res.data['results']), 100)
+
+    def test_keyset_page_is_single_query(self):
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/state_logs/?cursor=&limit=100')
+
+        self.assertEqual(len(res.data['results']), 100)
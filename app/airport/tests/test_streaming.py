@@ -0,0 +1,253 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from airport.models import Aircraft, StateChangeLog
+from airport.pagination import encode_position
+from airport.streaming import broadcaster, publish_state_logs, reset_broker, state_log_stream
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+def create_log(aircraft, from_state, to_state, outcome, description=""):
+    return StateChangeLog.objects.create(
+        aircraft=aircraft,
+        from_state=from_state,
+        to_state=to_state,
+        outcome=outcome,
+        description=description
+    )
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def wait_for_subscribers(count):
+    while broadcaster.subscriber_count < count:
+        await asyncio.sleep(0.01)
+
+
+class StreamClient:
+    """Drives ASGI stream application like a HTTP server would."""
+
+    def __init__(self):
+        self.disconnect = asyncio.Event()
+        self.messages = []
+        self.body = asyncio.Queue()
+
+    async def receive(self):
+        await self.disconnect.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        self.messages.append(message)
+        if message['type'] == 'http.response.body':
+            await self.body.put(message['body'])
+
+    def connect(self, headers=(), query_string=b''):
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/api/state_logs/stream/',
+            'headers': list(headers),
+            'query_string': query_string,
+        }
+        return asyncio.ensure_future(state_log_stream(scope, self.receive, self.send))
+
+
+def event_id(body):
+    return body.decode().split('\n')[0][len('id: '):]
+
+
+@override_settings(AIRPORT_STREAM_BACKEND='local')
+class StateLogStreamTests(TestCase):
+
+    def setUp(self):
+        reset_broker()
+
+    def tearDown(self):
+        reset_broker()
+
+    def test_published_logs_are_sent_to_all_subscribers_as_events(self):
+        aircraft = create_aircraft('CS1')
+        log = create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+
+        async def scenario():
+            clients = [StreamClient(), StreamClient()]
+            streams = [client.connect() for client in clients]
+            await wait_for_subscribers(2)
+
+            publish_state_logs([log])
+
+            bodies = []
+            for client in clients:
+                await client.body.get()  # connected comment
+                bodies.append(await asyncio.wait_for(client.body.get(), 1))
+                client.disconnect.set()
+
+            await asyncio.gather(*streams)
+            return clients, bodies
+
+        clients, bodies = run(scenario())
+
+        start = clients[0].messages[0]
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+
+        for body in bodies:
+            lines = body.decode().strip().split('\n')
+            self.assertEqual(lines[0], f'id: {encode_position(log)}')
+            self.assertEqual(lines[1], 'event: state_log')
+            data = json.loads(lines[2][len('data: '):])
+            self.assertEqual(data['call_sign'], 'CS1')
+            self.assertEqual(data['to_state'], 'TAKE_OFF')
+
+        self.assertEqual(broadcaster.subscriber_count, 0)
+
+    @override_settings(AIRPORT_STREAM_KEEPALIVE=0.01)
+    def test_idle_stream_sends_keepalive(self):
+        async def scenario():
+            client = StreamClient()
+            stream = client.connect()
+            await client.body.get()
+            body = await asyncio.wait_for(client.body.get(), 1)
+            client.disconnect.set()
+            await stream
+            return body
+
+        self.assertEqual(run(scenario()), b': keepalive\n\n')
+
+    @override_settings(AIRPORT_STREAM_QUEUE_SIZE=2)
+    def test_stream_of_subscriber_falling_behind_is_ended(self):
+        aircraft = create_aircraft('CS1')
+        logs = [create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED') for _ in range(3)]
+
+        async def scenario():
+            client = StreamClient()
+            stream = client.connect()
+            await wait_for_subscribers(1)
+
+            # queued before the stream gets to read any of them
+            publish_state_logs(logs)
+
+            await asyncio.wait_for(stream, 1)
+            return client
+
+        with patch('airport.streaming.logger') as logger:
+            client = run(scenario())
+
+        logger.warning.assert_called_once()
+        self.assertEqual(client.messages[-1], {'type': 'http.response.body', 'body': b''})
+        self.assertFalse([message for message in client.messages if message.get('body', b'').startswith(b'id: ')])
+        self.assertEqual(broadcaster.subscriber_count, 0)
+
+    def test_publishing_errors_are_not_propagated(self):
+        aircraft = create_aircraft('CS1')
+        log = create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+
+        with patch('airport.streaming.LocalBroker.publish', side_effect=ConnectionError), \
+                patch('airport.streaming.logger') as logger:
+            publish_state_logs([log])
+
+        logger.exception.assert_called_once()
+
+
+@override_settings(AIRPORT_STREAM_BACKEND='local')
+class StateLogPublishingTests(TransactionTestCase):
+
+    def test_created_log_is_published_after_commit(self):
+        aircraft = create_aircraft('CS1')
+
+        with patch('airport.signals.publish_state_logs') as publish:
+            log = create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED')
+
+        publish.assert_called_once_with([log])
+
+
+@override_settings(AIRPORT_STREAM_BACKEND='local', AIRPORT_STREAM_REPLAY_BATCH_SIZE=2)
+class StateLogStreamResumeTests(TransactionTestCase):
+
+    def setUp(self):
+        reset_broker()
+        aircraft = create_aircraft('CS1')
+        self.logs = [
+            create_log(aircraft, 'PARKED', 'TAKE_OFF', 'ACCEPTED'),
+            create_log(aircraft, 'TAKE_OFF', 'AIRBORNE', 'ACCEPTED'),
+            create_log(aircraft, 'AIRBORNE', 'APPROACH', 'ACCEPTED'),
+            create_log(aircraft, 'APPROACH', 'LANDED', 'ACCEPTED'),
+        ]
+
+    def tearDown(self):
+        reset_broker()
+
+    def stream(self, publish=(), **connect):
+        async def scenario():
+            client = StreamClient()
+            stream = client.connect(**connect)
+            await client.body.get()  # connected comment
+
+            publish_state_logs(publish)
+
+            bodies = []
+            while True:
+                try:
+                    bodies.append(await asyncio.wait_for(client.body.get(), 0.5))
+                except asyncio.TimeoutError:
+                    break
+
+            client.disconnect.set()
+            await stream
+            return [event_id(body) for body in bodies if body.startswith(b'id: ')]
+
+        return run(scenario())
+
+    def test_missed_logs_are_sent_after_last_event_id(self):
+        last_event_id = encode_position(self.logs[0]).encode()
+
+        ids = self.stream(headers=[(b'last-event-id', last_event_id)])
+
+        self.assertEqual(ids, [encode_position(log) for log in self.logs[1:]])
+
+    def test_last_event_id_can_be_sent_as_query_parameter(self):
+        query_string = f'last_event_id={encode_position(self.logs[2])}'.encode()
+
+        self.assertEqual(self.stream(query_string=query_string), [encode_position(self.logs[3])])
+
+    def test_logs_sent_as_missed_are_not_sent_again(self):
+        last_event_id = encode_position(self.logs[1]).encode()
+        new_log = create_log(self.logs[0].aircraft, 'LANDED', 'PARKED', 'ACCEPTED')
+
+        ids = self.stream(headers=[(b'last-event-id', last_event_id)], publish=self.logs[2:] + [new_log])
+
+        self.assertEqual(ids, [encode_position(log) for log in self.logs[2:] + [new_log]])
+
+    def test_published_log_older_than_missed_logs_is_sent(self):
+        # e.g. committed after the newer logs were replayed
+        last_event_id = encode_position(self.logs[2]).encode()
+
+        ids = self.stream(headers=[(b'last-event-id', last_event_id)], publish=[self.logs[1]])
+
+        self.assertEqual(ids, [encode_position(self.logs[3]), encode_position(self.logs[1])])
+
+    def test_invalid_last_event_id_is_ignored(self):
+        ids = self.stream(headers=[(b'last-event-id', b'invalid')], publish=[self.logs[3]])
+
+        self.assertEqual(ids, [encode_position(self.logs[3])])
@@ -1,7 +1,11 @@
-from django.test import TestCase
+import threading
+from unittest import skipUnless
 
-from airport.models import Aircraft, StateChangeLog
-from airport.tasks import ground_crew_routine
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+
+from airport.models import Aircraft, AirportResources, StateChangeLog, default_airport
+from airport.tasks import GROUND_CREW_LOCK, ground_crew_routine
 
 
 def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
@@ -52,3 +56,88 @@ class GroundCrewRoutineTests(TestCase):
         self.assertEqual(log.from_state, expected_from_state)
         self.assertEqual(log.to_state, expected_to_state)
         self.assertEqual(log.outcome, expected_outcome)
+
+    def test_parked_aircraft_moves_from_runway_to_parking_counter(self):
+        create_aircraft(
+            call_sign='CS1',
+            type='AIRLINER',
+            state=Aircraft.LANDED
+        )
+
+        ground_crew_routine()
+
+        resources = AirportResources.current()
+        self.assertEqual(resources.runways_in_use, 0)
+        self.assertEqual(resources.parked_airliners, 1)
+
+    def test_all_landed_aircraft_are_parked_in_one_run(self):
+        for i in range(3):
+            create_aircraft(call_sign=f'CS{i}', type='AIRLINER', state=Aircraft.LANDED)
+        create_aircraft(call_sign='PRIVATE', type='PRIVATE', state=Aircraft.LANDED)
+
+        self.assertEqual(ground_crew_routine(), 4)
+
+        self.assertFalse(Aircraft.objects.filter(state=Aircraft.LANDED).exists())
+        self.assertEqual(StateChangeLog.objects.filter(to_state=Aircraft.PARKED).count(), 4)
+        resources = AirportResources.current()
+        self.assertEqual(
+            (resources.runways_in_use, resources.parked_airliners, resources.parked_private),
+            (0, 3, 1)
+        )
+
+    @override_settings(AIRPORT_LARGE_PARKING_SPOTS=2, AIRPORT_SMALL_PARKING_SPOTS=1)
+    def test_only_aircraft_with_free_parking_spot_are_parked(self):
+        create_aircraft(call_sign='PARKED', type='AIRLINER', state=Aircraft.PARKED)
+        first = create_aircraft(call_sign='CS1', type='AIRLINER', state=Aircraft.LANDED)
+        create_aircraft(call_sign='CS2', type='AIRLINER', state=Aircraft.LANDED)
+        create_aircraft(call_sign='PRIVATE', type='PRIVATE', state=Aircraft.LANDED)
+
+        self.assertEqual(ground_crew_routine(), 2)
+
+        self.assertEqual(
+            set(Aircraft.objects.filter(state=Aircraft.LANDED).values_list('call_sign', flat=True)),
+            {'CS2'}
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.state, Aircraft.PARKED)
+
+    def test_number_of_queries_does_not_grow_with_landed_aircraft(self):
+        for i in range(5):
+            create_aircraft(call_sign=f'CS{i}', type='AIRLINER', state=Aircraft.LANDED)
+
+        # airports with landed aircraft, savepoint, ground crew lock
+        # (PostgreSQL) or reading landed rows, lock resources, landed
+        # airliners, landed private, park, update counters, insert logs,
+        # release savepoint
+        with self.assertNumQueries(10):
+            ground_crew_routine()
+
+    @skipUnless(connection.vendor == 'postgresql', 'Advisory locks require PostgreSQL')
+    def test_run_is_skipped_while_other_run_is_in_progress(self):
+        create_aircraft(call_sign='CS1', type='AIRLINER', state=Aircraft.LANDED)
+
+        locked = threading.Event()
+        done = threading.Event()
+
+        def other_run():
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s, hashtext(%s))',
+                                   [GROUND_CREW_LOCK, default_airport()])
+                    locked.set()
+                    done.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_run)
+        thread.start()
+        locked.wait(5)
+
+        try:
+            self.assertIsNone(ground_crew_routine())
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(Aircraft.objects.get(call_sign='CS1').state, Aircraft.LANDED)
+        self.assertEqual(ground_crew_routine(), 1)
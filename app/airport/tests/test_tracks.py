@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport import tracks
+from airport.models import Aircraft, AircraftTrack, AirportVersion
+
+
+def create_aircraft(call_sign, state='AIRBORNE', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@override_settings(AIRPORT_TRACK_SIZE=3)
+class AircraftTrackTests(TestCase):
+
+    def setUp(self):
+        self.aircraft = create_aircraft('CS1')
+
+    def fly(self, aircraft, altitudes, start=utc(2026, 1, 1)):
+        for n, altitude in enumerate(altitudes):
+            aircraft.altitude = altitude
+            aircraft.longitude = 20 + n / 10
+            tracks.record_positions([aircraft], time=start + timedelta(seconds=n))
+
+    def fixes(self, aircraft, limit=None):
+        track = AircraftTrack.objects.get(aircraft=aircraft)
+        return tracks.read_fixes(track.fixes, track.head, limit)
+
+    def test_fixes_are_read_oldest_first(self):
+        self.fly(self.aircraft, [1000, 2000])
+
+        fixes = self.fixes(self.aircraft)
+
+        self.assertEqual([fix['altitude'] for fix in fixes], [1000, 2000])
+        self.assertEqual(fixes[1]['time'], utc(2026, 1, 1, 0, 0, 1))
+        self.assertAlmostEqual(fixes[1]['longitude'], 20.1)
+
+    def test_oldest_fixes_are_overwritten(self):
+        self.fly(self.aircraft, [1000, 2000, 3000, 4000, 5000])
+
+        track = AircraftTrack.objects.get(aircraft=self.aircraft)
+        self.assertEqual(len(track.fixes), 3 * tracks.FIX.size)
+        self.assertEqual(track.head, 5)
+        self.assertEqual([fix['altitude'] for fix in self.fixes(self.aircraft)], [3000, 4000, 5000])
+        self.assertEqual([fix['altitude'] for fix in self.fixes(self.aircraft, limit=2)], [4000, 5000])
+
+    def test_tracks_of_many_aircraft_are_written_together(self):
+        other = create_aircraft('CS2')
+        self.fly(self.aircraft, [1000])
+
+        self.aircraft.altitude, other.altitude = 2000, 7000
+        tracks.record_positions([self.aircraft, other])
+
+        self.assertEqual([fix['altitude'] for fix in self.fixes(self.aircraft)], [1000, 2000])
+        self.assertEqual([fix['altitude'] for fix in self.fixes(other)], [7000])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Fixes are overlaid in place on PostgreSQL only')
+    def test_fixes_of_many_aircraft_are_written_with_one_query(self):
+        aircraft = [create_aircraft(f'MANY{n}') for n in range(20)]
+        tracks.record_positions(aircraft)
+
+        with self.assertNumQueries(1):
+            tracks.record_positions(aircraft)
+
+        self.assertEqual(AircraftTrack.objects.filter(head=2).count(), 20)
+
+    def test_existing_tracks_keep_their_size(self):
+        self.fly(self.aircraft, [1000, 2000, 3000])
+
+        with self.settings(AIRPORT_TRACK_SIZE=10):
+            self.fly(self.aircraft, [4000])
+
+        self.assertEqual([fix['altitude'] for fix in self.fixes(self.aircraft)], [2000, 3000, 4000])
+
+    def test_track_is_removed_with_aircraft(self):
+        self.fly(self.aircraft, [1000])
+
+        self.aircraft.delete()
+
+        self.assertFalse(AircraftTrack.objects.exists())
+
+
+@override_settings(AIRPORT_TRACK_SIZE=3)
+class AircraftTrackApiTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def location(self, altitude):
+        return {
+            'type': 'AIRLINER',
+            'longitude': 20.45,
+            'latitude': 44.82,
+            'altitude': altitude,
+            'heading': 220,
+        }
+
+    def test_location_updates_are_recorded(self):
+        create_aircraft('CS1')
+
+        for altitude in (1000, 2000):
+            self.client.put('/api/CS1/location/', dict(self.location(altitude), public_key='valid public key'))
+        self.client.put('/api/locations/', {
+            'public_key': 'valid public key',
+            'locations': [dict(self.location(3000), call_sign='CS1')]
+        }, format='json')
+
+        res = self.client.get('/api/CS1/track/')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['call_sign'], 'CS1')
+        self.assertEqual([fix['altitude'] for fix in res.data['fixes']], [1000, 2000, 3000])
+        self.assertEqual(res.data['fixes'][0]['latitude'], 44.82)
+
+        res = self.client.get('/api/CS1/track/', {'limit': 1})
+        self.assertEqual([fix['altitude'] for fix in res.data['fixes']], [3000])
+
+    def test_aircraft_without_fixes_has_empty_track(self):
+        create_aircraft('CS1')
+
+        res = self.client.get('/api/CS1/track/')
+
+        self.assertEqual(res.data['fixes'], [])
+
+    def test_unknown_aircraft_returns_404(self):
+        self.assertEqual(self.client.get('/api/CS1/track/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_limit_returns_400(self):
+        create_aircraft('CS1')
+
+        self.assertEqual(self.client.get('/api/CS1/track/', {'limit': 0}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/CS1/track/', {'limit': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AircraftTrackVersionTests(TransactionTestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.patcher = patch('airport.permissions.IsValidPublicKey.has_permission')
+        self.public_key_is_valid = self.patcher.start()
+        self.public_key_is_valid.return_value = True
+        self.aircraft = create_aircraft('CS1')
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def assert_version_bumped_after_track_is_written(self, update):
+        versions = []
+        record_positions = tracks.record_positions
+
+        def record(aircraft_list):
+            versions.append(AirportVersion.version_of(self.aircraft.airport))
+            record_positions(aircraft_list)
+
+        before = AirportVersion.version_of(self.aircraft.airport)
+        with patch('airport.views.record_positions', side_effect=record):
+            update()
+
+        self.assertEqual(versions, [before])
+        self.assertGreater(AirportVersion.version_of(self.aircraft.airport)[0], before[0])
+
+    def test_location_bumps_version_after_track_is_written(self):
+        self.assert_version_bumped_after_track_is_written(lambda: self.client.put('/api/CS1/location/', {
+            'public_key': 'valid public key', 'type': 'AIRLINER',
+            'longitude': 20.45, 'latitude': 44.82, 'altitude': 1000, 'heading': 220
+        }))
+
+    def test_locations_bump_version_after_tracks_are_written(self):
+        self.assert_version_bumped_after_track_is_written(lambda: self.client.put('/api/locations/', {
+            'public_key': 'valid public key',
+            'locations': [{'call_sign': 'CS1', 'type': 'AIRLINER', 'longitude': 20.45,
+                           'latitude': 44.82, 'altitude': 1000, 'heading': 220}]
+        }, format='json'))
@@ -0,0 +1,123 @@
+"""
+Position history of aircraft.
+
+Every location update appends a fix (time, longitude, latitude, altitude,
+heading) to the aircraft's `AircraftTrack`: a ring buffer of
+`AIRPORT_TRACK_SIZE` fixes packed into one binary column, so history takes
+one row per aircraft however often it reports. Old fixes are overwritten.
+
+On PostgreSQL fixes of many aircraft are written with a single UPDATE which
+overlays the slot in the database, so buffers don't travel to the app,
+other databases read and write the buffers. The update is not in place
+though: PostgreSQL writes a new row version with the whole buffer, which
+is TOASTed (stored out of line) above about 2 kB, roughly 60 fixes.
+Cost of every fix grows with `AIRPORT_TRACK_SIZE`.
+"""
+import struct
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from airport.models import AircraftTrack
+from airport.serializers import get_setting
+
+# time as UNIX timestamp, longitude, latitude, altitude, heading
+FIX = struct.Struct('<dddii')
+FIX_FIELDS = ('time', 'longitude', 'latitude', 'altitude', 'heading')
+
+
+def track_size():
+    return get_setting('AIRPORT_TRACK_SIZE', 100)
+
+
+def pack_fix(aircraft, time):
+    return FIX.pack(time.timestamp(), aircraft.longitude, aircraft.latitude,
+                    int(aircraft.altitude), int(aircraft.heading))
+
+
+def empty_buffer(size=None):
+    return bytes(FIX.size * (size or track_size()))
+
+
+def write_fix(buffer, head, fix):
+    """ Returns buffer with `fix` written to slot of the `head`-th fix."""
+
+    size = len(buffer) // FIX.size
+    offset = head % size * FIX.size
+    return buffer[:offset] + fix + buffer[offset + FIX.size:]
+
+
+def read_fixes(buffer, head, limit=None):
+    """ Returns up to `limit` most recent fixes, oldest first."""
+
+    buffer = bytes(buffer)
+    size = len(buffer) // FIX.size
+    count = min(head, size, size if limit is None else limit)
+
+    fixes = []
+    for n in range(head - count, head):
+        offset = n % size * FIX.size
+        values = FIX.unpack_from(buffer, offset)
+        fixes.append(dict(zip(FIX_FIELDS, values),
+                          time=datetime.fromtimestamp(values[0], tz=timezone.utc)))
+
+    return fixes
+
+
+def record_positions(aircraft_list, time=None):
+    """ Appends current positions of saved aircraft to their tracks."""
+
+    time = time or timezone.now()
+    fixes = {aircraft.pk: pack_fix(aircraft, time) for aircraft in aircraft_list}
+
+    if not fixes:
+        return
+
+    if connection.vendor == 'postgresql':
+        missing = overlay_fixes(fixes)
+        if missing:
+            create_tracks(missing)
+            overlay_fixes({pk: fixes[pk] for pk in missing})
+    else:
+        with transaction.atomic():
+            create_tracks(fixes.keys())
+            tracks = AircraftTrack.objects.select_for_update().filter(aircraft_id__in=fixes.keys())
+            for track in tracks:
+                track.fixes = write_fix(bytes(track.fixes), track.head, fixes[track.aircraft_id])
+                track.head += 1
+            AircraftTrack.objects.bulk_update(tracks, ['fixes', 'head'])
+
+
+def create_tracks(aircraft_ids):
+    AircraftTrack.objects.bulk_create(
+        [AircraftTrack(aircraft_id=pk, fixes=empty_buffer()) for pk in aircraft_ids],
+        ignore_conflicts=True
+    )
+
+
+def overlay_fixes(fixes):
+    """ Writes fixes into existing tracks with one UPDATE. Returns ids of
+    aircraft without a track."""
+
+    table = connection.ops.quote_name(AircraftTrack._meta.db_table)
+    values = ', '.join(['(%s, %s::bytea)'] * len(fixes))
+    params = [value for pk, fix in fixes.items() for value in (pk, fix)]
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} AS track
+            SET fixes = overlay(track.fixes placing fix.fix
+                                from (track.head %% (length(track.fixes) / {FIX.size}))::integer * {FIX.size} + 1
+                                for {FIX.size}),
+                head = track.head + 1
+            FROM (VALUES {values}) AS fix (aircraft_id, fix)
+            WHERE track.aircraft_id = fix.aircraft_id
+            RETURNING track.aircraft_id
+            """,
+            params
+        )
+        updated = {row[0] for row in cursor.fetchall()}
+
+    return set(fixes) - updated
@@ -3,9 +3,10 @@ from rest_framework.routers import DefaultRouter
 from airport.views import AircraftViewSet, StateChangeLogViewSet, StartSimulationViewSet
 
 router = DefaultRouter()
-router.register('', AircraftViewSet)
 router.register('state_logs', StateChangeLogViewSet)
 router.register('simulation', StartSimulationViewSet)
+# Registered last, aircraft detail route matches any first path segment
+router.register('', AircraftViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,18 +1,198 @@
+import math
+import time
+
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
 from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework.pagination import LimitOffsetPagination
 
-from airport.models import Aircraft, StateChangeLog
-from airport.serializers import AircraftSerializer, LocationSerializer, StateChangeLogSerializer
-from airport.permissions import IsValidPublicKey
-from airport.exceptions import StateConflict
+from airport.admission import get_redis_admission, invalidate_airport_state
+from airport.engine import get_state_engine, intent_change
+from airport.logwriter import write_state_log
+from airport.models import (Aircraft, AircraftTrack, Airport, AirportResources, AirportVersion, RunwaySlot,
+                            StateChangeLog)
+from airport.serializers import (AircraftSerializer, BoundingBoxSerializer, LocationSerializer,
+                                 ProximitySerializer, StateChangeLogSerializer, POSITION_FIELDS)
+from airport.spatial import within_bounding_box, within_distance
+from airport.tracks import read_fixes, record_positions, track_size
+from airport.authentication import AircraftTokenAuthentication, get_token_max_age, issue_token
+from airport.pagination import StateChangeLogPagination
+from airport.runway import describe_slot, enqueue
+from airport.permissions import HasAircraftToken, IsValidPublicKey
+from airport.exceptions import RunwayOccupied, StateConflict
+
+
+def conditional_response(request, build, location=None):
+    """
+    Returns response with data from `build()` tagged with version of the
+    airport at `location`, or of all airports, or `304 Not Modified` when
+    the client already has the current version. Version is read before the
+    data, so a tag never claims newer data than was sent.
+
+    `Last-Modified` has whole seconds only, so it is rounded up and sent
+    only once that second is over. Another change in the same second would
+    keep the same `Last-Modified` and `If-Modified-Since` would answer 304.
+    """
+
+    now = time.time()
+    version, modified = AirportVersion.version_of(location)
+    etag = quote_etag(str(version))
+    last_modified = math.ceil(modified.timestamp())
+    if last_modified > now:
+        last_modified = None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = Response(build())
+
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
 
 
 class AircraftViewSet(viewsets.GenericViewSet):
     queryset = Aircraft.objects.all()
     serializer_class = AircraftSerializer
-    permission_classes = [IsValidPublicKey]
+    authentication_classes = [AircraftTokenAuthentication]
+    permission_classes = [HasAircraftToken | IsValidPublicKey]
+    lookup_field = 'call_sign'
+
+    @action(methods=['get'], detail=False,
+            url_path='aircraft',
+            url_name='aircraft',
+            permission_classes=[AllowAny])
+    def aircraft(self, request, pk=None):
+        """ Returns current state of all aircraft, or of aircraft of the
+        `airport` location when given. Supports conditional requests with
+        `If-None-Match` or `If-Modified-Since`."""
+
+        fields = AircraftSerializer.Meta.fields
+        location = request.query_params.get('airport', None)
+
+        aircraft = Aircraft.objects.order_by('id')
+        if location:
+            aircraft = aircraft.filter(airport=location)
+
+        return conditional_response(
+            request,
+            lambda: list(aircraft.values(*fields)),
+            location
+        )
+
+    @action(methods=['get'], detail=False,
+            url_path='aircraft/within',
+            url_name='aircraft_within',
+            permission_classes=[AllowAny])
+    def aircraft_within(self, request, pk=None):
+        """ Returns aircraft inside bounding box given by `min_latitude`,
+        `min_longitude`, `max_latitude` and `max_longitude`."""
+
+        query = BoundingBoxSerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = AircraftSerializer.Meta.fields
+
+        def build():
+            aircraft = within_bounding_box(Aircraft.objects.order_by('id'), **query.validated_data)
+            return list(aircraft.values(*fields))
+
+        return conditional_response(request, build)
+
+    @action(methods=['get'], detail=False,
+            url_path='aircraft/nearby',
+            url_name='aircraft_nearby',
+            permission_classes=[AllowAny])
+    def aircraft_nearby(self, request, pk=None):
+        """ Returns aircraft within `distance` km of the airport, or of
+        `latitude` and `longitude` when given, closest first."""
+
+        query = ProximitySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = AircraftSerializer.Meta.fields
+
+        def build():
+            found = within_distance(Aircraft.objects.only(*fields), **query.validated_data)
+            return [
+                dict({field: getattr(aircraft, field) for field in fields}, distance=round(distance, 3))
+                for aircraft, distance in found
+            ]
+
+        return conditional_response(request, build)
+
+    @action(methods=['get'], detail=False,
+            url_path='(?P<call_sign>[^/.]+)/track',
+            url_name='track',
+            permission_classes=[AllowAny])
+    def track(self, request, call_sign=None, pk=None):
+        """ Returns last `limit` reported positions of the aircraft, oldest
+        first."""
+
+        try:
+            limit = int(request.query_params.get('limit', track_size()))
+        except ValueError:
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        if limit < 1:
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        def build():
+            aircraft = self.get_object()
+            track = AircraftTrack.objects.filter(aircraft=aircraft).first()
+            return {
+                'call_sign': aircraft.call_sign,
+                'fixes': read_fixes(track.fixes, track.head, limit) if track else []
+            }
+
+        return conditional_response(request, build)
+
+    @action(methods=['get'], detail=False,
+            url_path='(?P<call_sign>[^/.]+)/runway_slot',
+            url_name='runway_slot')
+    def runway_slot(self, request, call_sign=None, pk=None):
+        """ Returns position and estimated time of the aircraft's slot in
+        the runway queue, 404 when it is not waiting."""
+
+        slot = RunwaySlot.objects.filter(aircraft__call_sign=call_sign).first()
+        if slot is None:
+            return Response(None, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(dict(describe_slot(slot), call_sign=call_sign))
+
+    def retrieve(self, request, call_sign=None):
+        """ Returns current state of the aircraft. Supports conditional
+        requests with `If-None-Match` or `If-Modified-Since`."""
+
+        return conditional_response(
+            request,
+            lambda: self.get_serializer(self.get_object()).data
+        )
+
+    def get_permissions(self):
+        if self.action == 'retrieve':
+            return [AllowAny()]
+        return super().get_permissions()
+
+    @action(methods=['post'], detail=False,
+            url_path='(?P<call_sign>[^/.]+)/handshake',
+            url_name='handshake',
+            permission_classes=[IsValidPublicKey])
+    def handshake(self, request, call_sign=None, pk=None):
+        """ Verifies public key once and issues a session token which
+        can be sent instead of public key in `Authorization: Token` header."""
+
+        return Response({
+            'token': issue_token(call_sign),
+            'expires_in': get_token_max_age()
+        })
 
     @action(methods=['post'], detail=False,
             url_path='(?P<call_sign>[^/.]+)/intent',
@@ -32,44 +212,102 @@ class AircraftViewSet(viewsets.GenericViewSet):
             'latitude': request.data.get('latitude', 0),
             'altitude': request.data.get('altitude', 0),
             'heading': request.data.get('heading', 0),
+            'airport': request.data.get('airport', None),
         }
 
-        serializer = self.get_serializer(data=data)
+        log_from_state = request.data.get('state', '') if intent else ''
 
-        if serializer.is_valid():
-            state_from = ''
-            state_to = ''
-            try:
-                aircraft = Aircraft.objects.get(call_sign=call_sign)
+        engine = get_state_engine()
+        if engine is not None:
+            return self.intent_with_engine(engine, data, log_from_state)
+
+        admission = get_redis_admission()
+        if admission is not None:
+            return self.intent_with_admission(admission, data, log_from_state)
+
+        with transaction.atomic():
+            context = self.get_serializer_context()
+            # resources of the aircraft's airport are locked before the
+            # aircraft row by every intent, the order the ground crew and the
+            # runway queue use too. Airport of an existing aircraft is checked
+            # by the serializer, unknown airports are rejected by it without
+            # creating a row
+            location = data['airport'] if isinstance(data['airport'], str) else None
+            if location and not Airport.exists(location):
+                location = None
+            context['resources'], context['aircraft'] = AirportResources.lock_for(call_sign, location)
+
+            serializer = self.get_serializer(data=data, context=context)
+
+            if not serializer.is_valid():
+                return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+            # Aircraft was already loaded by the serializer during validation
+            aircraft = serializer.db_object
+
+            if aircraft:
                 state_from = aircraft.state
-                state_to = data['state']
-            except Aircraft.DoesNotExist:
-                aircraft = Aircraft(**serializer.data)
-                state_from = request.data.get('state', None)
-                state_to = request.data.get('intent', None)
-                aircraft.state = state_to
+                aircraft.state = serializer.validated_data['state']
+                aircraft.save(update_fields=['state'])
+            else:
+                aircraft = Aircraft(**serializer.validated_data)
+                state_from = log_from_state
                 aircraft.save()
 
-            log = StateChangeLog(
+            write_state_log(
                 aircraft=aircraft,
                 from_state=state_from,
-                to_state=state_to,
+                to_state=aircraft.state,
                 outcome='ACCEPTED'
             )
 
-            aircraft.state = serializer.data['state']
-            aircraft.save()
+        return Response(None, status=status.HTTP_204_NO_CONTENT)
 
-            log.save()
+    def intent_with_engine(self, engine, data, log_from_state):
+        """ Validates intent against in-memory airport state, see
+        `airport.engine`."""
 
-            return Response(None, status=status.HTTP_204_NO_CONTENT)
-        else:
+        context = dict(self.get_serializer_context(), engine=engine)
+
+        def validate():
+            serializer = self.get_serializer(data=data, context=context)
+            if not serializer.is_valid():
+                return None
+            return intent_change(serializer, log_from_state)
+
+        if engine.submit(validate) is None:
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(None, status=status.HTTP_204_NO_CONTENT)
+
+    def intent_with_admission(self, admission, data, log_from_state):
+        """ Admits intent through shared airport state in Redis, see
+        `airport.admission`."""
+
+        context = dict(self.get_serializer_context(), admission=admission)
+        serializer = self.get_serializer(data=data, context=context)
+
+        if not serializer.is_valid():
             return Response(None, status=status.HTTP_400_BAD_REQUEST)
 
+        admission.submit_intent(serializer.validated_data, log_from_state, airport=data['airport'])
+
+        return Response(None, status=status.HTTP_204_NO_CONTENT)
+
+    def queue_requested(self):
+        return str(self.request.data.get('queue', '')).lower() in ('true', '1')
+
     def handle_exception(self, exc):
+        if isinstance(exc, RunwayOccupied) and exc.aircraft and self.queue_requested():
+            # wait for the runway instead of retrying, see `airport.runway`
+            slot = enqueue(exc.aircraft, exc.to_state)
+            if slot is not None:
+                return Response(dict(describe_slot(slot), call_sign=exc.aircraft.call_sign),
+                                status=status.HTTP_202_ACCEPTED)
+
         if isinstance(exc, (StateConflict,)):
             if exc.aircraft:
-                StateChangeLog.objects.create(
+                write_state_log(
                     aircraft=exc.aircraft,
                     from_state=exc.from_state,
                     to_state=exc.to_state,
@@ -97,22 +335,87 @@ class AircraftViewSet(viewsets.GenericViewSet):
             'altitude': request.data.get('altitude', None),
             'heading': request.data.get('heading', None)
         }
-        serializer = LocationSerializer(data=data)
+        serializer = LocationSerializer(data=data, context={'aircraft': aircraft})
 
         if serializer.is_valid():
-            for k, v in data.items():
+            for k, v in serializer.validated_data.items():
                 setattr(aircraft, k, v)
-            aircraft.save()
+            # version of the airport is bumped once the track is written too
+            with transaction.atomic(savepoint=False):
+                aircraft.save(update_fields=POSITION_FIELDS)
+                record_positions([aircraft])
 
             return Response(None, status=status.HTTP_204_NO_CONTENT)
         else:
             return Response(None, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(methods=['put'], detail=False,
+            url_path='locations',
+            url_name='locations')
+    def locations(self, request, pk=None):
+        """ Updates locations of many aircraft in one request. Aircraft are
+        loaded with a single query and only position fields are written.
+        Outcome is reported for every sent location."""
+
+        fixes = request.data.get('locations', None)
+
+        if not isinstance(fixes, list):
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        call_signs = [
+            fix.get('call_sign', None) if isinstance(fix, dict) else None
+            for fix in fixes
+        ]
+        call_signs = [call_sign if isinstance(call_sign, str) else None for call_sign in call_signs]
+
+        aircraft_by_call_sign = {
+            aircraft.call_sign: aircraft
+            for aircraft in Aircraft.objects.filter(call_sign__in=set(call_signs) - {None})
+        }
+
+        results = []
+        updated = {}
+
+        for call_sign, fix in zip(call_signs, fixes):
+            aircraft = aircraft_by_call_sign.get(call_sign, None)
+
+            if aircraft is None:
+                results.append({'call_sign': call_sign, 'status': status.HTTP_404_NOT_FOUND})
+                continue
+
+            data = {field: fix.get(field, None) for field in ('call_sign', 'type') + POSITION_FIELDS}
+            serializer = LocationSerializer(data=data, context={'aircraft': aircraft})
+
+            try:
+                valid = serializer.is_valid()
+            except ValidationError:
+                valid = False
+
+            if not valid:
+                results.append({'call_sign': call_sign, 'status': status.HTTP_400_BAD_REQUEST})
+                continue
+
+            for field in POSITION_FIELDS:
+                setattr(aircraft, field, serializer.validated_data[field])
+            aircraft.update_grid_cell()
+            updated[aircraft.pk] = aircraft
+
+            results.append({'call_sign': call_sign, 'status': status.HTTP_204_NO_CONTENT})
+
+        if updated:
+            with transaction.atomic(savepoint=False):
+                Aircraft.objects.bulk_update(updated.values(), POSITION_FIELDS + ('grid_cell',))
+                for location in sorted({aircraft.airport for aircraft in updated.values()}):
+                    AirportVersion.bump_on_commit(location)
+                record_positions(updated.values())
+
+        return Response({'results': results})
+
 
 class StateChangeLogViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
     serializer_class = StateChangeLogSerializer
-    queryset = StateChangeLog.objects.all().order_by('-time')
-    pagination_class = LimitOffsetPagination
+    queryset = StateChangeLog.objects.select_related('aircraft').order_by('-time', '-id')
+    pagination_class = StateChangeLogPagination
 
 
 class StartSimulationViewSet(viewsets.GenericViewSet):
@@ -127,10 +430,16 @@ class StartSimulationViewSet(viewsets.GenericViewSet):
             url_path='start',
             url_name='start_simulation')
     def start_simulation(self, request, *args):
-        Aircraft.objects.all().delete()
-        # Create test aircrafts
-        Aircraft.objects.create(call_sign='CYAN', type="AIRLINER", state="PARKED")
-        Aircraft.objects.create(call_sign='PA_001', type="AIRLINER", state="PARKED")
-        Aircraft.objects.create(call_sign='PA_002', type="AIRLINER", state="PARKED")
-        Aircraft.objects.create(call_sign='PA_003', type="AIRLINER", state="PARKED")
+        with transaction.atomic():
+            AirportResources.lock()
+            Aircraft.objects.all().delete()
+            AirportResources.recalculate_all()
+            # Create test aircrafts
+            Aircraft.objects.create(call_sign='CYAN', type="AIRLINER", state="PARKED")
+            Aircraft.objects.create(call_sign='PA_001', type="AIRLINER", state="PARKED")
+            Aircraft.objects.create(call_sign='PA_002', type="AIRLINER", state="PARKED")
+            Aircraft.objects.create(call_sign='PA_003', type="AIRLINER", state="PARKED")
+
+        invalidate_airport_state()
+
         return Response()
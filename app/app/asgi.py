@@ -3,14 +3,31 @@ ASGI config for app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Requests for the state change log stream are served directly by
+`airport.streaming`, everything else is handled by Django.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 """
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+if settings.DEBUG:
+    django_application = ASGIStaticFilesHandler(django_application)
+
+from airport.streaming import STREAM_PATH, state_log_stream  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        await state_log_stream(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
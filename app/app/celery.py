@@ -14,13 +14,25 @@ app = Celery('app')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 app.conf.beat_schedule = {
-    'every-minute': {
+    'every-5-seconds': {
         'task': 'airport.tasks.ground_crew_routine',
-        'schedule': 60
+        'schedule': 5
+    },
+    'runway-every-5-seconds': {
+        'task': 'airport.tasks.runway_scheduler',
+        'schedule': 5
+    },
+    'every-10-seconds': {
+        'task': 'airport.tasks.separation_check',
+        'schedule': 10
     },
     'every-5-minuts': {
         'task': 'weather.tasks.load_weather_data',
         'schedule': 300
+    },
+    'every-day': {
+        'task': 'airport.tasks.manage_log_partitions',
+        'schedule': 24 * 60 * 60
     }
 }
 
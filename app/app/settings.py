@@ -134,6 +134,96 @@ CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BACKEND", "redis://redis:6379/0")
 
 AIRPORT_LOCATION = 'Belgrade'
+AIRPORT_LATITUDE = 44.8184
+AIRPORT_LONGITUDE = 20.3091
 AIRPORT_RUNAWAYS = 1
 AIRPORT_LARGE_PARKING_SPOTS = 5
 AIRPORT_SMALL_PARKING_SPOTS = 10
+
+# Runway queue, intents sent with `queue` wait for a free runway. Slot
+# time estimates assume every aircraft takes this long on a runway.
+AIRPORT_RUNWAY_SLOT_SECONDS = 60
+AIRPORT_RUNWAY_QUEUE_SIZE = 50
+
+AIRPORT_PRIVATE_KEY_PATH = '/keys/airport_ops_rsa'
+AIRPORT_VERIFIED_KEYS_CACHE_SIZE = 1024
+AIRPORT_TOKEN_MAX_AGE = 300
+
+# Broker for state change log stream, 'local' (in-process) or 'redis'
+AIRPORT_STREAM_BACKEND = os.environ.get('AIRPORT_STREAM_BACKEND', 'local')
+AIRPORT_STREAM_CHANNEL = 'airport:state_logs'
+AIRPORT_STREAM_KEEPALIVE = 15
+# Logs queued for a subscriber, which is disconnected when it falls further behind
+AIRPORT_STREAM_QUEUE_SIZE = 100
+# Logs missed by a reconnecting subscriber are read in batches of this size
+AIRPORT_STREAM_REPLAY_BATCH_SIZE = 100
+# Ids of the latest replayed logs remembered to skip them when published again
+AIRPORT_STREAM_DEDUPE_WINDOW = 1000
+
+# State change log writer, 'sync' (insert on request) or 'buffered'
+# (batched inserts from a background thread)
+AIRPORT_LOG_WRITER = os.environ.get('AIRPORT_LOG_WRITER', 'sync')
+AIRPORT_LOG_BATCH_SIZE = 100
+AIRPORT_LOG_FLUSH_INTERVAL = 1.0
+AIRPORT_LOG_SPOOL_DIR = os.environ.get('AIRPORT_LOG_SPOOL_DIR', '/tmp')
+
+# PostgreSQL partitions of state change logs, 'day' or 'month'. Partitions
+# holding only logs older than retention are detached, None keeps all.
+AIRPORT_LOG_PARTITION_INTERVAL = 'month'
+AIRPORT_LOG_PARTITIONS_AHEAD = 3
+AIRPORT_LOG_RETENTION_DAYS = 365
+
+# Directory of gzip compressed state change log archives
+AIRPORT_LOG_ARCHIVE_DIR = os.environ.get('AIRPORT_LOG_ARCHIVE_DIR', '/var/lib/airport/archive')
+
+# Intent validation, 'database' (lock airport resources row), 'memory'
+# (in-process state engine) or 'redis' (state shared by all processes in
+# Redis), the last two are written through to the database
+AIRPORT_INTENT_BACKEND = os.environ.get('AIRPORT_INTENT_BACKEND', 'database')
+AIRPORT_ENGINE_RECONCILE_INTERVAL = 60
+# In-memory engines read epochs of airports changed outside of intents at
+# most this often (seconds)
+AIRPORT_ENGINE_EPOCH_INTERVAL = 1
+AIRPORT_ADMISSION_REDIS_URL = os.environ.get('AIRPORT_ADMISSION_REDIS_URL', CELERY_BROKER_URL)
+AIRPORT_ADMISSION_KEY_PREFIX = 'airport'
+# Seconds a process may hold the lock for reloading state in Redis
+AIRPORT_ADMISSION_RELOAD_TIMEOUT = 10
+
+# Cell size in degrees of the grid index of aircraft positions, run
+# reindex_aircraft_grid command after changing it
+AIRPORT_GRID_CELL_SIZE = 0.1
+
+# Number of recent positions kept per aircraft
+AIRPORT_TRACK_SIZE = 100
+
+# Separation minima of aircraft in flight, horizontal in km and vertical
+# in altitude units
+AIRPORT_SEPARATION_HORIZONTAL_KM = 5.556
+AIRPORT_SEPARATION_VERTICAL = 1000
+
+# Cache of weather payload and known call signs, 'local' (in-process) or
+# 'redis' (shared by all processes). Entries expire after timeout seconds.
+AIRPORT_WEATHER_CACHE = os.environ.get('AIRPORT_WEATHER_CACHE', 'local')
+AIRPORT_WEATHER_CACHE_TIMEOUT = 60
+AIRPORT_WEATHER_CACHE_REDIS_URL = os.environ.get('AIRPORT_WEATHER_CACHE_REDIS_URL', CELERY_BROKER_URL)
+AIRPORT_WEATHER_CACHE_KEY_PREFIX = 'airport'
+
+# Weather provider, 'openweathermap' or 'replay' (recorded responses, one
+# per replay interval seconds or one per fetch with interval 0). Requests
+# have (connect, read) timeouts and retry failed connections and gateway
+# errors.
+AIRPORT_WEATHER_PROVIDER = os.environ.get('AIRPORT_WEATHER_PROVIDER', 'openweathermap')
+AIRPORT_WEATHER_REPLAY_FILE = os.environ.get(
+    'AIRPORT_WEATHER_REPLAY_FILE', str(BASE_DIR / 'weather' / 'recordings' / 'belgrade.jsonl')
+)
+AIRPORT_WEATHER_REPLAY_INTERVAL = 300
+AIRPORT_WEATHER_URL = 'http://api.openweathermap.org/data/2.5/weather'
+AIRPORT_WEATHER_API_KEY = os.environ.get('AIRPORT_WEATHER_API_KEY', '1a1f91e2241e9056cf2dd4f9cf66e8da')
+AIRPORT_WEATHER_TIMEOUT = (3.05, 10)
+AIRPORT_WEATHER_RETRIES = 2
+AIRPORT_WEATHER_POOL_SIZE = 4
+
+# Weather older than max age seconds is served while a refresh is
+# requested, at most once per refresh interval seconds per process
+AIRPORT_WEATHER_MAX_AGE = 600
+AIRPORT_WEATHER_REFRESH_INTERVAL = 60
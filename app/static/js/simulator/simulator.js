@@ -136,27 +136,81 @@ function executeStep(step) {
     }
 
     if (action.data.state === 'LANDED') {
-        timer = setInterval(()=> {
-          $.get("/api/state_logs/?limit=10", function(data, status){
-            if (data['results']) {
-              for (i = 0; i < data['results'].length; i++) {
-                call_sign = data['results'][i]['call_sign'];
-                state = data['results'][i]['from_state'];
-                intent = data['results'][i]['to_state'];
-                outcome = data['results'][i]['outcome'];
-
-                if(call_sign===blue_airliner.call_sign && state==='LANDED' && 
-                  intent==='PARKED' && outcome==='ACCEPTED') {
-                    blue_airliner.state='PARKED';
-                    refresh_screen();
-                    clearInterval(timer);
-                  }
-              }
-            }
-          });
+        waitForParking();
+    }
+}
+
+function isBlueAirlinerParked(log) {
+    return log['call_sign']===blue_airliner.call_sign && log['from_state']==='LANDED' &&
+      log['to_state']==='PARKED' && log['outcome']==='ACCEPTED';
+}
+
+function showBlueAirlinerParked() {
+    blue_airliner.state='PARKED';
+    refresh_screen();
+}
+
+function checkLatestLogs(onParked) {
+    $.get("/api/state_logs/?limit=10", function(data, status){
+      if (data['results']) {
+        for (i = 0; i < data['results'].length; i++) {
+          if (isBlueAirlinerParked(data['results'][i])) {
+              onParked();
+              return;
+          }
+        }
+      }
+    });
+}
 
-        }, 5000); 
+function pollForParking() {
+    var timer = setInterval(()=> {
+      checkLatestLogs(function() {
+          showBlueAirlinerParked();
+          clearInterval(timer);
+      });
+    }, 5000);
+}
+
+function waitForParking() {
+    if (!window.EventSource) {
+        pollForParking();
+        return;
+    }
+
+    var source = new EventSource("/api/state_logs/stream/");
+    var parked = false;
+    var failures = 0;
+
+    function onParked() {
+        if (!parked) {
+            parked = true;
+            source.close();
+            showBlueAirlinerParked();
+        }
     }
+
+    source.addEventListener('open', function() {
+        failures = 0;
+        // aircraft could have been parked before stream was opened
+        checkLatestLogs(onParked);
+    });
+    source.addEventListener('state_log', function(event) {
+        if (isBlueAirlinerParked(JSON.parse(event.data))) {
+            onParked();
+        }
+    });
+    source.onerror = function() {
+        // EventSource reconnects on its own, polling is used only when the
+        // stream is not available (e.g. app is not served over ASGI)
+        failures++;
+        if (source.readyState === EventSource.CLOSED || failures >= 3) {
+            source.close();
+            if (!parked) {
+                pollForParking();
+            }
+        }
+    };
 }
 
 function drawImage(ctx, aircraft, x, y) {
@@ -0,0 +1,241 @@
+"""
+Cache of weather answers.
+
+Weather changes every few minutes while aircraft ask for it all the time,
+so the serialized payload and call signs of known aircraft are cached and
+a weather request which hits the cache makes no database queries.
+
+Backends:
+
+* `local` - in-process, `load_weather_data` clears the payload of its own
+  process and other processes pick up new weather once their entry is
+  older than `AIRPORT_WEATHER_CACHE_TIMEOUT` seconds.
+* `redis` - shared by all processes, `load_weather_data` clears it for
+  everyone.
+
+Known call signs expire after `AIRPORT_WEATHER_CACHE_TIMEOUT` seconds in
+both backends, so removed aircraft lose access to weather after that.
+"""
+import json
+import logging
+import threading
+import time
+
+import redis
+
+from django.conf import settings
+from django.forms.models import model_to_dict
+from rest_framework.renderers import JSONRenderer
+
+from airport.models import Aircraft
+from airport.serializers import get_setting
+
+from weather.models import WeatherData
+from weather.serializers import WeatherDataSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def get_timeout():
+    return get_setting('AIRPORT_WEATHER_CACHE_TIMEOUT', 60)
+
+
+class LocalWeatherCache:
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._payload = None
+        self._call_signs = {}
+
+    def get_payload(self):
+        with self._lock:
+            if self._payload is None:
+                return None
+            payload, expires = self._payload
+            if expires <= self.clock():
+                self._payload = None
+                return None
+            return payload
+
+    def set_payload(self, payload):
+        with self._lock:
+            self._payload = (payload, self.clock() + get_timeout())
+
+    def clear_payload(self):
+        with self._lock:
+            self._payload = None
+
+    def is_known(self, call_sign):
+        with self._lock:
+            expires = self._call_signs.get(call_sign)
+            if expires is None:
+                return False
+            if expires <= self.clock():
+                del self._call_signs[call_sign]
+                return False
+            return True
+
+    def add_known(self, call_sign):
+        now = self.clock()
+        limit = get_setting('AIRPORT_WEATHER_CACHE_CALL_SIGNS', 100000)
+
+        with self._lock:
+            if len(self._call_signs) >= limit:
+                # drop expired entries, or all of them if none has expired
+                self._call_signs = {
+                    known: expires for known, expires in self._call_signs.items() if expires > now
+                }
+                if len(self._call_signs) >= limit:
+                    self._call_signs.clear()
+            self._call_signs[call_sign] = now + get_timeout()
+
+    def clear(self):
+        with self._lock:
+            self._payload = None
+            self._call_signs.clear()
+
+
+class RedisWeatherCache:
+    """Payload is kept as JSON under `<prefix>:weather` and every known
+    call sign as its own expiring key `<prefix>:weather:aircraft:<call sign>`."""
+
+    def __init__(self, url, prefix):
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        return self._client
+
+    @property
+    def payload_key(self):
+        return f'{self.prefix}:weather'
+
+    def call_sign_key(self, call_sign):
+        return f'{self.prefix}:weather:aircraft:{call_sign}'
+
+    def get_payload(self):
+        payload = self.client.get(self.payload_key)
+        return None if payload is None else json.loads(payload)
+
+    def set_payload(self, payload):
+        self.client.set(self.payload_key, json.dumps(payload), ex=get_timeout())
+
+    def clear_payload(self):
+        self.client.delete(self.payload_key)
+
+    def is_known(self, call_sign):
+        return bool(self.client.exists(self.call_sign_key(call_sign)))
+
+    def add_known(self, call_sign):
+        self.client.set(self.call_sign_key(call_sign), 1, ex=get_timeout())
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{self.payload_key}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_weather_cache():
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            backend = get_setting('AIRPORT_WEATHER_CACHE', 'local')
+            if backend == 'redis':
+                _cache = RedisWeatherCache(
+                    url=get_setting('AIRPORT_WEATHER_CACHE_REDIS_URL', settings.CELERY_BROKER_URL),
+                    prefix=get_setting('AIRPORT_WEATHER_CACHE_KEY_PREFIX', 'airport')
+                )
+            else:
+                _cache = LocalWeatherCache()
+
+    return _cache
+
+
+def reset_weather_cache():
+    global _cache
+
+    with _cache_lock:
+        _cache = None
+
+
+def serialize_weather(weather_data):
+    """ Returns weather payload as plain JSON data, the same for every
+    backend, or None when weather data is not valid."""
+
+    serializer = WeatherDataSerializer(data=model_to_dict(weather_data))
+    if not serializer.is_valid():
+        return None
+
+    return json.loads(JSONRenderer().render(serializer.data))
+
+
+def get_weather_payload():
+    """ Returns cached weather payload, loading it from the database on
+    a miss. Returns None when there is no valid weather data."""
+
+    cache = get_weather_cache()
+
+    try:
+        payload = cache.get_payload()
+    except redis.RedisError:
+        logger.exception('Reading weather from cache failed')
+        payload = None
+
+    if payload is not None:
+        return payload
+
+    weather_data = WeatherData.objects.first()
+    if not weather_data:
+        return None
+
+    payload = serialize_weather(weather_data)
+    if payload is not None:
+        try:
+            cache.set_payload(payload)
+        except redis.RedisError:
+            logger.exception('Caching weather failed')
+
+    return payload
+
+
+def is_known_aircraft(call_sign):
+    """ Answers if aircraft with given call sign exists, from cache when it
+    was seen recently. Unknown call signs are always checked in the
+    database, so new aircraft get weather right away."""
+
+    cache = get_weather_cache()
+
+    try:
+        if cache.is_known(call_sign):
+            return True
+    except redis.RedisError:
+        logger.exception('Reading known aircraft from cache failed')
+
+    if not Aircraft.objects.filter(call_sign=call_sign).exists():
+        return False
+
+    try:
+        cache.add_known(call_sign)
+    except redis.RedisError:
+        logger.exception('Caching known aircraft failed')
+
+    return True
+
+
+def invalidate_weather():
+    """ Drops cached weather payload, called after weather data is written."""
+
+    try:
+        get_weather_cache().clear_payload()
+    except redis.RedisError:
+        logger.exception('Invalidating cached weather failed')
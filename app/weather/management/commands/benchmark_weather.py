@@ -0,0 +1,48 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from weather.cache import get_weather_payload, invalidate_weather
+from weather.providers import ReplayProvider
+from weather.tasks import refresh_weather
+
+
+class Command(BaseCommand):
+    """ Django command to measure the weather path offline, with weather
+    replayed from a recording, one recorded response per refresh. Weather
+    in the database is replaced by the recorded one:
+
+        python manage.py benchmark_weather --repeat 100
+    """
+
+    help = 'Benchmark weather refresh and lookups with replayed weather'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recording', default=settings.AIRPORT_WEATHER_REPLAY_FILE)
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args, **options):
+        provider = ReplayProvider(path=options['recording'], interval=0)
+        repeat = max(options['repeat'], 1)
+
+        self.report('refresh', repeat, lambda: refresh_weather(provider=provider))
+
+        def miss():
+            invalidate_weather()
+            get_weather_payload()
+
+        self.report('lookup, cache miss', repeat, miss)
+        self.report('lookup, cache hit', repeat, get_weather_payload)
+
+    def report(self, name, repeat, function):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{name}: median {statistics.median(timings):.3f} ms, max {max(timings):.3f} ms'
+        ))
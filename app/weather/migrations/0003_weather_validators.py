@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0002_auto_20201031_0954'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='weatherdata',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='weatherdata',
+            name='last_modified',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -9,3 +9,6 @@ class WeatherData(models.Model):
     wind_speed = models.DecimalField(max_digits=5, decimal_places=2)
     wind_deg = models.IntegerField()
     last_update = models.DateTimeField(default=timezone.now)
+    # validators of the provider's response, sent with the next fetch
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.CharField(max_length=64, blank=True, default='')
@@ -0,0 +1,214 @@
+"""
+Weather providers.
+
+A provider fetches current weather for `AIRPORT_LOCATION` and is chosen
+by `AIRPORT_WEATHER_PROVIDER`:
+
+* `openweathermap` - OpenWeatherMap API. Requests go through one pooled
+  session per process, so refreshes reuse connections, and every request
+  has connect and read timeouts. Weather which didn't change since the
+  last fetch is answered by a conditional request without a body.
+* `replay` - recorded OpenWeatherMap responses read from a JSON lines
+  file, one response per line, for load tests and benchmarks without the
+  network. Every response is current for `AIRPORT_WEATHER_REPLAY_INTERVAL`
+  seconds, starting with the first fetch, and the recording loops. With
+  interval 0 every fetch advances to the next response.
+"""
+import abc
+import json
+import threading
+import time
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from airport.serializers import get_setting
+
+Observation = namedtuple('Observation', [
+    'description', 'temperature', 'visibility', 'wind_speed', 'wind_deg', 'etag', 'last_modified'
+])
+
+
+class WeatherUnavailable(Exception):
+    pass
+
+
+def parse_observation(body, etag='', last_modified=''):
+    """ Returns `Observation` of OpenWeatherMap current weather response."""
+
+    try:
+        return Observation(
+            description=body['weather'][0]['description'],
+            temperature=body['main']['temp'],
+            visibility=body['visibility'],
+            wind_speed=body['wind']['speed'],
+            wind_deg=body['wind']['deg'],
+            etag=etag,
+            last_modified=last_modified
+        )
+    except (KeyError, IndexError, TypeError) as error:
+        raise WeatherUnavailable(f'Unexpected weather response: {error!r}') from error
+
+
+class WeatherProvider(abc.ABC):
+
+    @abc.abstractmethod
+    def fetch(self, etag='', last_modified=''):
+        """ Returns current `Observation`, or None when weather is not
+        modified since the fetch which returned given `etag` and
+        `last_modified`. Raises `WeatherUnavailable` when weather can't be
+        fetched."""
+
+    def close(self):
+        pass
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+
+    def __init__(self, url=None, api_key=None, location=None, timeout=None, retries=None, pool_size=None):
+        self.url = url or get_setting('AIRPORT_WEATHER_URL', 'http://api.openweathermap.org/data/2.5/weather')
+        self.location = location or get_setting('AIRPORT_LOCATION', 'Belgrade')
+        self.api_key = api_key or get_setting('AIRPORT_WEATHER_API_KEY', '')
+        self.timeout = timeout or get_setting('AIRPORT_WEATHER_TIMEOUT', (3.05, 10))
+        self.retries = retries if retries is not None else get_setting('AIRPORT_WEATHER_RETRIES', 2)
+        self.pool_size = pool_size or get_setting('AIRPORT_WEATHER_POOL_SIZE', 4)
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=Retry(
+                        total=self.retries,
+                        backoff_factor=0.5,
+                        status_forcelist=(502, 503, 504),
+                        raise_on_status=False
+                    )
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+
+            return self._session
+
+    @property
+    def params(self):
+        return {
+            'q': self.location,
+            'units': 'metric',
+            'appid': self.api_key
+        }
+
+    def fetch(self, etag='', last_modified=''):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        try:
+            res = self.session.get(self.url, params=self.params, headers=headers, timeout=self.timeout)
+            if res.status_code == 304:
+                return None
+            res.raise_for_status()
+            body = res.json()
+        except (requests.RequestException, ValueError) as error:
+            raise WeatherUnavailable(f'Weather could not be fetched from {self.url}: {error}') from error
+
+        return parse_observation(
+            body,
+            etag=res.headers.get('ETag', ''),
+            last_modified=res.headers.get('Last-Modified', '')
+        )
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+
+class ReplayProvider(WeatherProvider):
+
+    def __init__(self, path=None, interval=None, clock=time.monotonic):
+        self.path = path or get_setting('AIRPORT_WEATHER_REPLAY_FILE', None)
+        self.interval = interval if interval is not None else get_setting('AIRPORT_WEATHER_REPLAY_INTERVAL', 300)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._responses = None
+        self._started = None
+        self._fetches = 0
+
+    @property
+    def responses(self):
+        with self._lock:
+            if self._responses is None:
+                self._responses = self.load()
+
+            return self._responses
+
+    def load(self):
+        try:
+            with open(self.path) as recording:
+                responses = [json.loads(line) for line in recording if line.strip()]
+        except (OSError, TypeError, ValueError) as error:
+            raise WeatherUnavailable(f'Weather recording {self.path} could not be read: {error}') from error
+
+        if not responses:
+            raise WeatherUnavailable(f'Weather recording {self.path} is empty')
+
+        return responses
+
+    def current_index(self):
+        with self._lock:
+            if not self.interval:
+                index = self._fetches
+                self._fetches += 1
+                return index
+
+            if self._started is None:
+                self._started = self.clock()
+            return int((self.clock() - self._started) // self.interval)
+
+    def fetch(self, etag='', last_modified=''):
+        responses = self.responses
+        index = self.current_index() % len(responses)
+
+        current_etag = f'"replay-{index}"'
+        if etag == current_etag:
+            return None
+
+        return parse_observation(responses[index], etag=current_etag)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_weather_provider():
+    global _provider
+
+    with _provider_lock:
+        if _provider is None:
+            if get_setting('AIRPORT_WEATHER_PROVIDER', 'openweathermap') == 'replay':
+                _provider = ReplayProvider()
+            else:
+                _provider = OpenWeatherMapProvider()
+
+    return _provider
+
+
+def reset_weather_provider():
+    global _provider
+
+    with _provider_lock:
+        if _provider is not None:
+            _provider.close()
+        _provider = None
@@ -1,33 +1,147 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
 from django.utils import timezone
 
 from celery import shared_task
 
-import requests
+from airport.serializers import get_setting
 
+from weather.cache import invalidate_weather
 from weather.models import WeatherData
+from weather.providers import WeatherUnavailable, get_weather_provider
+
+logger = logging.getLogger(__name__)
+
+# Key of PostgreSQL advisory lock held while weather is refreshed
+WEATHER_REFRESH_LOCK = 7302
+
+# Refreshes running in this process, other processes are kept out by the
+# advisory lock
+_refresh_lock = threading.Lock()
+
+_refresh_requested = None
+_refresh_requested_lock = threading.Lock()
+
+
+def get_max_age():
+    return get_setting('AIRPORT_WEATHER_MAX_AGE', 600)
+
+
+def is_stale(last_update, max_age=None):
+    max_age = get_max_age() if max_age is None else max_age
+    return last_update is None or timezone.now() - last_update > timedelta(seconds=max_age)
+
+
+@contextmanager
+def weather_refresh_lock():
+    """
+    Holds session advisory lock of weather refresh, yields False if another
+    process is refreshing. The lock doesn't need an open transaction, so
+    the provider is not called inside one. Other databases rely on the
+    freshness check after taking the lock.
+    """
+
+    if connection.vendor != 'postgresql':
+        yield True
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [WEATHER_REFRESH_LOCK])
+        locked = cursor.fetchone()[0]
+
+    try:
+        yield locked
+    finally:
+        if locked:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [WEATHER_REFRESH_LOCK])
+
+
+def refresh_weather(max_age=None, provider=None):
+    """
+    Fetches weather from the provider and writes it. With `max_age` weather
+    newer than `max_age` seconds is kept without fetching, so refreshes
+    requested at the same time fetch once. Returns True when weather was
+    written, None when the refresh was skipped or the provider failed, in
+    which case last weather keeps being served.
+    """
+
+    if not _refresh_lock.acquire(blocking=False):
+        return None
+
+    try:
+        with weather_refresh_lock() as locked:
+            if not locked:
+                return None
+
+            weather_data = WeatherData.objects.first()
+            if weather_data and max_age is not None and not is_stale(weather_data.last_update, max_age):
+                return None
+
+            # fetched outside of a transaction, the provider may take
+            # seconds to answer
+            try:
+                observation = (provider or get_weather_provider()).fetch(
+                    etag=weather_data.etag if weather_data else '',
+                    last_modified=weather_data.last_modified if weather_data else ''
+                )
+            except WeatherUnavailable:
+                logger.warning('Loading weather failed, last weather is kept', exc_info=True)
+                return None
+
+            if observation is None and weather_data is None:
+                return None
+
+            # not modified weather is confirmed as current
+            data = {'last_update': timezone.now()}
+            if observation is not None:
+                data.update(observation._asdict())
+
+            with transaction.atomic():
+                if not WeatherData.objects.all().update(**data):
+                    WeatherData.objects.create(**data)
+    finally:
+        _refresh_lock.release()
+
+    invalidate_weather()
+    return True
+
+
+def request_refresh():
+    """ Enqueues refresh of stale weather, at most once per
+    `AIRPORT_WEATHER_REFRESH_INTERVAL` seconds per process. Callers keep
+    serving the stale weather meanwhile."""
+
+    global _refresh_requested
+
+    now = time.monotonic()
+    with _refresh_requested_lock:
+        interval = get_setting('AIRPORT_WEATHER_REFRESH_INTERVAL', 60)
+        if _refresh_requested is not None and now - _refresh_requested < interval:
+            return False
+        _refresh_requested = now
+
+    try:
+        load_weather_data.delay(max_age=get_max_age())
+    except Exception:
+        logger.exception('Requesting weather refresh failed')
+        return False
+
+    return True
+
+
+def reset_refresh_requests():
+    global _refresh_requested
+
+    with _refresh_requested_lock:
+        _refresh_requested = None
 
 
 @shared_task
-def load_weather_data():
-    res = requests.get(
-        'http://api.openweathermap.org/data/2.5/weather',
-        params={
-            'q': 'Belgrade',
-            'units': 'metric',
-            'appid': '1a1f91e2241e9056cf2dd4f9cf66e8da'
-        }
-    )
-
-    data = {
-        'description': res.json()['weather'][0]['description'],
-        'temperature': res.json()['main']['temp'],
-        'visibility': res.json()['visibility'],
-        'wind_speed': res.json()['wind']['speed'],
-        'wind_deg': res.json()['wind']['deg'],
-        'last_update': timezone.now()
-    }
-
-    if WeatherData.objects.all().count() == 0:
-        WeatherData.objects.create(**data)
-    else:
-        WeatherData.objects.all().update(**data)
+def load_weather_data(max_age=None):
+    return refresh_weather(max_age)
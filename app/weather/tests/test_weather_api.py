@@ -6,6 +6,7 @@ from rest_framework import status
 
 from airport.models import Aircraft
 
+from weather.cache import reset_weather_cache
 from weather.models import WeatherData
 
 
@@ -26,6 +27,7 @@ class WeatherApiTests(TestCase):
 
     def setUp(self):
         self.client = APIClient()
+        reset_weather_cache()
 
     def test_should_return_error_for_unknown_aircraft(self):
         UNKNOWN_CALL = 'UC666'
@@ -0,0 +1,224 @@
+from unittest.mock import patch
+
+import redis
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+from rest_framework import status
+
+from airport.models import Aircraft
+
+from weather.cache import LocalWeatherCache, get_weather_cache, reset_weather_cache
+from weather.models import WeatherData
+from weather.providers import Observation
+from weather.tasks import load_weather_data
+
+REDIS_URL = getattr(settings, 'AIRPORT_WEATHER_CACHE_REDIS_URL', None) or settings.CELERY_BROKER_URL
+KEY_PREFIX = 'airport-test'
+
+
+def redis_available():
+    try:
+        return redis.Redis.from_url(REDIS_URL, socket_connect_timeout=0.5).ping()
+    except redis.RedisError:
+        return False
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+def create_weather_data(description='Clear sky', temperature=11):
+    return WeatherData.objects.create(
+        description=description,
+        temperature=temperature,
+        visibility=1000,
+        wind_speed=2,
+        wind_deg=120,
+        last_update=timezone.now()
+    )
+
+
+def create_observation(description='light rain', temperature=8.5):
+    return Observation(
+        description=description,
+        temperature=temperature,
+        visibility=8000,
+        wind_speed=4.5,
+        wind_deg=200,
+        etag='',
+        last_modified=''
+    )
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class WeatherCacheTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        reset_weather_cache()
+        create_aircraft('CS1')
+        create_weather_data()
+
+    def get_weather(self, call_sign='CS1'):
+        return self.client.get(f'/api/{call_sign}/weather/')
+
+    def test_cached_weather_is_returned_without_queries(self):
+        first = self.get_weather()
+
+        with self.assertNumQueries(0):
+            res = self.get_weather()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, first.data)
+        self.assertEqual(res.data['description'], 'Clear sky')
+        self.assertEqual(res.data['wind'], {'speed': 2, 'deg': 120})
+
+    def test_unknown_aircraft_is_checked_every_time(self):
+        self.assertEqual(self.get_weather('CS2').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        create_aircraft('CS2')
+
+        self.assertEqual(self.get_weather('CS2').status_code, status.HTTP_200_OK)
+
+    @patch('weather.tasks.get_weather_provider')
+    def test_loading_weather_invalidates_cache(self, get_weather_provider):
+        get_weather_provider.return_value.fetch.return_value = create_observation()
+        self.get_weather()
+
+        load_weather_data()
+        res = self.get_weather()
+
+        self.assertEqual(res.data['description'], 'light rain')
+        self.assertEqual(res.data['wind'], {'speed': 4.5, 'deg': 200})
+
+    @patch('weather.tasks.load_weather_data.delay')
+    def test_missing_weather_is_not_cached(self, delay):
+        WeatherData.objects.all().delete()
+        self.assertEqual(self.get_weather().data, {'error': 'invalid'})
+
+        create_weather_data(description='Fog')
+
+        self.assertEqual(self.get_weather().data['description'], 'Fog')
+
+
+@override_settings(AIRPORT_WEATHER_CACHE_TIMEOUT=60)
+class LocalWeatherCacheTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = LocalWeatherCache(clock=self.clock)
+
+    def test_payload_expires(self):
+        self.cache.set_payload({'description': 'Clear sky'})
+
+        self.clock.now = 59
+        self.assertEqual(self.cache.get_payload(), {'description': 'Clear sky'})
+
+        self.clock.now = 60
+        self.assertIsNone(self.cache.get_payload())
+
+    def test_known_call_sign_expires(self):
+        self.cache.add_known('CS1')
+
+        self.clock.now = 59
+        self.assertTrue(self.cache.is_known('CS1'))
+        self.assertFalse(self.cache.is_known('CS2'))
+
+        self.clock.now = 60
+        self.assertFalse(self.cache.is_known('CS1'))
+
+    @override_settings(AIRPORT_WEATHER_CACHE_CALL_SIGNS=2)
+    def test_known_call_signs_are_bounded(self):
+        self.cache.add_known('CS1')
+        self.clock.now = 30
+        self.cache.add_known('CS2')
+
+        # CS1 has expired and makes room
+        self.clock.now = 70
+        self.cache.add_known('CS3')
+
+        self.assertEqual((self.cache.is_known('CS2'), self.cache.is_known('CS3')), (True, True))
+
+
+@override_settings(
+    AIRPORT_WEATHER_CACHE='redis',
+    AIRPORT_WEATHER_CACHE_REDIS_URL=REDIS_URL,
+    AIRPORT_WEATHER_CACHE_KEY_PREFIX=KEY_PREFIX
+)
+class RedisWeatherCacheTests(TestCase):
+
+    def setUp(self):
+        if not redis_available():
+            self.skipTest('Redis is not available')
+
+        self.client = APIClient()
+        reset_weather_cache()
+        get_weather_cache().clear()
+        create_aircraft('CS1')
+        create_weather_data()
+
+    def tearDown(self):
+        get_weather_cache().clear()
+        reset_weather_cache()
+
+    def get_weather(self, call_sign='CS1'):
+        return self.client.get(f'/api/{call_sign}/weather/')
+
+    def test_cached_weather_is_returned_without_queries(self):
+        first = self.get_weather()
+
+        with self.assertNumQueries(0):
+            res = self.get_weather()
+
+        self.assertEqual(res.data, first.data)
+        self.assertEqual(res.data['wind'], {'speed': 2, 'deg': 120})
+
+    def test_weather_is_shared_by_processes(self):
+        self.get_weather()
+
+        # another process starts with an empty local state
+        reset_weather_cache()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_weather().status_code, status.HTTP_200_OK)
+
+    @patch('weather.tasks.get_weather_provider')
+    def test_loading_weather_invalidates_cache(self, get_weather_provider):
+        get_weather_provider.return_value.fetch.return_value = create_observation()
+        self.get_weather()
+
+        load_weather_data()
+
+        self.assertEqual(self.get_weather().data['description'], 'light rain')
+
+    def test_unavailable_redis_falls_back_to_database(self):
+        reset_weather_cache()
+
+        with override_settings(AIRPORT_WEATHER_CACHE_REDIS_URL='redis://localhost:1/0'):
+            with self.assertLogs('weather.cache', 'ERROR'):
+                res = self.get_weather()
+        reset_weather_cache()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['description'], 'Clear sky')
@@ -0,0 +1,429 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import skipUnless
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from airport.models import Aircraft
+
+from weather.cache import reset_weather_cache
+from weather.models import WeatherData
+from weather.providers import (
+    OpenWeatherMapProvider, ReplayProvider, WeatherProvider, WeatherUnavailable, get_weather_provider,
+    reset_weather_provider
+)
+from weather.tasks import WEATHER_REFRESH_LOCK, load_weather_data, request_refresh, reset_refresh_requests
+
+
+def create_aircraft(call_sign, state='PARKED', type='AIRLINER', longitude=0,
+                    latitude=0, altitude=0, heading=0):
+    return Aircraft.objects.create(
+        call_sign=call_sign,
+        state=state,
+        type=type,
+        longitude=longitude,
+        latitude=latitude,
+        altitude=altitude,
+        heading=heading
+    )
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append({
+            'params': parse_qs(urlparse(self.path).query),
+            'headers': dict(self.headers),
+            'port': self.client_address[1]
+        })
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        if server.status != 200:
+            self.reply(server.status, b'')
+        elif self.headers.get('If-None-Match') == server.etag:
+            self.reply(304, b'')
+        else:
+            self.reply(200, json.dumps(server.weather).encode(), {'ETag': server.etag})
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            try:
+                self.wfile.write(body)
+            except ConnectionError:
+                # client has timed out
+                pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubWeatherServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubWeatherHandler)
+        self.requests = []
+        self.delay = 0
+        self.status = 200
+        self.etag = '"v1"'
+        self.weather = {
+            'weather': [{'description': 'clear sky'}],
+            'main': {'temp': 11.5},
+            'visibility': 10000,
+            'wind': {'speed': 2.1, 'deg': 120}
+        }
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/data/2.5/weather'
+
+
+class StubServerMixin:
+
+    def setUp(self):
+        self.server = StubWeatherServer()
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OpenWeatherMapProviderTests(StubServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.provider = OpenWeatherMapProvider(url=self.server.url, api_key='key', retries=0, timeout=(1, 1))
+
+    def tearDown(self):
+        self.provider.close()
+        super().tearDown()
+
+    def test_fetch_parses_observation(self):
+        observation = self.provider.fetch()
+
+        self.assertEqual(observation.description, 'clear sky')
+        self.assertEqual((observation.temperature, observation.visibility), (11.5, 10000))
+        self.assertEqual((observation.wind_speed, observation.wind_deg), (2.1, 120))
+        self.assertEqual(observation.etag, '"v1"')
+        self.assertEqual(self.server.requests[0]['params']['appid'], ['key'])
+
+    @override_settings(AIRPORT_LOCATION='Nis')
+    def test_airport_location_is_requested(self):
+        OpenWeatherMapProvider(url=self.server.url, retries=0).fetch()
+
+        self.assertEqual(self.server.requests[0]['params']['q'], ['Nis'])
+
+    def test_unchanged_weather_is_not_modified(self):
+        etag = self.provider.fetch().etag
+
+        self.assertIsNone(self.provider.fetch(etag=etag))
+        self.assertEqual(self.server.requests[1]['headers']['If-None-Match'], '"v1"')
+
+        self.server.etag = '"v2"'
+        self.assertEqual(self.provider.fetch(etag=etag).etag, '"v2"')
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.provider.fetch()
+
+        self.assertEqual(len({request['port'] for request in self.server.requests}), 1)
+
+    def test_slow_provider_times_out(self):
+        self.server.delay = 1
+        provider = OpenWeatherMapProvider(url=self.server.url, retries=0, timeout=(1, 0.1))
+
+        started = time.monotonic()
+        with self.assertRaises(WeatherUnavailable):
+            provider.fetch()
+
+        self.assertLess(time.monotonic() - started, 0.9)
+        provider.close()
+
+    def test_errors_raise_weather_unavailable(self):
+        self.server.status = 500
+        with self.assertRaises(WeatherUnavailable):
+            self.provider.fetch()
+
+        self.server.status = 200
+        self.server.weather = {'unexpected': 'payload'}
+        with self.assertRaises(WeatherUnavailable):
+            self.provider.fetch()
+
+    def test_gateway_errors_are_retried(self):
+        self.server.status = 503
+        provider = OpenWeatherMapProvider(url=self.server.url, retries=2, timeout=(1, 1))
+
+        with patch('urllib3.util.retry.Retry.sleep'):
+            with self.assertRaises(WeatherUnavailable):
+                provider.fetch()
+
+        self.assertEqual(len(self.server.requests), 3)
+        provider.close()
+
+
+class LoadWeatherDataTests(StubServerMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.settings_override = override_settings(
+            AIRPORT_WEATHER_URL=self.server.url,
+            AIRPORT_WEATHER_RETRIES=0,
+            AIRPORT_WEATHER_TIMEOUT=(1, 0.5)
+        )
+        self.settings_override.enable()
+        reset_weather_provider()
+        reset_weather_cache()
+
+    def tearDown(self):
+        reset_weather_provider()
+        self.settings_override.disable()
+        super().tearDown()
+
+    def test_weather_is_loaded(self):
+        self.assertTrue(load_weather_data())
+
+        weather_data = WeatherData.objects.get()
+        self.assertEqual(weather_data.description, 'clear sky')
+        self.assertEqual(weather_data.etag, '"v1"')
+
+    def test_unchanged_weather_is_confirmed(self):
+        load_weather_data()
+        WeatherData.objects.update(last_update=timezone.now() - timedelta(hours=1))
+
+        self.assertTrue(load_weather_data())
+
+        self.assertEqual(self.server.requests[1]['headers']['If-None-Match'], '"v1"')
+        weather_data = WeatherData.objects.get()
+        self.assertEqual(weather_data.description, 'clear sky')
+        self.assertLess(timezone.now() - weather_data.last_update, timedelta(minutes=1))
+
+    def test_failed_fetch_keeps_last_weather(self):
+        load_weather_data()
+        self.server.status = 500
+
+        with self.assertLogs('weather.tasks', 'WARNING'):
+            self.assertIsNone(load_weather_data())
+
+        self.assertEqual(WeatherData.objects.get().description, 'clear sky')
+
+    def test_fresh_weather_is_not_fetched_again(self):
+        load_weather_data()
+
+        self.assertIsNone(load_weather_data(max_age=600))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_refresh_started_during_refresh_is_skipped(self):
+        provider = get_weather_provider()
+        fetch = provider.fetch
+        nested = []
+
+        def fetch_with_concurrent_refresh(**kwargs):
+            nested.append(load_weather_data())
+            return fetch(**kwargs)
+
+        with patch.object(provider, 'fetch', side_effect=fetch_with_concurrent_refresh):
+            self.assertTrue(load_weather_data())
+
+        self.assertEqual(nested, [None])
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class LoadWeatherDataTransactionTests(StubServerMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.settings_override = override_settings(
+            AIRPORT_WEATHER_URL=self.server.url,
+            AIRPORT_WEATHER_RETRIES=0,
+            AIRPORT_WEATHER_TIMEOUT=(1, 0.5)
+        )
+        self.settings_override.enable()
+        reset_weather_provider()
+        reset_weather_cache()
+
+    def tearDown(self):
+        reset_weather_provider()
+        self.settings_override.disable()
+        super().tearDown()
+
+    def test_weather_is_fetched_outside_of_transaction(self):
+        provider = get_weather_provider()
+        fetch = provider.fetch
+        in_transaction = []
+
+        def fetch_in_transaction(**kwargs):
+            in_transaction.append(connection.in_atomic_block)
+            return fetch(**kwargs)
+
+        with patch.object(provider, 'fetch', side_effect=fetch_in_transaction):
+            self.assertTrue(load_weather_data())
+
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(WeatherData.objects.get().description, 'clear sky')
+
+    @skipUnless(connection.vendor == 'postgresql', 'Advisory locks require PostgreSQL')
+    def test_refresh_is_skipped_while_other_process_refreshes(self):
+        locked = threading.Event()
+        done = threading.Event()
+
+        def other_refresh():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_lock(%s)', [WEATHER_REFRESH_LOCK])
+                    locked.set()
+                    done.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_refresh)
+        thread.start()
+        locked.wait(5)
+
+        try:
+            self.assertIsNone(load_weather_data())
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(load_weather_data())
+
+
+@override_settings(AIRPORT_WEATHER_MAX_AGE=600, AIRPORT_WEATHER_REFRESH_INTERVAL=60)
+class RequestRefreshTests(TestCase):
+
+    def setUp(self):
+        reset_refresh_requests()
+        reset_weather_cache()
+
+    @patch('weather.tasks.load_weather_data.delay')
+    def test_refresh_is_requested_once_per_interval(self, delay):
+        self.assertTrue(request_refresh())
+        self.assertFalse(request_refresh())
+
+        delay.assert_called_once_with(max_age=600)
+
+    @patch('weather.tasks.load_weather_data.delay')
+    def test_stale_weather_is_served_while_refreshing(self, delay):
+        create_aircraft('CS1')
+        WeatherData.objects.create(
+            description='Clear sky', temperature=11, visibility=1000, wind_speed=2, wind_deg=120,
+            last_update=timezone.now() - timedelta(hours=1)
+        )
+
+        for _ in range(3):
+            res = self.client.get('/api/CS1/weather/')
+            self.assertEqual(res.data['description'], 'Clear sky')
+
+        delay.assert_called_once_with(max_age=600)
+
+
+def recorded_response(description):
+    return {
+        'weather': [{'description': description}],
+        'main': {'temp': 10},
+        'visibility': 10000,
+        'wind': {'speed': 2, 'deg': 90}
+    }
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100
+
+    def __call__(self):
+        return self.now
+
+
+class WeatherProviderTests(TestCase):
+
+    def test_provider_must_implement_fetch(self):
+        class IncompleteProvider(WeatherProvider):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteProvider()
+
+
+class ReplayProviderTests(TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(handle, 'w') as recording:
+            for description in ['clear sky', 'few clouds', 'light rain']:
+                recording.write(json.dumps(recorded_response(description)) + '\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+        reset_weather_provider()
+        reset_weather_cache()
+
+    def test_responses_are_replayed_on_schedule(self):
+        clock = Clock()
+        provider = ReplayProvider(path=self.path, interval=300, clock=clock)
+
+        descriptions = []
+        for now in [100, 399, 400, 700, 1000]:
+            clock.now = now
+            descriptions.append(provider.fetch().description)
+
+        self.assertEqual(descriptions, ['clear sky', 'clear sky', 'few clouds', 'light rain', 'clear sky'])
+
+    def test_every_fetch_advances_without_interval(self):
+        provider = ReplayProvider(path=self.path, interval=0)
+
+        self.assertEqual(
+            [provider.fetch().description for _ in range(4)],
+            ['clear sky', 'few clouds', 'light rain', 'clear sky']
+        )
+
+    def test_current_response_is_not_modified(self):
+        provider = ReplayProvider(path=self.path, interval=300, clock=Clock())
+
+        etag = provider.fetch().etag
+
+        self.assertIsNone(provider.fetch(etag=etag))
+
+    def test_missing_recording_is_unavailable(self):
+        with self.assertRaises(WeatherUnavailable):
+            ReplayProvider(path=self.path + '.missing').fetch()
+
+    def test_replay_provider_is_selected_by_settings(self):
+        with override_settings(AIRPORT_WEATHER_PROVIDER='replay', AIRPORT_WEATHER_REPLAY_FILE=self.path):
+            reset_weather_provider()
+            self.assertTrue(load_weather_data())
+
+        self.assertEqual(WeatherData.objects.get().description, 'clear sky')
+
+    def test_benchmark_command(self):
+        out = StringIO()
+
+        call_command('benchmark_weather', '--recording', self.path, '--repeat', '2', stdout=out)
+
+        self.assertIn('cache hit', out.getvalue())
+        self.assertEqual(WeatherData.objects.count(), 1)
@@ -1,13 +1,13 @@
-from django.forms.models import model_to_dict
+from django.utils.dateparse import parse_datetime
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from airport.models import Aircraft
-
+from weather.cache import get_weather_payload, is_known_aircraft
 from weather.models import WeatherData
 from weather.serializers import WeatherDataSerializer
+from weather.tasks import is_stale, request_refresh
 
 
 class WeatherViewSet(viewsets.GenericViewSet):
@@ -19,19 +19,16 @@ class WeatherViewSet(viewsets.GenericViewSet):
             url_path='(?P<call_sign>[^/.]+)/weather',
             url_name='weather')
     def weather(self, request, call_sign=None, *args):
-        try:
-            Aircraft.objects.get(call_sign=call_sign)
-        except Aircraft.DoesNotExist:
+        if not is_known_aircraft(call_sign):
             return Response(None, status.HTTP_401_UNAUTHORIZED)
 
-        weather_data = WeatherData.objects.first()
+        payload = get_weather_payload()
 
-        if not weather_data:
+        if payload is None:
+            request_refresh()
             return Response({'error': 'invalid'})
 
-        serializer = self.get_serializer(data=model_to_dict(weather_data))
+        if is_stale(parse_datetime(payload['last_update'])):
+            request_refresh()
 
-        if serializer.is_valid():
-            return Response(serializer.data)
-        else:
-            return Response({'error': 'invalid'})
+        return Response(payload)